@@ -0,0 +1,13 @@
+"""
+Benchmarks for the community backend.
+
+Run from the backend/ directory, e.g. `python -m benchmarks.comment_tree`.
+"""
+import os
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'playto.settings')
+    django.setup()
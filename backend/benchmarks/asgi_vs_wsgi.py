@@ -0,0 +1,140 @@
+"""
+Benchmark: the read endpoints under WSGI (gunicorn) and ASGI (uvicorn).
+
+Generates a synthetic community in a scratch SQLite database (or uses
+--database-url), then for each server / endpoint pair keeps `--concurrency`
+keep-alive clients busy for `--seconds` and reports throughput and latency
+percentiles. Both servers run a single process; gunicorn gets as many threads
+as there are clients, uvicorn runs the async views on its event loop:
+
+    python -m benchmarks.asgi_vs_wsgi [--concurrency 32] [--seconds 10]
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import setup
+
+ENDPOINTS = {
+    'feed': ('/api/posts/', '/api/async/posts/'),
+    'post_detail': ('/api/posts/{post}/', '/api/async/posts/{post}/'),
+    'leaderboard': ('/api/leaderboard/', '/api/async/leaderboard/'),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, port, env, concurrency):
+    if kind == 'wsgi':
+        command = ['gunicorn', 'playto.wsgi:application', '--bind', f'127.0.0.1:{port}',
+                   '--workers', '1', '--threads', str(concurrency), '--log-level', 'warning']
+    else:
+        command = ['uvicorn', 'playto.asgi:application', '--port', str(port),
+                   '--workers', '1', '--log-level', 'warning', '--no-access-log']
+    server = subprocess.Popen(command, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit(f"{kind} server did not start")
+
+
+def load(port, path, concurrency, seconds):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        mine = []
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise http.client.HTTPException(response.status)
+                mine.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=client) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    latencies.sort()
+    if not latencies:
+        return {'requests': 0, 'errors': errors[0]}
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2)
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / seconds, 1),
+        'p50_ms': pick(0.50),
+        'p99_ms': pick(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--database-url', help="Benchmark an existing database instead of a generated one.")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'playto.settings')
+    env['DATABASE_URL'] = args.database_url or f"sqlite:///{tempfile.mktemp(suffix='.sqlite3')}"
+    env['QUERY_BUDGET_MODE'] = 'log'
+    os.environ.update(env)
+    setup()
+
+    from django.core.management import call_command
+    from community import synthetic
+    from community.models import Post
+
+    if not args.database_url:
+        call_command('migrate', verbosity=0)
+        synthetic.generate(**{'users': 500, 'posts': 5_000, 'comments': 25_000, 'likes': 100_000})
+    post = Post.objects.order_by('-likes_count', 'id').first()
+
+    print(f"{'endpoint':<12} {'server':<5} {'rps':>8} {'p50':>9} {'p99':>9} {'errors':>7}")
+    for kind in ('wsgi', 'asgi'):
+        port = free_port()
+        server = start_server(kind, port, env, args.concurrency)
+        try:
+            for name, (sync_path, async_path) in ENDPOINTS.items():
+                path = (sync_path if kind == 'wsgi' else async_path).format(post=post.id)
+                stats = load(port, path, args.concurrency, args.seconds)
+                print(f"{name:<12} {kind:<5} {stats.get('rps', 0):>8} {stats.get('p50_ms', '-'):>7}ms "
+                      f"{stats.get('p99_ms', '-'):>7}ms {stats['errors']:>7}", flush=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Microbenchmark: rendering a comment thread.
+
+Compares the recursive CommentSerializer path (model instances with
+`_replies`, one nested serializer per level) with threads.render_tree, which
+builds the same JSON from `.values()` rows in a single loop. Runs in memory,
+no database needed:
+
+    python -m benchmarks.comment_tree [--sizes 10000 100000] [--repeat 3]
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from . import setup
+
+
+def generate_rows(size, max_depth, seed=0):
+    """`.values(*TREE_FIELDS)`-shaped rows of a random thread, in path order."""
+    from django.utils import timezone
+    from community.threads import path_segment
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    rows = []
+    for comment_id in range(1, size + 1):
+        parent = rng.choice(rows) if rows and rng.random() < 0.9 else None
+        if parent is not None and parent['depth'] >= max_depth:
+            parent = None
+        rows.append({
+            'id': comment_id,
+            'parent_id': parent['id'] if parent else None,
+            'path': (parent['path'] if parent else '') + path_segment(comment_id),
+            'depth': parent['depth'] + 1 if parent else 0,
+            'content': f"Comment {comment_id}",
+            'created_at': now - timedelta(seconds=size - comment_id),
+            'likes_count': rng.randint(0, 50),
+            'reply_count': 0,
+            'author_id': rng.randint(1, 500),
+            'author__username': f"user{comment_id % 500}",
+        })
+    for row in rows:
+        if row['parent_id']:
+            rows[row['parent_id'] - 1]['reply_count'] += 1
+    rows.sort(key=lambda row: row['path'])
+    return rows
+
+
+def serializer_render(rows):
+    from community.models import Comment, User
+    from community.serializers import CommentSerializer
+
+    comments = {}
+    roots = []
+    for row in rows:
+        comment = Comment(
+            id=row['id'], parent_id=row['parent_id'], path=row['path'], depth=row['depth'],
+            content=row['content'], created_at=row['created_at'],
+            likes_count=row['likes_count'], reply_count=row['reply_count'],
+            author=User(id=row['author_id'], username=row['author__username']),
+        )
+        comment._replies = []
+        comments[comment.id] = comment
+        if comment.parent_id:
+            comments[comment.parent_id]._replies.append(comment)
+        else:
+            roots.append(comment)
+    return CommentSerializer(roots, many=True).data
+
+
+def tree_render(rows):
+    from community.threads import render_tree
+
+    return render_tree(rows, root_depth=0, replies_link=lambda *args: None)
+
+
+def best_of(func, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(rows)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--max-depth', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    setup()
+
+    from rest_framework.renderers import JSONRenderer
+
+    print(f"{'nodes':>8} {'serializer':>12} {'render_tree':>12} {'speedup':>8}")
+    for size in args.sizes:
+        rows = generate_rows(size, args.max_depth)
+        old_time, old = best_of(serializer_render, rows, args.repeat)
+        new_time, new = best_of(tree_render, rows, args.repeat)
+        if JSONRenderer().render(old) != JSONRenderer().render(new):
+            raise SystemExit(f"Output mismatch for {size} nodes")
+        print(f"{size:>8} {old_time:>11.3f}s {new_time:>11.3f}s {old_time / new_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
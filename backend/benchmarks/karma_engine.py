@@ -0,0 +1,84 @@
+"""
+Benchmark: karma over past windows, SQL ledger vs the in-memory engine.
+
+Generates a synthetic community in a throwaway test database, then times
+loading community/karma_engine.py and answering window, leaderboard and
+history queries with it, next to the ledger's `window_scores` for the windows
+both can answer. Every engine answer the ledger can check is checked:
+
+    python -m benchmarks.karma_engine [--likes 200000] [--repeat 5]
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from . import setup
+
+
+def timed(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+def run(args):
+    from django.utils import timezone
+    from community import karma, karma_engine
+    from community.models import User
+
+    start = time.perf_counter()
+    engine = karma_engine.KarmaEngine.load()
+    print(f"load {len(engine.times)} likes: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    now = timezone.now()
+    print(f"{'window':>8} {'ledger':>10} {'engine':>10}")
+    for hours in (1, 24, 24 * 7, 24 * 30):
+        since = now - timedelta(hours=hours, minutes=17)
+        expected, ledger_ms = timed(lambda: +karma.window_scores(since), args.repeat)
+        scores, engine_ms = timed(lambda: engine.scores(since), args.repeat)
+        if scores != expected:
+            raise AssertionError(f"engine and ledger disagree over the last {hours}h")
+        print(f"{hours:>7}h {ledger_ms:>8.2f}ms {engine_ms:>8.2f}ms")
+
+    as_of = now - timedelta(days=7)
+    _, top_ms = timed(lambda: engine.top(as_of - timedelta(days=1), as_of, 100), args.repeat)
+    print(f"top 100 as of a week ago: {top_ms:.2f} ms")
+
+    edges = karma_engine.week_starts(52, now) + [now]
+    (user_ids, matrix), series_ms = timed(lambda: engine.series(edges), args.repeat)
+    print(f"52 weeks x {len(user_ids)} users: {series_ms:.2f} ms")
+    user_id = User.objects.order_by('id').values_list('id', flat=True).first()
+    history, history_ms = timed(lambda: engine.history(user_id, edges), args.repeat)
+    if user_id in user_ids and history != matrix[list(user_ids).index(user_id)].tolist():
+        raise AssertionError("history and series disagree")
+    print(f"52 weeks of one user: {history_ms:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--posts', type=int, default=10_000)
+    parser.add_argument('--comments', type=int, default=50_000)
+    parser.add_argument('--likes', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    setup()
+
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from community import synthetic
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        synthetic.generate(users=args.users, posts=args.posts, comments=args.comments, likes=args.likes)
+        run(args)
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: "my rank" from the in-memory rank index vs ranking every user.
+
+Generates a synthetic community in a throwaway test database, then times
+building community/ranks.py's index of the 24h window, looking up ranks and
+neighbourhoods in it and moving users after likes, next to scoring and
+sorting the whole window per request as the ledger alone would. Every rank
+is checked against the full sort:
+
+    python -m benchmarks.leaderboard_rank [--users 100000] [--lookups 1000]
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from . import setup
+
+
+def run(args):
+    from django.utils import timezone
+    from community import karma, ranks
+
+    start = time.perf_counter()
+    index = ranks.RankIndex.build('24h')
+    print(f"build ({len(index)} ranked users): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    since = timezone.now() - timedelta(hours=24)
+    start = time.perf_counter()
+    ranked = karma._rank(karma.window_scores(since), len(index))
+    print(f"score and sort the window once: {(time.perf_counter() - start) * 1000:.1f} ms")
+    expected = {user_id: position + 1 for position, (_, user_id) in enumerate(ranked)}
+
+    rng = random.Random(args.seed)
+    user_ids = [user_id for _, user_id in ranked]
+    sample = [rng.choice(user_ids) for _ in range(args.lookups)]
+    start = time.perf_counter()
+    for user_id in sample:
+        if index.rank(user_id) != expected[user_id]:
+            raise AssertionError(f"rank of {user_id} disagrees with the full sort")
+        index.around(user_id, 5)
+    print(f"rank + 5 neighbours: {(time.perf_counter() - start) * 1e6 / len(sample):.1f} us per lookup")
+
+    start = time.perf_counter()
+    for user_id in sample:
+        index.add(user_id, rng.choice((1, 5)))
+    print(f"move a user after a like: {(time.perf_counter() - start) * 1e6 / len(sample):.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--posts', type=int, default=100_000)
+    parser.add_argument('--comments', type=int, default=100_000)
+    parser.add_argument('--likes', type=int, default=500_000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    setup()
+
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from community import synthetic
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        # A short history, so most users have karma in the 24h window
+        synthetic.generate(users=args.users, posts=args.posts, comments=args.comments, likes=args.likes,
+                           days=1, seed=args.seed)
+        run(args)
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: a burst of likes on one post.
+
+Sends `--likes` like requests from `--workers` threads at a single post, once
+with synchronous ingestion and once with the write-behind queue (the queue is
+drained afterwards, and that time is reported separately). Runs against a
+throwaway test database created from the configured DATABASES:
+
+    python -m benchmarks.like_burst [--likes 5000] [--workers 8]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import setup
+
+
+def burst(post_id, usernames, workers):
+    from django.db import connection
+    from django.test import Client
+
+    def send(username):
+        try:
+            return Client().post('/api/likes/', {'type': 'post', 'id': post_id, 'username': username}).status_code
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        statuses = list(pool.map(send, usernames))
+    return time.perf_counter() - start, statuses
+
+
+def run(mode, args):
+    from django.test import override_settings
+    from community import like_queue
+    from community.models import Post, PostLike, User
+
+    PostLike.objects.all().delete()
+    post = Post.objects.create(author=User.objects.first(), content=f"Viral ({mode})")
+    # Every user likes twice, as double clicks and client retries do
+    usernames = [f'fan{i % args.users}' for i in range(args.likes)]
+
+    with override_settings(LIKE_INGESTION_MODE=mode, LIKE_QUEUE_MAX_PENDING=args.likes + 1):
+        elapsed, statuses = burst(post.id, usernames, args.workers)
+        flush_start = time.perf_counter()
+        like_queue.drain()
+        flushed = time.perf_counter() - flush_start
+
+    post.refresh_from_db()
+    failed = sum(code >= 400 for code in statuses)
+    print(f"{mode:>7} {elapsed:>9.2f}s {args.likes / elapsed:>9.0f}/s {flushed:>8.2f}s {post.likes_count:>7} {failed:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--likes', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=2500)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+    setup()
+
+    import tempfile
+    from django.db import connection
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from community.models import User
+
+    if connection.vendor == 'sqlite':
+        # In-memory test databases lock whole tables across threads; use a file
+        connection.settings_dict['TEST']['NAME'] = tempfile.mktemp(suffix='.sqlite3')
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        User.objects.bulk_create([User(username=f'fan{i}') for i in range(args.users)])
+        print(f"{'mode':>7} {'requests':>10} {'rate':>10} {'flush':>9} {'likes':>7} {'errors':>7}")
+        for mode in ('sync', 'queued'):
+            run(mode, args)
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark: query plans of the like lookups, generic Like table vs typed tables.
+
+Generates a synthetic community in a throwaway test database, then rebuilds
+the old generic table next to PostLike / CommentLike: same rows, with
+content_type_id / object_id and the indexes the Like model used to have.
+For each query that reads likes on the feed, thread and leaderboard paths,
+prints the plan and median time of the query as it was written against the
+generic table and as the code runs it now:
+
+    python -m benchmarks.like_plans [--likes 200000] [--repeat 20]
+
+Run it against Postgres (DATABASE_URL) for plans that match production.
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from . import setup
+
+GENERIC_TABLE = 'bench_generic_like'
+
+
+def create_generic_table(cursor, content_type_ids):
+    from community.models import LIKE_MODELS
+
+    cursor.execute(
+        f"CREATE TABLE {GENERIC_TABLE} (id integer PRIMARY KEY, user_id integer NOT NULL, "
+        "content_type_id integer NOT NULL, object_id integer NOT NULL, created_at timestamp NOT NULL)"
+    )
+    # Both tables number their rows from 1, so comment likes are shifted past post likes
+    offset = 0
+    for model, like_model in LIKE_MODELS.items():
+        cursor.execute(
+            f"INSERT INTO {GENERIC_TABLE} SELECT id + %s, user_id, %s, target_id, created_at "
+            f"FROM {like_model._meta.db_table}",
+            [offset, content_type_ids[model]],
+        )
+        offset += like_model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    # The indexes of the old Like model
+    cursor.execute(f"CREATE UNIQUE INDEX {GENERIC_TABLE}_unique ON {GENERIC_TABLE} (user_id, content_type_id, object_id)")
+    cursor.execute(f"CREATE INDEX {GENERIC_TABLE}_target ON {GENERIC_TABLE} (content_type_id, object_id)")
+    cursor.execute(f"CREATE INDEX {GENERIC_TABLE}_created ON {GENERIC_TABLE} (created_at)")
+    cursor.execute(f"ANALYZE {GENERIC_TABLE}")
+
+
+def explain(cursor, sql, params):
+    from django.db import connection
+
+    cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+    return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def timed(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def compare(name, before, after, repeat):
+    """`before` is (sql, params) on the generic table, `after` a queryset."""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        sql, params = before
+
+        def run_before():
+            cursor.execute(sql, params)
+            cursor.fetchall()
+
+        before_ms = timed(run_before, repeat)
+        after_ms = timed(lambda: list(after), repeat)
+        print(f"== {name}: generic {before_ms:.2f} ms, typed {after_ms:.2f} ms")
+        print("-- generic\n" + explain(cursor, sql, params))
+        print("-- typed\n" + after.explain() + "\n")
+
+
+def run(args):
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import connection
+    from django.db.models import Count
+    from django.utils import timezone
+    from community import counters, karma
+    from community.models import Comment, LIKE_MODELS, Post, User
+
+    content_type_ids = {model: ContentType.objects.get_for_model(model).id for model in (Post, Comment)}
+    with connection.cursor() as cursor:
+        create_generic_table(cursor, content_type_ids)
+
+    viewer = User.objects.annotate(n=Count('postlikes')).order_by('-n').first()
+    post_ids = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)[:20])
+    thread = Post.objects.order_by('-comments_count').first()
+    comment_ids = list(Comment.objects.filter(post=thread).order_by('path').values_list('id', flat=True)[:200])
+
+    def in_list(ids):
+        return ', '.join(['%s'] * len(ids))
+
+    compare('feed liked_by_me', (
+        f"SELECT object_id FROM {GENERIC_TABLE} WHERE user_id = %s AND content_type_id = %s "
+        f"AND object_id IN ({in_list(post_ids)})",
+        [viewer.id, content_type_ids[Post], *post_ids],
+    ), LIKE_MODELS[Post].objects.filter(user_id=viewer.id, target_id__in=post_ids).values_list('target_id'),
+        args.repeat)
+
+    compare('thread liked_by_me', (
+        f"SELECT object_id FROM {GENERIC_TABLE} WHERE user_id = %s AND content_type_id = %s "
+        f"AND object_id IN ({in_list(comment_ids)})",
+        [viewer.id, content_type_ids[Comment], *comment_ids],
+    ), LIKE_MODELS[Comment].objects.filter(user_id=viewer.id, target_id__in=comment_ids).values_list('target_id'),
+        args.repeat)
+
+    # The partial first hour of the 24h leaderboard window
+    since = timezone.now() - timedelta(hours=24, minutes=30)
+    edge_end = karma.bucket_start(since) + karma.BUCKET_SIZE
+    (edge, _), _ = karma._window_queries(since)[1]
+    compare('leaderboard window edge (post likes)', (
+        f"SELECT p.author_id, COUNT(*) FROM {GENERIC_TABLE} l "
+        f"JOIN {Post._meta.db_table} p ON p.id = l.object_id "
+        "WHERE l.content_type_id = %s AND l.created_at >= %s AND l.created_at < %s GROUP BY p.author_id",
+        [content_type_ids[Post], since.replace(tzinfo=None), edge_end.replace(tzinfo=None)],
+    ), edge, args.repeat)
+
+    compare('like counter reconciliation (comments)', (
+        f"SELECT c.id FROM {Comment._meta.db_table} c WHERE c.likes_count <> COALESCE(("
+        f"SELECT COUNT(*) FROM {GENERIC_TABLE} l WHERE l.content_type_id = %s AND l.object_id = c.id), 0)",
+        [content_type_ids[Comment]],
+    ), counters.drifted(Comment), max(1, args.repeat // 10))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--posts', type=int, default=10_000)
+    parser.add_argument('--comments', type=int, default=50_000)
+    parser.add_argument('--likes', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    setup()
+
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from community import synthetic
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        synthetic.generate(users=args.users, posts=args.posts, comments=args.comments, likes=args.likes)
+        run(args)
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
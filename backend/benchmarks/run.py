@@ -0,0 +1,192 @@
+"""
+Endpoint benchmark suite.
+
+For every database and data size, creates a throwaway database, fills it with
+`generate_community` and times the feed, post detail, like, leaderboard and
+search endpoints through the full middleware / view / render stack (Django
+test client, no network). Each (database, size) pair runs in its own process so
+settings are loaded fresh:
+
+    python -m benchmarks.run --sizes small medium --databases sqlite postgres \\
+        --postgres-url postgres://localhost/playto --output results.json
+
+Results are written as JSON (timings in ms, query counts, response sizes)
+together with the git commit, so runs of two commits can be diffed.
+
+`--dataset DIR` loads a dump written by `manage.py export_community` instead
+of generating data, which is much faster for the large sizes.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import setup
+
+SIZES = {
+    'small': {'users': 200, 'posts': 1_000, 'comments': 5_000, 'likes': 20_000},
+    'medium': {'users': 1_000, 'posts': 10_000, 'comments': 50_000, 'likes': 200_000},
+    'large': {'users': 5_000, 'posts': 100_000, 'comments': 500_000, 'likes': 2_000_000},
+}
+
+
+def measure(call, repeat, before=None):
+    """Median / p95 / max time of `call`, with the queries and bytes of its last run."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = call()
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.status_code}: {response.content[:200]}")
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': len(queries),
+        'bytes': len(response.content),
+    }
+
+
+def run_endpoints(repeat, seed):
+    import random
+    from django.core.cache import cache
+    from django.test import Client
+    from community.models import Post, User
+
+    client = Client()
+    rng = random.Random(seed)
+    hot_post = Post.objects.order_by('-likes_count', 'id').first()
+    users = list(User.objects.values_list('username', flat=True))
+    posts = list(Post.objects.values_list('id', flat=True))
+
+    def feed_page(pages):
+        def call():
+            url = '/api/posts/'
+            for _ in range(pages):
+                response = client.get(url)
+                url = response.json()['next'] or '/api/posts/'
+            return response
+        return call
+
+    def like():
+        # Random (user, post) pairs: mostly new likes, the odd "already liked"
+        data = {'type': 'post', 'id': rng.choice(posts), 'username': rng.choice(users)}
+        return client.post('/api/likes/', data)
+
+    return {
+        'feed_first_page': measure(feed_page(1), repeat),
+        'feed_page_5': measure(feed_page(5), repeat),
+        'post_detail_cold': measure(lambda: client.get(f'/api/posts/{hot_post.id}/'), repeat, before=cache.clear),
+        'post_detail_cached': measure(lambda: client.get(f'/api/posts/{hot_post.id}/'), repeat),
+        'like': measure(like, repeat),
+        'leaderboard_cold': measure(lambda: client.get('/api/leaderboard/'), repeat, before=cache.clear),
+        'leaderboard_cached': measure(lambda: client.get('/api/leaderboard/'), repeat),
+        # Synthetic content names its author: a word in a few rows, then one in every post
+        'search_rare': measure(lambda: client.get('/api/search/', {'q': users[-1]}), repeat),
+        'search_common': measure(lambda: client.get('/api/search/', {'q': 'post', 'type': 'post'}), repeat),
+    }
+
+
+def worker(args):
+    """Benchmark one (database, size) pair; prints a JSON result on stdout."""
+    setup()
+    from django.db import connection
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from community import columnar, synthetic
+
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = tempfile.mktemp(suffix='.sqlite3')
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        start = time.perf_counter()
+        if args.dataset:
+            counts = columnar.load(args.dataset)
+        else:
+            counts = synthetic.generate(**SIZES[args.size], seed=args.seed)
+        generated = time.perf_counter() - start
+        endpoints = run_endpoints(args.repeat, args.seed)
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+    print(json.dumps({
+        'database': connection.vendor,
+        'size': args.size,
+        'rows': counts,
+        'generate_seconds': round(generated, 2),
+        'endpoints': endpoints,
+    }))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=['small', 'medium'])
+    parser.add_argument('--databases', nargs='+', choices=['sqlite', 'postgres'], default=['sqlite'])
+    parser.add_argument('--postgres-url', default=os.getenv('BENCHMARK_POSTGRES_URL', 'postgres://localhost/playto'))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dataset', help="Load this export_community dump instead of generating --sizes.")
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    sizes = [os.path.basename(os.path.normpath(args.dataset))] if args.dataset else args.sizes
+    results = []
+    for database in args.databases:
+        env = dict(os.environ)
+        if database == 'postgres':
+            env['DATABASE_URL'] = args.postgres_url
+        else:
+            env.pop('DATABASE_URL', None)
+        for size in sizes:
+            print(f"{database} / {size} ...", file=sys.stderr)
+            command = [sys.executable, '-m', 'benchmarks.run', '--worker', '--size', size,
+                       '--repeat', str(args.repeat), '--seed', str(args.seed)]
+            if args.dataset:
+                command += ['--dataset', os.path.abspath(args.dataset)]
+            output = subprocess.run(command, env=env, capture_output=True, text=True)
+            if output.returncode:
+                print(output.stderr, file=sys.stderr)
+                continue
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            results.append(result)
+            for name, stats in result['endpoints'].items():
+                print(f"  {name:<20} {stats['median_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  {stats['queries']:>3} queries", file=sys.stderr)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'results': results,
+        }, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
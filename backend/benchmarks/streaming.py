@@ -0,0 +1,94 @@
+"""
+Benchmark: JSON renderers, and peak memory of streamed vs materialized lists.
+
+Generates a synthetic community in a throwaway test database, then
+
+- times DRF's JSONRenderer against community/renderers.py's FastJSONRenderer
+  on a full feed page and the largest post detail;
+- measures (tracemalloc) the peak memory of serving the first N posts of the
+  feed as one materialized list and as a `?stream=true` response, for
+  growing N. The streamed peak should stay flat:
+
+    python -m benchmarks.streaming [--posts 50000] [--repeat 20]
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from . import setup
+
+
+def timed(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def peak_kib(call):
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run(args):
+    from django.test import Client
+    from rest_framework.renderers import JSONRenderer
+    from community import renderers, streaming
+    from community.models import Post
+    from community.serializers import PostSerializer
+
+    client = Client()
+    page = client.get('/api/posts/', {'page_size': 100}).json()
+    hot_post = Post.objects.order_by('-comments_count').first()
+    detail = client.get(f'/api/posts/{hot_post.id}/', {'depth': 10}).json()
+    for name, data in (('feed page (100 posts)', page), ('post detail', detail)):
+        stdlib = timed(lambda: JSONRenderer().render(data), args.repeat)
+        fast = timed(lambda: renderers.FastJSONRenderer().render(data), args.repeat)
+        print(f"{name}: JSONRenderer {stdlib:.2f} ms, FastJSONRenderer {fast:.2f} ms")
+
+    feed = Post.objects.select_related('author').order_by('-created_at', '-id')
+    print(f"{'posts':>8} {'materialized':>14} {'streamed':>10}")
+    for size in args.sizes:
+        def materialized():
+            renderers.json_renderer().render({'results': PostSerializer(list(feed[:size]), many=True).data})
+
+        def streamed():
+            body = streaming.stream_results(feed[:size], lambda rows: PostSerializer(rows, many=True).data, 500)
+            for _ in body:
+                pass
+
+        print(f"{size:>8} {peak_kib(materialized):>11.0f}KiB {peak_kib(streamed):>7.0f}KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--posts', type=int, default=50_000)
+    parser.add_argument('--comments', type=int, default=50_000)
+    parser.add_argument('--likes', type=int, default=100_000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 50_000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    setup()
+
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from community import synthetic
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        synthetic.generate(users=args.users, posts=args.posts, comments=args.comments, likes=args.likes)
+        run(args)
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
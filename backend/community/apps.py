@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CommunityConfig(AppConfig):
     name = 'community'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        # Installs the per-request query recorder on every new DB connection
+        from . import instrumentation  # noqa: F401
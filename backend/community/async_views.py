@@ -0,0 +1,151 @@
+"""
+Async-native read endpoints, for ASGI deployments.
+
+Same responses as the feed, post detail and leaderboard endpoints of the DRF
+views, but as plain async Django views using the async ORM and cache APIs, so
+under ASGI they run on the event loop instead of occupying a worker thread
+each. DRF views are sync-only, hence the JSON-only rendering here; the
+queries, pagination and caching are shared with the sync views. The live
+event stream of a post (community/events.py) is served from here too.
+"""
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotFound
+from rest_framework.request import Request
+
+from . import events, leaderboard, liked, post_cache, replicas, users
+from .models import Post
+from .pagination import KeysetPagination, ThreadPagination
+from .renderers import json_renderer
+from .serializers import PostSerializer, PostDetailSerializer, LeaderboardSerializer
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(json_renderer().render(data), content_type='application/json', status=status, headers=headers)
+
+
+def async_api_view(view):
+    """GET-only async view taking a DRF Request, with DRF-style error responses."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise MethodNotAllowed(request.method)
+            with replicas.replica_reads(replicas.wants_replica(request)):
+                return await view(Request(request), *args, **kwargs)
+        except Http404:
+            return json_response({'detail': NotFound.default_detail}, status=404)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return json_response(data, status=exc.status_code)
+    return wrapper
+
+
+@async_api_view
+async def post_list(request):
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(Post.objects.select_related('author'), request)
+    page = await liked.amark(await users.aviewer(request), page)
+    return json_response({
+        'next': paginator.get_next_link(),
+        'results': PostSerializer(page, many=True).data,
+    })
+
+
+@async_api_view
+async def post_detail(request, pk):
+    # Same cache entries and ETags as PostViewSet.retrieve
+    viewer = await users.aviewer(request)
+    if not post_cache.is_enabled():
+        return HttpResponse(await render_post_detail(request, pk, viewer), content_type='application/json')
+
+    version = await post_cache.aget_version(pk)
+    headers = post_cache.response_headers(request, pk, version, viewer)
+    not_modified = get_conditional_response(request, etag=headers['ETag'])
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content = await post_cache.aget_response(request, pk, version, viewer)
+    if content is None:
+        # Like PostViewSet.retrieve, cached responses are built from the primary
+        with replicas.primary():
+            content = await render_post_detail(request, pk, viewer)
+        await post_cache.aset_response(request, pk, version, content, viewer)
+    return HttpResponse(content, content_type='application/json', headers=headers)
+
+
+async def render_post_detail(request, pk, viewer):
+    try:
+        post = await Post.objects.select_related('author').aget(pk=pk)
+    except Post.DoesNotExist:
+        raise Http404
+    await liked.amark(viewer, [post])
+    paginator = ThreadPagination()
+    post._precomputed_comments = await paginator.apaginate_thread(request, post_id=post.id)
+    post._comments_next = paginator.get_next_link(
+        request.build_absolute_uri(reverse('post-comments', kwargs={'pk': post.id}))
+    )
+    return json_renderer().render(PostDetailSerializer(post).data)
+
+
+@async_api_view
+async def leaderboard_view(request):
+    window = leaderboard.parse_window(request.query_params)
+    limit = leaderboard.parse_limit(request.query_params)
+    serialize = lambda users: LeaderboardSerializer(users, many=True).data
+    as_of = leaderboard.parse_as_of(request.query_params)
+    if as_of is None:
+        snapshot = await leaderboard.aget_snapshot(window, limit, serialize)
+    else:
+        snapshot = await leaderboard.aget_historical_snapshot(window, limit, as_of, serialize)
+    headers = leaderboard.response_headers(snapshot)
+    not_modified = get_conditional_response(request, etag=snapshot['etag'])
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+    return json_response(leaderboard.response_data(snapshot), headers=headers)
+
+
+@async_api_view
+async def post_events(request, pk):
+    """
+    Server-Sent Events stream of a post's like count changes and new comments.
+
+    Needs an ASGI server: the stream holds the connection open indefinitely.
+    Under WSGI, Django would consume the endless stream before sending a
+    byte and block the worker for good, so other servers get a 501.
+    """
+    if not isinstance(request._request, ASGIRequest):
+        return json_response({'detail': "Live events need an ASGI server."}, status=501)
+    if not await Post.objects.filter(pk=pk).aexists():
+        raise Http404
+    return StreamingHttpResponse(
+        _event_stream(events.post_channel(pk)),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def _event_stream(channel):
+    subscription = events.get_broker().subscribe(channel)
+    try:
+        # Subscribed from here on; tells EventSource how soon to reconnect
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'
+        while True:
+            message = await subscription.get(timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+            if message is None:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+            else:
+                yield f'event: {message["type"]}\ndata: {json.dumps(message, separators=(",", ":"))}\n\n'
+    finally:
+        subscription.close()
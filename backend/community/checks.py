@@ -0,0 +1,22 @@
+"""System checks of the community app's settings."""
+from django.conf import settings
+from django.core import checks
+
+# Cache backends that keep their entries in the process that wrote them
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register()
+def check_post_detail_cache(app_configs, **kwargs):
+    # A version bumped in one process must reach every other one, or they keep
+    # serving the stale thread and ETag
+    if settings.POST_DETAIL_CACHE and settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            "POST_DETAIL_CACHE needs a cache shared by every process.",
+            hint="Set CACHE_URL to a redis:// or memcached:// server, or POST_DETAIL_CACHE=False.",
+            id='community.E001',
+        )]
+    return []
@@ -0,0 +1,261 @@
+"""
+Columnar export / import of the community tables.
+
+`export` streams users, posts, comments and likes out of the database with
+`values_list().iterator()` and writes them as shards of at most `chunk_size`
+rows, one NumPy `.npz` archive of column arrays per shard, plus a
+`manifest.json` describing tables, columns and shards. Only one shard is in
+memory at a time, so exports of any size run in constant memory.
+
+Columns are stored as:
+
+- integers and floats: int64 / float64 arrays, nullable columns with a
+  boolean `<column>.null` mask;
+- datetimes: datetime64[us] in UTC;
+- text: UTF-8 bytes concatenated into `<column>.data`, with the start of
+  each value (and the end of the last) in `<column>.offsets`.
+
+`load` reads a dump into empty tables with plain multi-row INSERTs, in one
+transaction, and rebuilds what was left out: the karma ledger (aggregated
+from the like and author columns while they are loaded, without querying
+them back) and the primary key sequences. It does not send model signals.
+"""
+import itertools
+import json
+import os
+from collections import Counter
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from . import karma, users
+from .models import User, Post, Comment, PostLike, CommentLike, KarmaBucket
+
+FORMAT_VERSION = 2
+MANIFEST = 'manifest.json'
+INSERT_BATCH_SIZE = 10_000
+
+# In dependency order
+TABLES = {
+    'users': (User, ['id', 'username', 'date_joined']),
+    'posts': (Post, ['id', 'author', 'content', 'created_at', 'likes_count', 'comments_count', 'hot_score']),
+    'comments': (Comment, ['id', 'author', 'post', 'parent', 'content', 'created_at',
+                           'likes_count', 'reply_count', 'path', 'depth']),
+    'post_likes': (PostLike, ['id', 'user', 'target', 'created_at']),
+    'comment_likes': (CommentLike, ['id', 'user', 'target', 'created_at']),
+}
+# Like tables, with the table of what they like
+LIKE_TABLES = {'post_likes': 'posts', 'comment_likes': 'comments'}
+
+
+def _fields(table):
+    model, names = TABLES[table]
+    return model, [model._meta.get_field(name) for name in names]
+
+
+def _kind(field):
+    if isinstance(field, models.DateTimeField):
+        return 'datetime'
+    if isinstance(field, (models.CharField, models.TextField)):
+        return 'text'
+    if isinstance(field, models.FloatField):
+        return 'float'
+    return 'int'
+
+
+def _encode(field, kind, values):
+    """Column arrays of one shard, by array name."""
+    name = field.attname
+    if kind == 'text':
+        encoded = [value.encode() for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return {f'{name}.offsets': offsets, f'{name}.data': np.frombuffer(b''.join(encoded), dtype=np.uint8)}
+    if kind == 'datetime':
+        naive = [timezone.make_naive(value, dt_timezone.utc) for value in values]
+        return {name: np.array(naive, dtype='datetime64[us]')}
+
+    arrays = {}
+    if field.null:
+        mask = np.array([value is None for value in values], dtype=bool)
+        arrays[f'{name}.null'] = mask
+        values = [0 if value is None else value for value in values]
+    arrays[name] = np.array(values, dtype=np.float64 if kind == 'float' else np.int64)
+    return arrays
+
+
+def _decode(field, kind, shard):
+    """Column values of one shard, ready to be sent to the database."""
+    name = field.attname
+    if kind == 'text':
+        offsets = shard[f'{name}.offsets'].tolist()
+        data = shard[f'{name}.data'].tobytes()
+        return [data[start:end].decode() for start, end in zip(offsets, offsets[1:])]
+    if kind == 'datetime':
+        return _datetimes(shard[name])
+
+    values = shard[name].tolist()
+    if f'{name}.null' in shard:
+        values = [None if null else value for value, null in zip(values, shard[f'{name}.null'].tolist())]
+    return values
+
+
+def _datetimes(array):
+    # Naive UTC, which is also the connection's time zone under USE_TZ
+    adapt = connection.ops.adapt_datetimefield_value
+    return [adapt(value) for value in array.astype('datetime64[us]').tolist()]
+
+
+class AuthorIndex:
+    """Author of every object of one content type, from (id, author_id) column chunks."""
+
+    def __init__(self, chunks):
+        # A trailing sentinel id keeps every searchsorted position in range
+        ids = np.concatenate([ids for ids, _ in chunks] + [[np.iinfo(np.int64).max]])
+        author_ids = np.concatenate([author_ids for _, author_ids in chunks] + [[-1]])
+        order = np.argsort(ids, kind='stable')
+        self.ids, self.author_ids = ids[order], author_ids[order]
+
+    def lookup(self, object_ids):
+        """Author ids of `object_ids`, -1 for objects that don't exist."""
+        index = np.searchsorted(self.ids, object_ids)
+        return np.where(self.ids[index] == object_ids, self.author_ids[index], -1)
+
+
+def _karma_buckets(likes, authors, points):
+    """{(user_id, hour): points} of one shard of likes, whose targets' authors are in `authors`."""
+    # Each access to an .npz member reads it again
+    recipients, created_at = authors.lookup(likes['target_id']), likes['created_at']
+    # Likes of objects missing from the dump earn nobody anything
+    valid = recipients >= 0
+    hours = created_at[valid].astype('datetime64[h]').astype(np.int64)
+    keys, inverse = np.unique(np.stack([recipients[valid], hours], axis=1), axis=0, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), minlength=len(keys)) * points
+    return dict(zip(map(tuple, keys.tolist()), totals.tolist()))
+
+
+def export(directory, tables=None, chunk_size=100_000, compress=False, log=None):
+    """
+    Write `tables` (default: all) to `directory`, which is created if needed.
+
+    Returns the number of rows written per table.
+    """
+    log = log or (lambda message: None)
+    os.makedirs(directory, exist_ok=True)
+    save = np.savez_compressed if compress else np.savez
+    manifest = {'format': FORMAT_VERSION, 'tables': {}}
+
+    for table in tables or TABLES:
+        model, fields = _fields(table)
+        rows = model.objects.order_by('pk').values_list(*[field.attname for field in fields]).iterator(chunk_size=chunk_size)
+        shards = []
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            arrays = {}
+            for field, values in zip(fields, zip(*chunk)):
+                arrays.update(_encode(field, _kind(field), values))
+            filename = f'{table}-{len(shards):05d}.npz'
+            save(os.path.join(directory, filename), **arrays)
+            shards.append({'file': filename, 'rows': len(chunk)})
+
+        manifest['tables'][table] = {
+            'columns': {field.attname: _kind(field) for field in fields},
+            'rows': sum(shard['rows'] for shard in shards),
+            'shards': shards,
+        }
+        log(f"{manifest['tables'][table]['rows']} {table}")
+
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return {table: info['rows'] for table, info in manifest['tables'].items()}
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported dump format {manifest.get('format')!r}")
+    return manifest
+
+
+def _insert_statement(model, columns):
+    quote = connection.ops.quote_name
+    return (
+        f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(quote(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+
+
+def _insert(cursor, sql, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + INSERT_BATCH_SIZE])
+
+
+def load(directory, log=None):
+    """
+    Load a dump written by `export` into empty tables.
+
+    Columns left out of the dump get their field defaults (imported users
+    cannot log in). Returns the number of rows loaded per table.
+    """
+    log = log or (lambda message: None)
+    manifest = read_manifest(directory)
+    tables = [table for table in TABLES if table in manifest['tables']]
+    for table in tables:
+        model = TABLES[table][0]
+        if model.objects.exists():
+            raise ValueError(f"{model._meta.db_table} is not empty")
+
+    # The karma ledger is aggregated while loading when the dump has the
+    # authors of everything liked
+    like_tables = [table for table in tables if table in LIKE_TABLES]
+    aggregate_karma = bool(like_tables) and all(LIKE_TABLES[table] in tables for table in like_tables)
+    author_chunks = {table: [] for table in LIKE_TABLES.values()}
+    buckets = Counter()
+    loaded = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table in tables:
+            model, fields = _fields(table)
+            # Everything not in the dump is inserted with its default
+            defaults = [
+                field for field in model._meta.concrete_fields
+                if field not in fields and not field.primary_key
+            ]
+            constants = [field.get_db_prep_save(field.get_default(), connection) for field in defaults]
+            sql = _insert_statement(model, [field.column for field in fields + defaults])
+            if aggregate_karma and table in LIKE_TABLES:
+                authors = AuthorIndex(author_chunks[LIKE_TABLES[table]])
+                points = dict(karma.like_points())[model.target_model()]
+
+            for shard in manifest['tables'][table]['shards']:
+                with np.load(os.path.join(directory, shard['file'])) as arrays:
+                    columns = [_decode(field, _kind(field), arrays) for field in fields]
+                    if aggregate_karma and table in author_chunks:
+                        author_chunks[table].append((arrays['id'], arrays['author_id']))
+                    elif aggregate_karma and table in LIKE_TABLES:
+                        buckets.update(_karma_buckets(arrays, authors, points))
+                _insert(cursor, sql, [(*row, *constants) for row in zip(*columns)])
+            loaded[table] = manifest['tables'][table]['rows']
+            log(f"{loaded[table]} {table}")
+
+        # Explicit ids leave sequences behind on databases that have them
+        for statement in connection.ops.sequence_reset_sql(no_style(), [TABLES[table][0] for table in tables]):
+            cursor.execute(statement)
+
+        if aggregate_karma:
+            KarmaBucket.objects.all().delete()
+            keys = [key for key, points in buckets.items() if points]
+            hours = _datetimes(np.array([hour for _, hour in keys], dtype='datetime64[h]'))
+            _insert(cursor, _insert_statement(KarmaBucket, ['user_id', 'bucket', 'points']), [
+                (user_id, hour, buckets[user_id, raw_hour]) for (user_id, raw_hour), hour in zip(keys, hours)
+            ])
+            log(f"{len(keys)} karma buckets")
+        elif like_tables:
+            log(f"{karma.rebuild()} karma buckets")
+    users.clear()
+    return loaded
@@ -0,0 +1,154 @@
+"""
+Live per-post events (new likes, new comments) pushed to subscribed clients.
+
+Writes publish compact deltas to the channel of the affected post once their
+transaction commits; /api/posts/{id}/events/ streams a channel to the client
+as Server-Sent Events. The broker is pluggable via EVENTS_BROKER: the default
+InProcessBroker only reaches subscribers connected to the same process, so
+multi-process deployments swap in a broker backed by a shared pub/sub.
+
+A broker implements `publish(channel, message)`, callable from any thread,
+and `subscribe(channel)`, which must be called from the event loop and
+returns a subscription with `async get(timeout)` and `close()`.
+"""
+import asyncio
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Subscription:
+    def __init__(self, broker, channel, max_pending):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.max_pending = max_pending
+
+    def deliver(self, message):
+        # Publishers run in request threads, the queue belongs to the event loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The loop is gone; a write must not fail because of a dead stream
+            self.close()
+
+    def _put(self, message):
+        if self.queue.qsize() >= self.max_pending:
+            # A client this far behind has lost events anyway; drop the oldest
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """The next message, or None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, settings.EVENTS_MAX_PENDING)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'EVENTS_BROKER':
+        _broker = None
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENTS_BROKER)()
+        return _broker
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+def _publish_on_commit(messages):
+    # messages: [(post_id, message)]
+    def publish():
+        broker = get_broker()
+        for post_id, message in messages:
+            broker.publish(post_channel(post_id), message)
+    if messages:
+        transaction.on_commit(publish)
+
+
+def publish_likes(likes, sign, post_ids):
+    """
+    Publish the like count changes of `likes`, one message per target.
+
+    `post_ids` maps the (model, id) of each target to the post it belongs to.
+    """
+    deltas = Counter(like.target_key for like in likes)
+    _publish_on_commit([
+        (post_ids[key], {
+            'type': 'likes',
+            'target': key[0]._meta.model_name,
+            'id': key[1],
+            'delta': sign * delta,
+        })
+        for key, delta in deltas.items()
+        if delta and key in post_ids
+    ])
+
+
+def publish_comment(comment):
+    """Publish a newly created comment, in the shape the thread endpoints render it."""
+    _publish_on_commit([(comment.post_id, {
+        'type': 'comment',
+        'parent': comment.parent_id,
+        'comment': {
+            'id': comment.id,
+            'author': {'id': comment.author_id, 'username': comment.author.username},
+            'content': comment.content,
+            'created_at': serializers.DateTimeField().to_representation(comment.created_at),
+            'likes_count': comment.likes_count,
+            # Nobody has liked a new comment yet
+            'liked_by_me': False,
+            'reply_count': comment.reply_count,
+            'replies': [],
+            'replies_next': None,
+        },
+    })])
@@ -0,0 +1,67 @@
+"""
+"Hot" ranking of the feed (`?ordering=hot`).
+
+Every post stores
+
+    hot_score = ln(1 + engagement) + (created_at - HOT_EPOCH) / HOT_TIMESCALE_SECONDS
+    engagement = HOT_LIKE_WEIGHT * likes_count + HOT_COMMENT_WEIGHT * comments_count
+
+The time decay lives in log space: a post HOT_TIMESCALE_SECONDS older than
+another needs e times its engagement to rank alongside it. Since every score
+carries its own creation time, the ordering is the decayed one at any moment
+and scores never have to be rewritten as the clock moves. The feed pages
+through an index on (-hot_score, -id) like it does through (-created_at, -id).
+
+Likes and comments move a score incrementally, in the same UPDATE that adjusts
+the post's counters (`adjusted`). `recompute` rebuilds every score from the
+counters, after the weights change or bulk writes bypassed the signals; run it
+with `manage.py recompute_hot_scores`.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Ln
+
+from .models import Post
+
+HOT_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def score(created_at, likes_count=0, comments_count=0):
+    engagement = settings.HOT_LIKE_WEIGHT * likes_count + settings.HOT_COMMENT_WEIGHT * comments_count
+    age = (created_at - HOT_EPOCH).total_seconds() / settings.HOT_TIMESCALE_SECONDS
+    return math.log1p(engagement) + age
+
+
+def _engagement(likes, comments):
+    return (
+        Value(settings.HOT_LIKE_WEIGHT, output_field=FloatField()) * likes
+        + Value(settings.HOT_COMMENT_WEIGHT, output_field=FloatField()) * comments
+    )
+
+
+def adjusted(likes=0, comments=0):
+    """
+    Expression for hot_score after adding `likes` and `comments` to a post.
+
+    Evaluated against the row's counters before the update, so it must come
+    first among the values of the UPDATE that changes them.
+    """
+    old = _engagement(F('likes_count'), F('comments_count'))
+    new = _engagement(F('likes_count') + likes, F('comments_count') + comments)
+    return F('hot_score') + Ln(new + 1) - Ln(old + 1)
+
+
+def recompute(batch_size=1000):
+    """Recompute every hot_score from the post's counters. Returns the rows changed."""
+    changed = []
+    rows = Post.objects.only('id', 'created_at', 'likes_count', 'comments_count', 'hot_score')
+    for post in rows.iterator(chunk_size=batch_size):
+        hot_score = score(post.created_at, post.likes_count, post.comments_count)
+        if not math.isclose(post.hot_score, hot_score, rel_tol=0, abs_tol=1e-9):
+            post.hot_score = hot_score
+            changed.append(post)
+    Post.objects.bulk_update(changed, ['hot_score'], batch_size=batch_size)
+    return len(changed)
@@ -0,0 +1,246 @@
+"""
+Per-endpoint query and latency instrumentation.
+
+RequestMetricsMiddleware records, for every request that resolves to a named
+URL, the number of SQL queries, the time spent in them, the time spent
+serializing objects to dicts (serializer `.data` and thread rendering, see
+`serializing`), the time spent encoding the response (render) and its size. Each response carries the numbers in a
+`Server-Timing` header, and aggregated histograms per URL name are served to
+staff users at /api/metrics/.
+
+QUERY_BUDGETS declares the maximum number of queries per URL name. Going over
+a budget logs a warning, or raises QueryBudgetExceeded when
+QUERY_BUDGET_MODE = 'raise'. Tests can assert the same budgets with
+`query_budget(url_name)`.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """
+    `connection.execute_wrapper` that counts queries and their time. Also
+    accumulates the request's serialization time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.serialize_duration = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+# Recorder of the request being handled. A context variable rather than a
+# per-connection wrapper, so that queries the async ORM runs in its executor
+# threads (on their own connections) are counted too.
+_recorder = ContextVar('query_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_ms = 0.0
+        self.serialize_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        self.bytes = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, sample):
+        self.requests += 1
+        self.queries += sample['queries']
+        self.max_queries = max(self.max_queries, sample['queries'])
+        self.db_ms += sample['db_ms']
+        self.serialize_ms += sample['serialize_ms']
+        self.render_ms += sample['render_ms']
+        self.total_ms += sample['total_ms']
+        self.bytes += sample['bytes']
+        self.latency[bisect.bisect_left(LATENCY_BUCKETS_MS, sample['total_ms'])] += 1
+
+    def as_dict(self):
+        labels = [f'le_{bound}ms' for bound in LATENCY_BUCKETS_MS] + ['inf']
+        return {
+            'requests': self.requests,
+            'avg_queries': self.queries / self.requests,
+            'max_queries': self.max_queries,
+            'avg_db_ms': self.db_ms / self.requests,
+            'avg_serialize_ms': self.serialize_ms / self.requests,
+            'avg_render_ms': self.render_ms / self.requests,
+            'avg_total_ms': self.total_ms / self.requests,
+            'avg_bytes': self.bytes / self.requests,
+            'latency_histogram': dict(zip(labels, self.latency)),
+        }
+
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def record(url_name, sample):
+    with _lock:
+        _stats.setdefault(url_name, EndpointStats()).add(sample)
+
+
+def snapshot():
+    """Aggregated stats of this process, keyed by URL name."""
+    with _lock:
+        return {url_name: stats.as_dict() for url_name, stats in sorted(_stats.items())}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def check_budget(url_name, queries):
+    budget = settings.QUERY_BUDGETS.get(url_name)
+    if budget is None or queries <= budget:
+        return
+    message = f"{url_name} ran {queries} queries, over its budget of {budget}"
+    if settings.QUERY_BUDGET_MODE == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextmanager
+def serializing():
+    """
+    Count the block as serialization time of the current request. Nested
+    blocks (a serializer serializing others) are only counted once.
+    """
+    recorder = _recorder.get()
+    if recorder is None or recorder.serializing:
+        yield
+        return
+    recorder.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.serialize_duration += time.perf_counter() - start
+        recorder.serializing = False
+
+
+@contextmanager
+def query_budget(url_name_or_limit, using='default'):
+    """
+    Fail (AssertionError) if the block runs more queries than allowed.
+
+    Takes a URL name from QUERY_BUDGETS or an explicit number of queries.
+    """
+    limit = url_name_or_limit
+    if isinstance(url_name_or_limit, str):
+        limit = settings.QUERY_BUDGETS[url_name_or_limit]
+    with CaptureQueriesContext(connections[using]) as queries:
+        yield queries
+    if len(queries) > limit:
+        sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+        raise AssertionError(f"{len(queries)} queries executed, budget is {limit}:\n{sql}")
+
+
+class RequestMetricsMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    def finish(self, request, response, recorder, total):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not match.url_name:
+            return response
+
+        sample = {
+            'queries': recorder.count,
+            'db_ms': recorder.duration * 1000,
+            'serialize_ms': recorder.serialize_duration * 1000,
+            'render_ms': getattr(request, '_render_time', 0.0) * 1000,
+            'total_ms': total * 1000,
+            'bytes': 0 if response.streaming else len(response.content),
+        }
+        record(match.url_name, sample)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sample["db_ms"]:.1f};desc="{sample["queries"]} queries"',
+            f'serialize;dur={sample["serialize_ms"]:.1f}',
+            f'render;dur={sample["render_ms"]:.1f}',
+            f'total;dur={sample["total_ms"]:.1f}',
+        ])
+        check_budget(match.url_name, recorder.count)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook returns
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._render_time = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,201 @@
+"""
+Incrementally maintained karma ledger.
+
+Every like a user receives adds points to that user's bucket for the hour the
+like was created in, and removing the like takes them away again. The
+leaderboard then sums a sliding window of buckets, so its cost scales with the
+number of users active in the window instead of the whole like history.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+
+from .models import Post, Comment, User, KarmaBucket, LIKE_MODELS
+
+BUCKET_SIZE = timedelta(hours=1)
+
+
+def bucket_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def like_points():
+    # (model, points per like received) for every likeable model. The ledger
+    # stores points, so it has to be rebuilt after these change.
+    return ((Post, settings.KARMA_POST_LIKE_POINTS), (Comment, settings.KARMA_COMMENT_LIKE_POINTS))
+
+
+def _targets():
+    # (like model, liked model, points) for every likeable model
+    return [(LIKE_MODELS[model], model, points) for model, points in like_points()]
+
+
+def karma_events(likes):
+    """
+    Resolve likes into (recipient id, points, created_at) events.
+
+    Uses one query per like model present in `likes`, regardless of how many
+    likes are passed in.
+    """
+    by_model = {}
+    for like in likes:
+        by_model.setdefault(type(like), []).append(like)
+
+    events = []
+    for like_model, model, points in _targets():
+        group = by_model.get(like_model)
+        if group:
+            authors = dict(model.objects.filter(id__in={like.target_id for like in group}).values_list('id', 'author_id'))
+            # The target may already be gone (e.g. deleted in the same cascade)
+            events += [(authors[like.target_id], points, like.created_at) for like in group if like.target_id in authors]
+    return events
+
+
+def _add_points(user_id, bucket, points):
+    lookup = KarmaBucket.objects.filter(user_id=user_id, bucket=bucket)
+    if lookup.update(points=F('points') + points):
+        return
+    try:
+        with transaction.atomic():
+            KarmaBucket.objects.create(user_id=user_id, bucket=bucket, points=points)
+    except IntegrityError:
+        # Another writer created the bucket between our UPDATE and INSERT
+        lookup.update(points=F('points') + points)
+
+
+def record_likes(likes, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) the karma earned by `likes`.
+
+    Returns the (recipient id, signed points, created_at) events recorded.
+    """
+    events = [(user_id, sign * points, created_at) for user_id, points, created_at in karma_events(likes)]
+    deltas = Counter()
+    for user_id, points, created_at in events:
+        deltas[(user_id, bucket_start(created_at))] += points
+
+    for (user_id, bucket), points in deltas.items():
+        if points:
+            _add_points(user_id, bucket, points)
+    return events
+
+
+def _window_queries(since):
+    """
+    The ledger totals for the whole hours of the window, and for the partially
+    covered hour at its start (None if `since` is on the hour), the
+    (recipient, likes) counts of each like model with their points.
+    """
+    first_full_bucket = bucket_start(since)
+    if first_full_bucket < since:
+        first_full_bucket += BUCKET_SIZE
+
+    totals = (
+        KarmaBucket.objects.filter(bucket__gte=first_full_bucket)
+        .values('user')
+        .annotate(total=Sum('points'))
+        .values_list('user', 'total')
+    )
+    edge_counts = None
+    if first_full_bucket > since:
+        edge_counts = [
+            (
+                like_model.objects.filter(created_at__gte=since, created_at__lt=first_full_bucket)
+                .values('target__author')
+                .annotate(n=Count('id'))
+                .values_list('target__author', 'n'),
+                points,
+            )
+            for like_model, _, points in _targets()
+        ]
+    return totals, edge_counts
+
+
+def window_scores(since):
+    """
+    Return {user_id: karma} for likes created at or after `since`.
+
+    Whole hours come straight from the ledger. The partially covered hour at
+    the start of the window is counted from the like tables, which only
+    touches the likes created during that hour.
+    """
+    totals, edge_counts = _window_queries(since)
+    scores = Counter(dict(totals))
+    for rows, points in edge_counts or ():
+        for user_id, n in rows:
+            scores[user_id] += n * points
+    # Drop users whose likes were all taken back
+    return +scores
+
+
+async def awindow_scores(since):
+    totals, edge_counts = _window_queries(since)
+    scores = Counter({user_id: total async for user_id, total in totals})
+    for rows, points in edge_counts or ():
+        async for user_id, n in rows:
+            scores[user_id] += n * points
+    return +scores
+
+
+def _rank(scores, limit):
+    return sorted(
+        ((score, user_id) for user_id, score in scores.items()),
+        key=lambda item: (-item[0], item[1]),
+    )[:limit]
+
+
+def _leaders(ranked, users):
+    leaders = []
+    for score, user_id in ranked:
+        user = users[user_id]
+        user.score = score
+        leaders.append(user)
+    return leaders
+
+
+def top_users(since, limit):
+    """Users ranked by karma earned since `since`, each annotated with `.score`."""
+    ranked = _rank(window_scores(since), limit)
+    return _leaders(ranked, User.objects.in_bulk([user_id for _, user_id in ranked]))
+
+
+async def atop_users(since, limit):
+    ranked = _rank(await awindow_scores(since), limit)
+    return _leaders(ranked, await User.objects.ain_bulk([user_id for _, user_id in ranked]))
+
+
+def rebuild(since=None):
+    """
+    Recompute the ledger from the like tables.
+
+    With `since`, only buckets from that hour onwards are replaced, which is
+    enough to backfill the leaderboard window.
+    """
+    buckets = Counter()
+    for like_model, _, points in _targets():
+        likes = like_model.objects.all()
+        if since is not None:
+            likes = likes.filter(created_at__gte=bucket_start(since))
+        rows = (
+            likes.values(recipient=F('target__author'), bucket=TruncHour('created_at'))
+            .annotate(n=Count('id'))
+            .values_list('recipient', 'bucket', 'n')
+        )
+        for user_id, bucket, n in rows:
+            buckets[(user_id, bucket)] += n * points
+
+    with transaction.atomic():
+        stale = KarmaBucket.objects.all()
+        if since is not None:
+            stale = stale.filter(bucket__gte=bucket_start(since))
+        stale.delete()
+        KarmaBucket.objects.bulk_create(
+            [KarmaBucket(user_id=user_id, bucket=bucket, points=points)
+             for (user_id, bucket), points in buckets.items() if points],
+            batch_size=1000,
+        )
+    return len(buckets)
@@ -0,0 +1,162 @@
+"""
+Vectorized karma over the whole like history.
+
+The ledger (community/karma.py) answers one question cheaply: karma earned
+from some moment until now. Questions about the past, such as the
+leaderboard as it stood at time T or a user's karma week by week, are
+answered here instead. The engine loads every like once as three arrays
+sorted by time: when it was created, who received it (the author of the
+liked post or comment), and its kind (an index into karma.like_points()).
+After that:
+
+- karma over any window [start, end) is two binary searches plus a
+  bincount over the likes in between;
+- a series of windows is a single searchsorted + bincount over all likes;
+- one user's history is a cumulative sum over that user's likes.
+
+Points are applied at query time, so the like weights can change without a
+reload. A loaded engine is kept per process and reloaded once it is older
+than KARMA_ENGINE_SECONDS, so the history lags writes by at most that long.
+"""
+import itertools
+import threading
+import time
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import karma
+from .models import User
+
+CHUNK_SIZE = 50_000
+
+_engine = None
+_lock = threading.Lock()
+
+
+def to_datetime64(moment):
+    return np.datetime64(timezone.make_naive(moment, dt_timezone.utc), 'us')
+
+
+class KarmaEngine:
+    def __init__(self, times, recipients, kinds, loaded_at=None):
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.recipients = recipients[order]
+        self.kinds = kinds[order]
+        self.loaded_at = loaded_at
+        # Dense user numbering for bincount
+        self.user_ids, self.user_index = np.unique(self.recipients, return_inverse=True)
+
+    @classmethod
+    def load(cls):
+        """Load every like from the database."""
+        loaded_at = time.monotonic()
+        times, recipients, kinds = [], [], []
+        for kind, (like_model, _, _) in enumerate(karma._targets()):
+            rows = like_model.objects.values_list('target__author_id', 'created_at').iterator(chunk_size=CHUNK_SIZE)
+            while chunk := list(itertools.islice(rows, CHUNK_SIZE)):
+                recipients.append(np.fromiter((author_id for author_id, _ in chunk), dtype=np.int64, count=len(chunk)))
+                # Datetimes come back in UTC under USE_TZ
+                times.append(np.array([created_at.replace(tzinfo=None) for _, created_at in chunk], dtype='datetime64[us]'))
+                kinds.append(np.full(len(chunk), kind, dtype=np.uint8))
+        return cls(
+            np.concatenate(times) if times else np.zeros(0, dtype='datetime64[us]'),
+            np.concatenate(recipients) if recipients else np.zeros(0, dtype=np.int64),
+            np.concatenate(kinds) if kinds else np.zeros(0, dtype=np.uint8),
+            loaded_at=loaded_at,
+        )
+
+    def points(self, kinds):
+        weights = np.array([points for _, points in karma.like_points()], dtype=np.int64)
+        return weights[kinds]
+
+    def _span(self, start, end):
+        first = np.searchsorted(self.times, to_datetime64(start)) if start is not None else 0
+        last = np.searchsorted(self.times, to_datetime64(end)) if end is not None else len(self.times)
+        return slice(int(first), int(last))
+
+    def scores(self, start=None, end=None):
+        """{user_id: karma} from likes created in [start, end); open ends are unbounded."""
+        span = self._span(start, end)
+        totals = np.bincount(self.user_index[span], weights=self.points(self.kinds[span]), minlength=len(self.user_ids))
+        earned = totals != 0
+        return Counter(dict(zip(self.user_ids[earned].tolist(), totals[earned].astype(np.int64).tolist())))
+
+    def top(self, start=None, end=None, limit=5):
+        """[(karma, user_id)] of the `limit` best users, ranked as karma._rank ranks them."""
+        scores = self.scores(start, end)
+        user_ids = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        totals = np.fromiter(scores.values(), dtype=np.int64, count=len(scores))
+        order = np.lexsort((user_ids, -totals))[:limit]
+        return list(zip(totals[order].tolist(), user_ids[order].tolist()))
+
+    def series(self, edges):
+        """
+        Karma of every user in each window [edges[i], edges[i + 1]).
+
+        Returns (user_ids, matrix) with one row per user and one column per
+        window; windows must be in increasing order.
+        """
+        edges = np.array([to_datetime64(edge) for edge in edges], dtype='datetime64[us]')
+        windows = len(edges) - 1
+        window = np.searchsorted(edges, self.times, side='right') - 1
+        inside = (window >= 0) & (window < windows)
+        cells = self.user_index[inside] * windows + window[inside]
+        matrix = np.bincount(
+            cells, weights=self.points(self.kinds[inside]), minlength=len(self.user_ids) * windows,
+        ).astype(np.int64).reshape(len(self.user_ids), windows)
+        return self.user_ids, matrix
+
+    def history(self, user_id, edges):
+        """Karma of one user in each window [edges[i], edges[i + 1])."""
+        mine = self.recipients == user_id
+        cumulative = np.concatenate([[0], np.cumsum(self.points(self.kinds[mine]))])
+        positions = np.searchsorted(self.times[mine], [to_datetime64(edge) for edge in edges])
+        return np.diff(cumulative[positions]).tolist()
+
+
+def get_engine():
+    """The engine of this process, reloaded when older than KARMA_ENGINE_SECONDS."""
+    global _engine
+    with _lock:
+        if _engine is None or time.monotonic() - _engine.loaded_at >= settings.KARMA_ENGINE_SECONDS:
+            _engine = KarmaEngine.load()
+        return _engine
+
+
+def top_users(start, end, limit):
+    """Users ranked by karma earned in [start, end), each annotated with `.score` like karma.top_users."""
+    ranked = get_engine().top(start, end, limit)
+    return karma._leaders(ranked, User.objects.in_bulk([user_id for _, user_id in ranked]))
+
+
+async def atop_users(start, end, limit):
+    # Loading the engine reads every like and fills numpy arrays, too long to
+    # run on the event loop; it happens once per KARMA_ENGINE_SECONDS
+    engine = await sync_to_async(get_engine)()
+    ranked = engine.top(start, end, limit)
+    return karma._leaders(ranked, await User.objects.ain_bulk([user_id for _, user_id in ranked]))
+
+
+def week_starts(weeks, now=None):
+    """Starts of the last `weeks` weeks (Monday 00:00 UTC), oldest first, the current one last."""
+    now = timezone.localtime(now or timezone.now(), dt_timezone.utc)
+    current = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return [current - timedelta(weeks=weeks - 1 - week) for week in range(weeks)]
+
+
+def weekly_history(user_id, weeks, now=None):
+    """[(week_start, karma)] of the last `weeks` weeks of `user_id`."""
+    starts = week_starts(weeks, now)
+    return list(zip(starts, get_engine().history(user_id, starts + [starts[-1] + timedelta(weeks=1)])))
+
+
+def reset():
+    global _engine
+    with _lock:
+        _engine = None
@@ -0,0 +1,180 @@
+"""
+Cached leaderboard snapshots.
+
+A snapshot for a (window, limit) pair is recomputed at most once per
+LEADERBOARD_SNAPSHOT_SECONDS. Snapshots outlive their interval in the cache so
+that, once one goes stale, a single worker takes a short lock and rebuilds it
+while every other worker keeps serving the stale copy.
+
+With `as_of`, the leaderboard is the one that stood at that moment. The
+ledger only covers windows ending now, so these snapshots come from the
+in-memory engine of community/karma_engine.py instead and are cached per
+moment, without stale copies.
+"""
+import hashlib
+import json
+import re
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from . import karma, karma_engine
+
+# How long stale snapshots are kept around, in snapshot intervals
+STALE_INTERVALS = 10
+# Upper bound on how long a crashed rebuild can block others from retrying
+LOCK_SECONDS = 30
+
+
+def parse_window(query_params):
+    window = query_params.get('window', '24h')
+    if window not in settings.LEADERBOARD_WINDOWS:
+        raise ValidationError({'window': f"Must be one of {', '.join(settings.LEADERBOARD_WINDOWS)}."})
+    return window
+
+
+def parse_limit(query_params):
+    limit = query_params.get('limit', '5')
+    # Not str.isdigit(), which accepts digits int() rejects, like '²'
+    if not re.fullmatch(r'[0-9]+', limit) or int(limit) not in settings.LEADERBOARD_LIMITS:
+        raise ValidationError({'limit': f"Must be one of {', '.join(map(str, settings.LEADERBOARD_LIMITS))}."})
+    return int(limit)
+
+
+def parse_as_of(query_params):
+    """The `as_of` moment (ISO 8601, naive values are UTC), or None when absent."""
+    value = query_params.get('as_of')
+    if value is None:
+        return None
+    try:
+        as_of = parse_datetime(value)
+    except ValueError:
+        as_of = None
+    if as_of is None:
+        raise ValidationError({'as_of': "Must be an ISO 8601 datetime."})
+    if timezone.is_naive(as_of):
+        as_of = timezone.make_aware(as_of, dt_timezone.utc)
+    if as_of > timezone.now():
+        raise ValidationError({'as_of': "Must not be in the future."})
+    return as_of
+
+
+def response_headers(snapshot):
+    return {
+        'ETag': snapshot['etag'],
+        'Cache-Control': f'max-age={max(int(snapshot["expires"] - time.time()), 0)}',
+    }
+
+
+def response_data(snapshot):
+    keys = ('window', 'limit', 'as_of', 'generated_at', 'results') if 'as_of' in snapshot else (
+        'window', 'limit', 'generated_at', 'results')
+    return {key: snapshot[key] for key in keys}
+
+
+def _cache_key(window, limit):
+    return f'leaderboard:{window}:{limit}'
+
+
+def _since(window, now=None):
+    return (now or timezone.now()) - timedelta(hours=settings.LEADERBOARD_WINDOWS[window])
+
+
+def build_snapshot(window, limit, serialize):
+    return _snapshot(window, limit, serialize(karma.top_users(since=_since(window), limit=limit)))
+
+
+async def abuild_snapshot(window, limit, serialize):
+    return _snapshot(window, limit, serialize(await karma.atop_users(since=_since(window), limit=limit)))
+
+
+def _snapshot(window, limit, rows):
+    results = [dict(row) for row in rows]
+    digest = hashlib.md5(
+        json.dumps([window, limit, results], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return {
+        'window': window,
+        'limit': limit,
+        'generated_at': timezone.now(),
+        # Weak: snapshots with the same ranking are equivalent even if
+        # generated_at differs
+        'etag': f'W/"{digest}"',
+        'results': results,
+        'expires': time.time() + settings.LEADERBOARD_SNAPSHOT_SECONDS,
+    }
+
+
+def get_snapshot(window, limit, serialize):
+    """
+    Return the snapshot for (window, limit), rebuilding it if it is stale.
+
+    `serialize` turns the ranked users into a list of dicts.
+    """
+    key = _cache_key(window, limit)
+    snapshot = cache.get(key)
+    if snapshot is not None and snapshot['expires'] > time.time():
+        return snapshot
+
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, True, timeout=LOCK_SECONDS)
+    if not locked and snapshot is not None:
+        # Someone else is already rebuilding it
+        return snapshot
+
+    # Either we hold the lock, or there is nothing (not even stale) to serve yet
+    try:
+        snapshot = build_snapshot(window, limit, serialize)
+        cache.set(key, snapshot, timeout=settings.LEADERBOARD_SNAPSHOT_SECONDS * STALE_INTERVALS + LOCK_SECONDS)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return snapshot
+
+
+async def aget_snapshot(window, limit, serialize):
+    """get_snapshot for async views."""
+    key = _cache_key(window, limit)
+    snapshot = await cache.aget(key)
+    if snapshot is not None and snapshot['expires'] > time.time():
+        return snapshot
+
+    lock_key = f'{key}:lock'
+    locked = await cache.aadd(lock_key, True, timeout=LOCK_SECONDS)
+    if not locked and snapshot is not None:
+        return snapshot
+
+    try:
+        snapshot = await abuild_snapshot(window, limit, serialize)
+        await cache.aset(key, snapshot, timeout=settings.LEADERBOARD_SNAPSHOT_SECONDS * STALE_INTERVALS + LOCK_SECONDS)
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+    return snapshot
+
+
+def get_historical_snapshot(window, limit, as_of, serialize):
+    """The snapshot of (window, limit) as it stood at `as_of`."""
+    key = f'{_cache_key(window, limit)}:{as_of.isoformat()}'
+    snapshot = cache.get(key)
+    if snapshot is None or snapshot['expires'] <= time.time():
+        users = karma_engine.top_users(_since(window, as_of), as_of, limit)
+        snapshot = {**_snapshot(window, limit, serialize(users)), 'as_of': as_of}
+        cache.set(key, snapshot, timeout=settings.LEADERBOARD_SNAPSHOT_SECONDS)
+    return snapshot
+
+
+async def aget_historical_snapshot(window, limit, as_of, serialize):
+    """get_historical_snapshot for async views."""
+    key = f'{_cache_key(window, limit)}:{as_of.isoformat()}'
+    snapshot = await cache.aget(key)
+    if snapshot is None or snapshot['expires'] <= time.time():
+        users = await karma_engine.atop_users(_since(window, as_of), as_of, limit)
+        snapshot = {**_snapshot(window, limit, serialize(users)), 'as_of': as_of}
+        await cache.aset(key, snapshot, timeout=settings.LEADERBOARD_SNAPSHOT_SECONDS)
+    return snapshot
@@ -0,0 +1,61 @@
+"""
+Write-behind like ingestion.
+
+With LIKE_INGESTION_MODE = 'queued', LikeViewSet.create validates the like,
+appends it to the PendingLike table and answers 202 straight away. A flusher
+(`manage.py flush_likes --loop`) drains the table in id order: each batch is
+deduplicated per (user, target) and applied with likes.apply_batch, i.e. one
+bulk INSERT and one counter / karma update for the whole batch instead of a
+transaction per request on the same hot rows.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import likes
+from .models import PendingLike
+
+
+def is_enabled():
+    return settings.LIKE_INGESTION_MODE == 'queued'
+
+
+def is_full():
+    """Backpressure: True once LIKE_QUEUE_MAX_PENDING likes are waiting."""
+    limit = settings.LIKE_QUEUE_MAX_PENDING
+    # Bounded count, so a long queue doesn't make every request slower
+    return PendingLike.objects.values('id')[:limit].count() >= limit
+
+
+def enqueue(user_id, target_type, object_id):
+    return PendingLike.objects.create(user_id=user_id, target_type=target_type, object_id=object_id)
+
+
+def flush(batch_size=None):
+    """
+    Apply up to `batch_size` pending likes, oldest first.
+
+    Returns the number of queue entries consumed. Concurrent flushers skip the
+    rows another one has locked where the database supports it.
+    """
+    batch_size = batch_size or settings.LIKE_QUEUE_BATCH_SIZE
+    with transaction.atomic():
+        pending = PendingLike.objects.order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        rows = list(pending.values_list('id', 'user_id', 'target_type', 'object_id')[:batch_size])
+        if not rows:
+            return 0
+
+        # Duplicate likes from retries and double clicks collapse into one operation
+        operations = {(user_id, target_type, object_id): likes.LIKE for _, user_id, target_type, object_id in rows}
+        likes.apply_batch(operations)
+        PendingLike.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def drain(batch_size=None):
+    """Flush until the queue is empty; returns the number of entries consumed."""
+    total = 0
+    while consumed := flush(batch_size):
+        total += consumed
+    return total
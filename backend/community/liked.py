@@ -0,0 +1,58 @@
+"""
+`liked_by_me`: whether the viewer (see users.viewer) liked each post or
+comment of a response.
+
+Resolved with one query per page or thread, whatever its size: a
+set-membership lookup PostLike / CommentLike(user, target IN ids), which
+their unique (user, target) index answers with one range scan. Anonymous
+viewers have liked nothing and cost no query.
+"""
+from . import replicas, users
+from .models import LIKE_MODELS
+
+
+def liked_ids(viewer, model, object_ids):
+    """The ids among `object_ids` of `model` objects that `viewer` liked."""
+    object_ids = list(object_ids)
+    if viewer is None or not object_ids:
+        return set()
+    likes = LIKE_MODELS[model].objects.filter(user_id=viewer.id, target_id__in=object_ids)
+    return set(likes.values_list('target_id', flat=True))
+
+
+async def aliked_ids(viewer, model, object_ids):
+    object_ids = list(object_ids)
+    if viewer is None or not object_ids:
+        return set()
+    likes = LIKE_MODELS[model].objects.filter(user_id=viewer.id, target_id__in=object_ids)
+    return {object_id async for object_id in likes.values_list('target_id', flat=True)}
+
+
+def mark(viewer, objects):
+    """Set `liked_by_me` on model instances of one type; returns them as a list."""
+    objects = list(objects)
+    if objects:
+        liked = liked_ids(viewer, type(objects[0]), [obj.id for obj in objects])
+        for obj in objects:
+            obj.liked_by_me = obj.id in liked
+    return objects
+
+
+async def amark(viewer, objects):
+    objects = list(objects)
+    if objects:
+        liked = await aliked_ids(viewer, type(objects[0]), [obj.id for obj in objects])
+        for obj in objects:
+            obj.liked_by_me = obj.id in liked
+    return objects
+
+
+class LikedByMeMixin:
+    """Marks the instances that safe actions serialize with `liked_by_me`."""
+
+    def get_serializer(self, *args, **kwargs):
+        if args and args[0] is not None and self.request.method in replicas.SAFE_METHODS:
+            many = kwargs.get('many', False)
+            objects = mark(users.viewer(self.request), args[0] if many else [args[0]])
+            args = (objects if many else objects[0], *args[1:])
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,111 @@
+"""
+Batched like / unlike.
+
+Applies many (user, target, action) operations with a fixed number of
+queries: one existence check and one lookup of current likes per like
+model, one bulk INSERT (one per like if a concurrent request got there
+first) and one DELETE per like model and user. Counters, karma and caches
+are then updated once for the whole batch.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from . import signals
+from .models import Post, Comment, LIKE_MODELS
+
+LIKEABLE_TYPES = {'post': Post, 'comment': Comment}
+
+LIKE = 'like'
+UNLIKE = 'unlike'
+
+# Per-operation outcomes
+LIKED = 'liked'
+ALREADY_LIKED = 'already liked'
+UNLIKED = 'unliked'
+NOT_LIKED = 'not liked'
+NOT_FOUND = 'not found'
+
+
+def apply_batch(operations):
+    """
+    Apply {(user_id, type, object_id): action} and return {key: outcome}.
+
+    Each key appears once, so callers coalesce repeated operations on the same
+    (user, target) first, e.g. keeping the last one.
+    """
+    by_type = defaultdict(dict)
+    for (user_id, obj_type, object_id), action in operations.items():
+        by_type[obj_type][(user_id, object_id)] = action
+
+    outcomes = {}
+    created, removed = [], []
+    with transaction.atomic(), signals.batched_likes():
+        for obj_type, ops in by_type.items():
+            model = LIKEABLE_TYPES[obj_type]
+            like_model = LIKE_MODELS[model]
+            object_ids = {object_id for _, object_id in ops}
+            user_ids = {user_id for user_id, _ in ops}
+
+            found = set(model.objects.filter(id__in=object_ids).values_list('id', flat=True))
+            existing = {
+                (like.user_id, like.target_id): like
+                for like in like_model.objects.filter(target_id__in=found, user_id__in=user_ids)
+                if (like.user_id, like.target_id) in ops
+            }
+
+            to_create, to_delete = [], defaultdict(list)
+            for (user_id, object_id), action in ops.items():
+                key = (user_id, obj_type, object_id)
+                if object_id not in found:
+                    outcomes[key] = NOT_FOUND
+                elif action == LIKE and (user_id, object_id) in existing:
+                    outcomes[key] = ALREADY_LIKED
+                elif action == LIKE:
+                    to_create.append(like_model(user_id=user_id, target_id=object_id))
+                    outcomes[key] = LIKED
+                elif (user_id, object_id) in existing:
+                    to_delete[user_id].append(object_id)
+                    removed.append(existing[(user_id, object_id)])
+                    outcomes[key] = UNLIKED
+                else:
+                    outcomes[key] = NOT_LIKED
+
+            inserted = insert_likes(like_model, to_create)
+            created += inserted
+            # Liked by a concurrent request since `existing` was read
+            inserted = {(like.user_id, like.target_id) for like in inserted}
+            for like in to_create:
+                if (like.user_id, like.target_id) not in inserted:
+                    outcomes[(like.user_id, obj_type, like.target_id)] = ALREADY_LIKED
+            for user_id, ids in to_delete.items():
+                like_model.objects.filter(user_id=user_id, target_id__in=ids).delete()
+
+        if removed:
+            signals.apply_likes(removed, sign=-1)
+        if created:
+            signals.apply_likes(created)
+    return outcomes
+
+
+def insert_likes(like_model, likes):
+    """
+    Insert `likes` and return the ones actually inserted.
+
+    One bulk INSERT, unless a concurrent request liked one of the same targets
+    first: then each like is inserted on its own, skipping the ones that
+    already exist, so only rows this call wrote get counted.
+    """
+    try:
+        with transaction.atomic():
+            return like_model.objects.bulk_create(likes)
+    except IntegrityError:
+        pass
+    inserted = []
+    for like in likes:
+        try:
+            with transaction.atomic():
+                inserted += like_model.objects.bulk_create([like_model(user_id=like.user_id, target_id=like.target_id)])
+        except IntegrityError:
+            pass
+    return inserted
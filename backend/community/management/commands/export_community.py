@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from community import columnar
+
+
+class Command(BaseCommand):
+    help = "Export users, posts, comments and likes as columnar NumPy shards (see community/columnar.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--tables', nargs='+', choices=list(columnar.TABLES), help="Default: all of them.")
+        parser.add_argument('--chunk-size', type=int, default=100_000, help="Rows per shard.")
+        parser.add_argument('--compress', action='store_true', help="Smaller shards, slower to write and read.")
+
+    def handle(self, *args, **options):
+        counts = columnar.export(
+            options['directory'],
+            tables=options['tables'],
+            chunk_size=options['chunk_size'],
+            compress=options['compress'],
+            log=lambda message: self.stdout.write(f"Exported {message}."),
+        )
+        summary = ', '.join(f"{n} {name}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Exported {summary} to {options['directory']}."))
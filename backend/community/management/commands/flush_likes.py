@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from community import like_queue
+
+
+class Command(BaseCommand):
+    help = "Apply likes accepted in queued ingestion mode (LIKE_INGESTION_MODE = 'queued')."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Keep running, flushing every LIKE_QUEUE_FLUSH_SECONDS.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help="Pending likes applied per transaction (default: LIKE_QUEUE_BATCH_SIZE).",
+        )
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            count = like_queue.drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Applied {count} pending likes."))
+            return
+
+        while True:
+            started = time.monotonic()
+            count = like_queue.drain(options['batch_size'])
+            if count:
+                self.stdout.write(f"Applied {count} pending likes.")
+            time.sleep(max(0, settings.LIKE_QUEUE_FLUSH_SECONDS - (time.monotonic() - started)))
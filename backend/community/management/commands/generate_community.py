@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from community import synthetic
+from community.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic community (users, posts, comment trees, likes) for load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10_000)
+        parser.add_argument('--comments', type=int, default=50_000)
+        parser.add_argument('--likes', type=int, default=200_000)
+        parser.add_argument('--max-depth', type=int, default=8, help="Deepest reply level.")
+        parser.add_argument('--skew', type=float, default=1.1, help="Power-law exponent of post and user popularity.")
+        parser.add_argument('--days', type=int, default=30, help="Spread timestamps over the last N days.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='user', help="Username prefix of the generated users.")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users named {options['prefix']}* already exist; pick another --prefix or flush the database.")
+
+        counts = synthetic.generate(
+            users=options['users'],
+            posts=options['posts'],
+            comments=options['comments'],
+            likes=options['likes'],
+            max_depth=options['max_depth'],
+            skew=options['skew'],
+            days=options['days'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            log=lambda message: self.stdout.write(f"Created {message}."),
+        )
+        summary = ', '.join(f"{n} {name}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary}."))
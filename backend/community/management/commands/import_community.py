@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from community import columnar
+
+
+class Command(BaseCommand):
+    help = "Load a dump written by export_community into empty tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+
+    def handle(self, *args, **options):
+        try:
+            counts = columnar.load(
+                options['directory'],
+                log=lambda message: self.stdout.write(f"Loaded {message}."),
+            )
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        summary = ', '.join(f"{n} {name}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Imported {summary}."))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from community import karma
+
+
+class Command(BaseCommand):
+    help = "Rebuild the karma ledger (hourly karma buckets) from the post and comment like tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            help="Only rebuild buckets for the last N hours (default: full history).",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['hours'] is not None:
+            since = timezone.now() - timedelta(hours=options['hours'])
+
+        count = karma.rebuild(since=since)
+        scope = f"last {options['hours']}h" if since else "full history"
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} karma buckets ({scope})."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from community import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search indexes of posts and comments from their tables."
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search indexes."))
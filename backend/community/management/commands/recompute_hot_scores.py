@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from community import hot
+
+
+class Command(BaseCommand):
+    help = "Recompute the hot feed score of every post from its like and comment counts."
+
+    def handle(self, *args, **options):
+        changed = hot.recompute()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed hot scores, {changed} changed."))
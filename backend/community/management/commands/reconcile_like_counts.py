@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from community import counters
+
+
+class Command(BaseCommand):
+    help = "Repair drift between the denormalized likes_count columns and the like tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report how many rows have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        for model in counters.LIKEABLE_MODELS:
+            fixed = counters.reconcile(model, dry_run=options['dry_run'])
+            verb = "Found" if options['dry_run'] else "Repaired"
+            self.stdout.write(self.style.SUCCESS(f"{verb} {fixed} drifted {model._meta.verbose_name} counts."))
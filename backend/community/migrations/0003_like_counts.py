@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:13
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_counts(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('community', 'Like')
+    for model_name in ('post', 'comment'):
+        model = apps.get_model('community', model_name)
+        content_type = ContentType.objects.filter(app_label='community', model=model_name).first()
+        if content_type is None:
+            # Fresh database: no likes yet
+            continue
+        model.objects.update(likes_count=Coalesce(Subquery(
+            Like.objects.filter(content_type=content_type, object_id=OuterRef('pk'))
+            .values('object_id')
+            .annotate(n=Count('id'))
+            .values('n'),
+            output_field=IntegerField(),
+        ), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0002_karmabucket'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_counts, migrations.RunPython.noop),
+    ]
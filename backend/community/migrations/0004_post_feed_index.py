@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0003_like_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='community_p_created_a970d0_idx'),
+        ),
+    ]
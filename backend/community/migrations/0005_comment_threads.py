@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:15
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_reply_counts(apps, schema_editor):
+    Comment = apps.get_model('community', 'Comment')
+    Comment.objects.update(reply_count=Coalesce(Subquery(
+        Comment.objects.filter(parent=OuterRef('pk'))
+        .values('parent')
+        .annotate(n=Count('id'))
+        .values('n'),
+        output_field=IntegerField(),
+    ), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0004_post_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reply_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', 'created_at', 'id'], name='community_c_post_id_3c6cbb_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:17
+
+from django.db import migrations, models
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat, LPad
+
+PATH_STEP = 10
+
+
+def backfill_paths(apps, schema_editor):
+    # Same as community.threads.rebuild_paths: one tree level per UPDATE
+    Comment = apps.get_model('community', 'Comment')
+    own_segment = LPad(Cast('id', CharField()), PATH_STEP, Value('0'))
+    updated = Comment.objects.filter(parent__isnull=True).update(path=own_segment)
+    while updated:
+        parent = Comment.objects.filter(pk=OuterRef('parent_id'))
+        updated = Comment.objects.filter(path='').exclude(parent__path='').update(
+            path=Concat(Subquery(parent.values('path')), own_segment, output_field=CharField()),
+            depth=Subquery(parent.values('depth')) + 1,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0005_comment_threads'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='community_c_post_id_3c6cbb_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='community_c_post_id_a98548_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth', 'path'], name='community_c_post_id_4d6e8a_idx'),
+        ),
+    ]
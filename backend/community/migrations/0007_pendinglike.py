@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0006_comment_paths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_likes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
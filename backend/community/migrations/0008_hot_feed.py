@@ -0,0 +1,57 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:43
+
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+HOT_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_hot_scores(apps, schema_editor):
+    # Same as community.hot.recompute, with the comment counts filled in first
+    Post = apps.get_model('community', 'Post')
+    Comment = apps.get_model('community', 'Comment')
+    Post.objects.update(comments_count=Coalesce(Subquery(
+        Comment.objects.filter(post=OuterRef('pk'))
+        .values('post')
+        .annotate(n=Count('id'))
+        .values('n'),
+        output_field=IntegerField(),
+    ), Value(0)))
+
+    posts = []
+    for post in Post.objects.only('id', 'created_at', 'likes_count', 'comments_count').iterator(chunk_size=1000):
+        engagement = settings.HOT_LIKE_WEIGHT * post.likes_count + settings.HOT_COMMENT_WEIGHT * post.comments_count
+        age = (post.created_at - HOT_EPOCH).total_seconds() / settings.HOT_TIMESCALE_SECONDS
+        post.hot_score = math.log1p(engagement) + age
+        posts.append(post)
+    Post.objects.bulk_update(posts, ['hot_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0007_pendinglike'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_hot_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='community_p_hot_sco_02a0ec_idx'),
+        ),
+    ]
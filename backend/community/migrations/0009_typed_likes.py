@@ -0,0 +1,80 @@
+# Generated by Django 6.0.1 on 2026-10-18 05:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 10_000
+
+
+def copy_generic_likes(apps, schema_editor):
+    """
+    Copy the generic Like rows into PostLike / CommentLike, one id range per
+    transaction so no lock is held for long. Rows already copied (same user
+    and target) are skipped, so this can run again to pick up likes written
+    by old code while it was being deployed.
+    """
+    Like = apps.get_model('community', 'Like')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    quote = schema_editor.connection.ops.quote_name
+    bounds = Like.objects.aggregate(first=models.Min('id'), last=models.Max('id'))
+    if bounds['first'] is None:
+        return
+
+    for model_name, like_model_name in (('post', 'PostLike'), ('comment', 'CommentLike')):
+        content_type = ContentType.objects.filter(app_label='community', model=model_name).first()
+        if content_type is None:
+            continue
+        target = apps.get_model('community', model_name)._meta.db_table
+        like_table = apps.get_model('community', like_model_name)._meta.db_table
+        # Likes of objects deleted meanwhile have nothing to point at and are dropped
+        sql = (
+            f"INSERT INTO {quote(like_table)} (user_id, target_id, created_at) "
+            f"SELECT l.user_id, l.object_id, l.created_at FROM {quote(Like._meta.db_table)} l "
+            f"WHERE l.content_type_id = %s AND l.id >= %s AND l.id < %s "
+            f"AND EXISTS (SELECT 1 FROM {quote(target)} t WHERE t.id = l.object_id) "
+            f"AND NOT EXISTS (SELECT 1 FROM {quote(like_table)} x "
+            f"WHERE x.user_id = l.user_id AND x.target_id = l.object_id)"
+        )
+        for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+            with transaction.atomic(using=schema_editor.connection.alias), schema_editor.connection.cursor() as cursor:
+                cursor.execute(sql, [content_type.id, start, start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    # The copy commits batch by batch
+    atomic = False
+
+    dependencies = [
+        ('community', '0008_hot_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='community.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='community_p_created_74a59f_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'target'), name='unique_post_like')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CommentLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='community.comment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='community_c_created_071250_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'target'), name='unique_comment_like')],
+            },
+        ),
+        migrations.RunPython(copy_generic_likes, migrations.RunPython.noop),
+    ]
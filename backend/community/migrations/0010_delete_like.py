@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 05:02
+
+from importlib import import_module
+
+from django.db import migrations
+
+
+def copy_remaining_likes(apps, schema_editor):
+    # Likes written by old code since 0009 ran
+    import_module('community.migrations.0009_typed_likes').copy_generic_likes(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('community', '0009_typed_likes'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_remaining_likes, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='Like',
+        ),
+    ]
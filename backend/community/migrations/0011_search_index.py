@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:12
+
+from django.db import migrations
+
+# Full-text indexes of Post.content and Comment.content (see community/search.py).
+# Each database gets its native index, maintained by the database itself.
+TABLES = ['community_post', 'community_comment']
+
+
+def sqlite_statements(table):
+    index = f'{table}_search'
+    # External content: the index reads the text from the table instead of storing a copy
+    return [
+        f"CREATE VIRTUAL TABLE {index} USING fts5(content, content='{table}', content_rowid='id', "
+        "tokenize='porter unicode61 remove_diacritics 2')",
+        f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+        f"CREATE TRIGGER {index}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {index}(rowid, content) VALUES (new.id, new.content); END",
+        f"CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {index}({index}, rowid, content) VALUES ('delete', old.id, old.content); END",
+        f"CREATE TRIGGER {index}_update AFTER UPDATE OF content ON {table} BEGIN "
+        f"INSERT INTO {index}({index}, rowid, content) VALUES ('delete', old.id, old.content); "
+        f"INSERT INTO {index}(rowid, content) VALUES (new.id, new.content); END",
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in TABLES:
+        if vendor == 'sqlite':
+            statements = sqlite_statements(table)
+        elif vendor == 'postgresql':
+            # Concurrently, so writes go on while a large table is indexed
+            statements = [
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_search ON {table} "
+                "USING GIN (to_tsvector('english', content))",
+            ]
+        else:
+            statements = []
+        for statement in statements:
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in TABLES:
+        if vendor == 'sqlite':
+            statements = [f"DROP TRIGGER IF EXISTS {table}_search_{event}" for event in ('insert', 'delete', 'update')]
+            statements.append(f"DROP TABLE IF EXISTS {table}_search")
+        elif vendor == 'postgresql':
+            statements = [f"DROP INDEX CONCURRENTLY IF EXISTS {table}_search"]
+        else:
+            statements = []
+        for statement in statements:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('community', '0010_delete_like'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
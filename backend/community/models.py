@@ -1,7 +1,5 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
-from django.contrib.contenttypes.models import ContentType
 
 class User(AbstractUser):
     pass
@@ -10,8 +8,18 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    likes = GenericRelation('Like')
-    # Denormalization for performance if needed, but sticking to Annotation first as per plan.
+    # Denormalized like count, kept in sync by PostLike signals (see community/counters.py)
+    likes_count = models.PositiveIntegerField(default=0)
+    # Number of comments at any depth, kept in sync by Comment signals
+    comments_count = models.PositiveIntegerField(default=0)
+    # Time-decayed popularity, see community/hot.py
+    hot_score = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']), # Keyset pagination of the feed
+            models.Index(fields=['-hot_score', '-id']), # ... and of the hot feed
+        ]
     
     def __str__(self):
         return f"Post by {self.author.username} at {self.created_at}"
@@ -22,26 +30,103 @@ class Comment(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    likes = GenericRelation('Like')
+    likes_count = models.PositiveIntegerField(default=0)
+    # Number of direct replies, kept in sync by Comment signals
+    reply_count = models.PositiveIntegerField(default=0)
+    # Materialized path (ancestor ids + own id) and depth, see community/threads.py
+    path = models.CharField(max_length=1000, blank=True, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'path']), # Subtree / thread slice range scans
+            models.Index(fields=['post', 'depth', 'path']), # Paginating the roots of a thread
+            # Keyset pagination of /api/comments/, unfiltered and by ?post=, ?author=, ?parent=
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['post', '-created_at', '-id']),
+            models.Index(fields=['author', '-created_at', '-id']),
+            models.Index(fields=['parent', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.id}"
 
 class Like(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes')
-    # Generic Relation setup
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    object_id = models.PositiveIntegerField()
-    content_object = GenericForeignKey('content_type', 'object_id')
-    
+    """
+    A user's like of a post or comment.
+
+    Each likeable model has its own table (PostLike, CommentLike, see
+    LIKE_MODELS) with a real foreign key to the liked object, named `target`
+    in all of them so code can handle any kind of like the same way.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='%(class)ss')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('user', 'content_type', 'object_id')
+        abstract = True
+
+    @classmethod
+    def target_model(cls):
+        return cls._meta.get_field('target').related_model
+
+    @property
+    def target_key(self):
+        # (model, id) of the liked object
+        return self.target_model(), self.target_id
+
+    def __str__(self):
+        return f"{self.user_id} liked {self.target_model()._meta.model_name} {self.target_id}"
+
+class PostLike(Like):
+    target = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
+
+    class Meta:
+        constraints = [
+            # Also serves "which of these posts did this user like" lookups
+            models.UniqueConstraint(fields=['user', 'target'], name='unique_post_like'),
+        ]
         indexes = [
-            models.Index(fields=['content_type', 'object_id']),
             models.Index(fields=['created_at']), # For leaderboard filtering
         ]
 
+class CommentLike(Like):
+    target = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='likes')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'target'], name='unique_comment_like'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+# Like table of every likeable model
+LIKE_MODELS = {Post: PostLike, Comment: CommentLike}
+
+class KarmaBucket(models.Model):
+    # Karma received by `user` from likes created during the hour starting at `bucket`.
+    # Maintained incrementally from Like signals, see community/karma.py
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='karma_buckets')
+    bucket = models.DateTimeField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'bucket')
+        indexes = [
+            models.Index(fields=['bucket', 'user']), # Sliding window scans
+        ]
+
     def __str__(self):
-        return f"{self.user.username} liked {self.content_type.model} {self.object_id}"
+        return f"{self.user_id} earned {self.points} at {self.bucket}"
+
+class PendingLike(models.Model):
+    """
+    A like accepted in queued ingestion mode but not yet applied.
+
+    Rows are appended by LikeViewSet.create and drained in id order by
+    like_queue.flush, which turns them into PostLike / CommentLike rows in batches.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_likes')
+    target_type = models.CharField(max_length=10, choices=[('post', 'Post'), ('comment', 'Comment')])
+    object_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,323 @@
+import base64
+import binascii
+import json
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, Subquery, Value, Window
+from django.db.models.functions import Coalesce, Length, RowNumber
+from django.urls import reverse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import instrumentation, liked, search, threads, users
+from .models import Comment
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a unique ordering.
+
+    The cursor is an opaque token holding the ordering values of the last row
+    on the previous page, and the next page is fetched with a range condition
+    on those values. Unlike OFFSET, every page costs one index range scan of
+    `page_size` rows no matter how deep the client has scrolled.
+    """
+    # The last field must be unique so that rows never tie
+    ordering = ('-created_at', '-id')
+    # Other orderings clients can pick with ?ordering=, each backed by an index
+    orderings = {
+        'hot': ('-hot_score', '-id'),
+    }
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Read at request time so settings overrides apply
+    @property
+    def page_size(self):
+        return settings.FEED_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return settings.FEED_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.set_page([obj async for obj in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """The (unevaluated) rows of the requested page, plus one."""
+        self.request = request
+        self.current_page_size = self.get_page_size(request)
+        # One extra row tells us whether there is a next page
+        return self.ordered_queryset(queryset, request)[:self.current_page_size + 1]
+
+    def ordered_queryset(self, queryset, request):
+        """Every row after the requested cursor, in the requested ordering."""
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.seek(position))
+        return queryset
+
+    def set_page(self, rows):
+        self.page = rows[:self.current_page_size]
+        self.next_position = self.position(self.page[-1]) if len(rows) > self.current_page_size else None
+        return self.page
+
+    def get_ordering(self, request):
+        # Unknown orderings are ignored, as with DRF's OrderingFilter
+        return self.orderings.get(request.query_params.get(self.ordering_query_param), type(self).ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self, url=None):
+        """Link to the next page; `url` defaults to the current request's."""
+        if self.next_position is None:
+            return None
+        url = url or self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def seek(self, position):
+        """
+        Rows strictly after `position` in `ordering`.
+
+        Expands the row comparison (a, b) < (x, y) into
+        a <= x AND (a < x OR (a = x AND b < y)), leading with a plain range
+        on the first column so the database can use the index for it.
+        """
+        after = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': position[0]}) & after
+
+    def encode_cursor(self, position):
+        # Not DjangoJSONEncoder: it truncates datetimes to milliseconds, which
+        # would make the cursor skip rows
+        raw = json.dumps(
+            [value.isoformat() if hasattr(value, 'isoformat') else value for value in position],
+            separators=(',', ':'),
+        )
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return self.parse_position(values)
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_position(self, values):
+        # to_python() lets None through, and seek() can't compare against it
+        if any(value is None or isinstance(value, (list, dict)) for value in values):
+            raise ValueError
+        fields = [self.model._meta.get_field(field.lstrip('-')) for field in self.ordering]
+        return [field.to_python(value) for field, value in zip(fields, values)]
+
+
+class CommentPagination(KeysetPagination):
+    """
+    Pages through flat comment listings (/api/comments/), newest first or
+    oldest first with ?ordering=oldest. Every filter the view offers has an
+    index leading with its column, so a page is one range scan either way.
+    """
+    orderings = {
+        'oldest': ('created_at', 'id'),
+    }
+
+    @property
+    def page_size(self):
+        return settings.THREAD_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return settings.THREAD_MAX_PAGE_SIZE
+
+
+class ThreadPagination(KeysetPagination):
+    """
+    Paginates the roots of a comment thread and loads their replies.
+
+    The roots are either a post's top-level comments or the direct replies to
+    one comment. Replies are nested down to `?depth=` levels, with at most
+    THREAD_REPLIES_PER_COMMENT replies per comment, and a comment with more
+    replies than were loaded gets `replies_next`, a link to the endpoint that
+    loads the rest. The page is returned already rendered.
+
+    Comments are ordered by materialized path (see community/threads.py), so
+    a page of roots plus their subtrees is one contiguous range of paths and
+    comes back, already in pre-order, from a single range scan.
+    """
+    ordering = ('path',)
+    depth_query_param = 'depth'
+    replies_url_name = 'comment-replies'
+
+    @property
+    def page_size(self):
+        return settings.THREAD_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return settings.THREAD_MAX_PAGE_SIZE
+
+    def get_depth(self, request):
+        try:
+            depth = int(request.query_params[self.depth_query_param])
+        except (KeyError, ValueError):
+            return settings.THREAD_DEPTH
+        return min(max(depth, 0), settings.THREAD_MAX_DEPTH)
+
+    def seek(self, position):
+        # Skip the previous root together with its whole subtree
+        return Q(path__gte=threads.subtree_end(position[0]))
+
+    def parse_position(self, values):
+        # A whole path: seek() turns it into an int, so it must be ASCII digits
+        # (not str.isdigit(), which accepts '²') no longer than the column
+        path, = values
+        if (
+            not isinstance(path, str)
+            or not re.fullmatch(r'[0-9]+', path)
+            or len(path) > Comment._meta.get_field('path').max_length
+            or len(path) % threads.PATH_STEP
+        ):
+            raise ValueError
+        return [path]
+
+    def paginate_thread(self, request, post_id, parent=None):
+        """Roots are the top-level comments of the post, or the replies to `parent`."""
+        rows = list(self.thread_queryset(request, post_id, parent))
+        # One lookup for the whole page, see community/liked.py
+        liked_ids = liked.liked_ids(users.viewer(request), Comment, [row['id'] for row in rows])
+        return self.set_thread(rows, liked_ids)
+
+    async def apaginate_thread(self, request, post_id, parent=None):
+        rows = [row async for row in self.thread_queryset(request, post_id, parent)]
+        viewer = await users.aviewer(request)
+        return self.set_thread(rows, await liked.aliked_ids(viewer, Comment, [row['id'] for row in rows]))
+
+    def thread_queryset(self, request, post_id, parent=None):
+        """The (unevaluated) single query behind a thread page."""
+        self.request = request
+        self.model = Comment
+        page_size = self.get_page_size(request)
+        depth = self.get_depth(request)
+
+        root_depth = self.root_depth = parent.depth + 1 if parent else 0
+        in_range = Q(post_id=post_id)
+        if parent is not None:
+            in_range &= Q(path__gt=parent.path)
+        position = self.decode_cursor(request)
+        if position is not None:
+            in_range &= self.seek(position)
+
+        # The range ends at the first root after this page or, on the last
+        # page, with the parent's subtree (or the post)
+        range_end = threads.subtree_end(parent.path) if parent else threads.PATH_END
+        roots = Comment.objects.filter(in_range, depth=root_depth, path__lt=range_end).order_by('path')
+        page_end = Subquery(roots.values('path')[page_size:page_size + 1])
+
+        # The depth bound is expressed on the path length rather than on
+        # `depth`, so the planner scans the (post, path) index range instead
+        # of every shallow comment of the post
+        return (
+            Comment.objects.filter(in_range)
+            .alias(path_length=Length('path'))
+            .filter(path_length__lte=(root_depth + depth + 1) * threads.PATH_STEP)
+            .annotate(page_end=page_end)
+            .filter(path__lt=Coalesce(page_end, Value(range_end)))
+            .annotate(reply_rank=Window(
+                RowNumber(),
+                partition_by=F('parent_id'),
+                order_by=F('path').asc(),
+            ))
+            # Roots are never cut, replies are capped per parent
+            .filter(Q(reply_rank__lte=settings.THREAD_REPLIES_PER_COMMENT) | Q(depth=root_depth))
+            .order_by('path')
+            .values(*threads.TREE_FIELDS, 'page_end')
+        )
+
+    def set_thread(self, rows, liked_ids=frozenset()):
+        root_paths = [row['path'] for row in rows if row['depth'] == self.root_depth]
+        has_next = bool(rows) and rows[0]['page_end'] is not None
+        self.next_position = root_paths[-1:] if has_next else None
+        with instrumentation.serializing():
+            self.page = threads.render_tree(rows, self.root_depth, self.get_replies_link, liked_ids)
+        return self.page
+
+    def get_paginated_response(self, data=None):
+        # The page is already rendered, see threads.render_tree
+        return super().get_paginated_response(self.page if data is None else data)
+
+    def get_replies_link(self, comment_id, after_path=None):
+        url = self.request.build_absolute_uri(reverse(self.replies_url_name, kwargs={'pk': comment_id}))
+        if self.depth_query_param in self.request.query_params:
+            url = replace_query_param(url, self.depth_query_param, self.request.query_params[self.depth_query_param])
+        if after_path is not None:
+            url = replace_query_param(url, self.cursor_query_param, self.encode_cursor([after_path]))
+        return url
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Pages through full-text search hits, best first (see community/search.py).
+
+    The cursor holds the (rank, kind, id) of the last hit of the page.
+    """
+    ordering = ('rank', 'kind', 'id')
+
+    @property
+    def page_size(self):
+        return settings.SEARCH_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return settings.SEARCH_MAX_PAGE_SIZE
+
+    def paginate_search(self, request, words, kinds=None):
+        self.request = request
+        self.current_page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        return self.set_page(search.search(words, kinds, after=position, limit=self.current_page_size + 1))
+
+    def parse_position(self, values):
+        rank, kind, object_id = values
+        if not isinstance(rank, (int, float)) or not isinstance(kind, int) or not isinstance(object_id, int):
+            raise ValueError
+        return [float(rank), kind, object_id]
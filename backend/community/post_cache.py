@@ -0,0 +1,121 @@
+"""
+Rendered-response cache for post detail.
+
+Each post has a version counter in the cache. Cached responses are keyed by
+post id and version, so writes never have to find and delete rendered
+entries: bumping the version makes them unreachable and they simply expire.
+Versions are bumped by the post, comment and like signals, both right away and
+again once the transaction commits, so a read racing the commit cannot cache
+the pre-commit thread under the new version.
+
+Versions have to be seen by every process, so the cache is only used with a
+shared cache backend (POST_DETAIL_CACHE, see community/checks.py). Without it
+post detail is built on every request and carries no ETag.
+
+Responses carry the viewer's `liked_by_me` flags, so each viewer has its own
+entries. The viewer's own likes bump the version like anyone else's. Entries
+are also kept per negotiated media type, as `application/json; indent=4`
+renders differently from plain JSON.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Comment, Post
+
+
+def is_enabled():
+    return settings.POST_DETAIL_CACHE
+
+
+def _version_key(post_id):
+    return f'post-detail:{post_id}:version'
+
+
+def get_version(post_id):
+    version = cache.get(_version_key(post_id))
+    if version is None:
+        # Start from the clock rather than 1, so that a version evicted from
+        # the cache can never come back as one an old response was stored under
+        cache.add(_version_key(post_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(post_id))
+    return version
+
+
+async def aget_version(post_id):
+    version = await cache.aget(_version_key(post_id))
+    if version is None:
+        await cache.aadd(_version_key(post_id), time.time_ns(), timeout=None)
+        version = await cache.aget(_version_key(post_id))
+    return version
+
+
+def _bump(post_id):
+    try:
+        cache.incr(_version_key(post_id))
+    except ValueError:
+        cache.set(_version_key(post_id), time.time_ns(), timeout=None)
+
+
+def invalidate(post_ids):
+    if not is_enabled():
+        return
+    post_ids = set(post_ids)
+    for post_id in post_ids:
+        _bump(post_id)
+    transaction.on_commit(lambda: [_bump(post_id) for post_id in post_ids])
+
+
+def post_ids_for_likes(likes):
+    """Map the (model, id) of each liked object to the id of its post."""
+    targets = {like.target_key for like in likes}
+    post_ids = {key: key[1] for key in targets if key[0] is Post}
+    comment_ids = {object_id for model, object_id in targets if model is Comment}
+    if comment_ids:
+        for comment_id, post_id in Comment.objects.filter(id__in=comment_ids).values_list('id', 'post_id'):
+            post_ids[(Comment, comment_id)] = post_id
+    return post_ids
+
+
+def _variant(request, viewer):
+    # Links in the response are absolute and depend on the query string.
+    # Async views skip content negotiation and always render plain JSON.
+    viewer_id = viewer.id if viewer is not None else ''
+    media_type = getattr(request, 'accepted_media_type', 'application/json')
+    return hashlib.md5(
+        f'{media_type}|{request.get_host()}?{request.GET.urlencode()}#{viewer_id}'.encode()
+    ).hexdigest()
+
+
+def etag(request, post_id, version, viewer=None):
+    return f'"{post_id}-{version}-{_variant(request, viewer)[:12]}"'
+
+
+def response_headers(request, post_id, version, viewer=None):
+    return {
+        'ETag': etag(request, post_id, version, viewer),
+        'Cache-Control': f'max-age={settings.POST_DETAIL_MAX_AGE}, must-revalidate',
+    }
+
+
+def _response_key(request, post_id, version, viewer):
+    return f'post-detail:{post_id}:{version}:{_variant(request, viewer)}'
+
+
+def get_response(request, post_id, version, viewer=None):
+    return cache.get(_response_key(request, post_id, version, viewer))
+
+
+def set_response(request, post_id, version, content, viewer=None):
+    cache.set(_response_key(request, post_id, version, viewer), content, timeout=settings.POST_DETAIL_CACHE_SECONDS)
+
+
+async def aget_response(request, post_id, version, viewer=None):
+    return await cache.aget(_response_key(request, post_id, version, viewer))
+
+
+async def aset_response(request, post_id, version, content, viewer=None):
+    await cache.aset(_response_key(request, post_id, version, viewer), content, timeout=settings.POST_DETAIL_CACHE_SECONDS)
@@ -0,0 +1,193 @@
+"""
+"My rank": a user's place on a leaderboard and the users around it.
+
+Ranking every user on each request would cost a full scoring and sort of the
+window. Instead each process keeps, per leaderboard window, an in-memory
+RankIndex: every user with karma in the window, ordered by (-score, user_id)
+as karma._rank orders them. It is
+
+- built from the karma ledger (karma.window_scores) the first time a window
+  is asked for, and rebuilt once older than LEADERBOARD_RANK_SECONDS, which
+  picks up likes handled by other processes and likes that have slid out of
+  the window;
+- updated in between by the likes this process records, once their
+  transaction commits (see signals.apply_likes).
+
+So ranks lag the ledger by at most LEADERBOARD_RANK_SECONDS, like the
+leaderboard snapshots. A rank lookup is a binary search and the neighbourhood
+a slice; moving a user whose score changed is O(sqrt(n)) for n ranked users.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import karma
+from .models import User
+
+# Target length of the sublists of SortedKeys
+LOAD = 1000
+
+_indexes = {}  # window -> RankIndex
+_lock = threading.Lock()
+
+
+class SortedKeys:
+    """
+    A sorted list of keys with positional access, split into sublists of up
+    to 2 * LOAD keys so that inserts and removals only shift one sublist.
+    """
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._lists = [keys[start:start + LOAD] for start in range(0, len(keys), LOAD)]
+        self._maxes = [sublist[-1] for sublist in self._lists]
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+        else:
+            i = min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+            sublist = self._lists[i]
+            insort(sublist, key)
+            self._maxes[i] = sublist[-1]
+            if len(sublist) > 2 * LOAD:
+                self._lists[i:i + 1] = [sublist[:LOAD], sublist[LOAD:]]
+                self._maxes[i:i + 1] = [sublist[LOAD - 1], sublist[-1]]
+        self._len += 1
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        sublist = self._lists[i]
+        del sublist[bisect_left(sublist, key)]
+        if sublist:
+            self._maxes[i] = sublist[-1]
+        else:
+            del self._lists[i], self._maxes[i]
+        self._len -= 1
+
+    def index(self, key):
+        """Position of `key`, which must be present."""
+        i = bisect_left(self._maxes, key)
+        return sum(len(sublist) for sublist in self._lists[:i]) + bisect_left(self._lists[i], key)
+
+    def islice(self, start, stop):
+        """The keys at positions [start, stop)."""
+        for sublist in self._lists:
+            if start >= len(sublist):
+                start -= len(sublist)
+                stop -= len(sublist)
+                continue
+            yield from islice(sublist, start, max(start, min(stop, len(sublist))))
+            stop -= len(sublist)
+            start = 0
+            if stop <= 0:
+                return
+
+
+class RankIndex:
+    """Users with karma in one window, best first."""
+
+    def __init__(self, scores, built_at=None):
+        self.scores = {user_id: score for user_id, score in scores.items() if score > 0}
+        self.order = SortedKeys((-score, user_id) for user_id, score in self.scores.items())
+        self.built_at = built_at
+
+    @classmethod
+    def build(cls, window):
+        built_at = time.monotonic()
+        since = timezone.now() - timedelta(hours=settings.LEADERBOARD_WINDOWS[window])
+        return cls(karma.window_scores(since), built_at=built_at)
+
+    def __len__(self):
+        return len(self.order)
+
+    def add(self, user_id, points):
+        old = self.scores.pop(user_id, 0)
+        if old > 0:
+            self.order.remove((-old, user_id))
+        new = old + points
+        if new > 0:
+            self.scores[user_id] = new
+            self.order.add((-new, user_id))
+
+    def rank(self, user_id):
+        """1-based rank of `user_id`, or None without karma in the window."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.order.index((-score, user_id)) + 1
+
+    def around(self, user_id, k):
+        """
+        [(rank, score, user_id)] of the users up to `k` places above and below
+        `user_id`, the user included. Users without karma sit below everyone
+        ranked, so theirs are the last `k` ranked users.
+        """
+        rank = self.rank(user_id)
+        position = rank - 1 if rank is not None else len(self)
+        start = max(position - k, 0)
+        keys = self.order.islice(start, position + k + 1)
+        return [(start + offset + 1, -score, user) for offset, (score, user) in enumerate(keys)]
+
+
+def get_index(window):
+    """The RankIndex of `window` in this process, rebuilt when older than LEADERBOARD_RANK_SECONDS."""
+    with _lock:
+        index = _indexes.get(window)
+        if index is None or time.monotonic() - index.built_at >= settings.LEADERBOARD_RANK_SECONDS:
+            index = _indexes[window] = RankIndex.build(window)
+        return index
+
+
+def record(events):
+    """
+    Apply karma events [(user_id, points, created_at)] to the indexes built
+    in this process, once the current transaction commits.
+    """
+    def apply():
+        now = timezone.now()
+        with _lock:
+            for window, index in _indexes.items():
+                since = now - timedelta(hours=settings.LEADERBOARD_WINDOWS[window])
+                for user_id, points, created_at in events:
+                    if created_at >= since:
+                        index.add(user_id, points)
+    if events:
+        transaction.on_commit(apply)
+
+
+def neighbourhood(user, window, k):
+    """
+    (rank, users) of `user` on the leaderboard of `window`: its 1-based rank
+    (None without karma in the window) and the users up to `k` places above
+    and below it, each annotated with `.rank` and `.score`.
+    """
+    index = get_index(window)
+    rank = index.rank(user.id)
+    around = index.around(user.id, k)
+    users = User.objects.in_bulk([user_id for _, _, user_id in around if user_id != user.id])
+    users[user.id] = user
+    neighbours = []
+    for user_rank, score, user_id in around:
+        # Users deleted since the index was built are left out
+        if user_id in users:
+            neighbour = users[user_id]
+            neighbour.rank, neighbour.score = user_rank, score
+            neighbours.append(neighbour)
+    return rank, neighbours
+
+
+def reset():
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,45 @@
+"""
+JSON rendering of API responses.
+
+FastJSONRenderer is DRF's JSONRenderer with orjson as the encoder, which
+writes UTF-8 bytes straight from dicts and lists several times faster than
+the stdlib encoder on large feeds and threads. Datetimes and the values
+orjson does not know (lazy translation strings, decimals) go through DRF's
+encoder, so the output is byte for byte JSONRenderer's. Without orjson
+installed, or when the client asks for indentation, it is JSONRenderer.
+
+API_JSON_RENDERER picks the renderer of the API: DRF views, the async views
+and streamed lists (community/streaming.py) all render with
+`json_renderer()`.
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        content = orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # Escaped by JSONRenderer, as they end JavaScript string literals
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+def json_renderer():
+    return import_string(settings.API_JSON_RENDERER)()
@@ -0,0 +1,157 @@
+"""
+Read-replica routing.
+
+Replicas are configured with DATABASE_REPLICA_URLS (see playto/settings.py)
+and become the database aliases listed in DATABASE_REPLICAS. ReplicaRouter
+sends every write to the primary. Reads go to a replica only inside
+`replica_reads()`, which ReplicaRoutingMixin enters for the safe actions a
+view lists in `replica_actions`. Everything else reads from the primary.
+A `replica_reads()` block picks its replica on its first read and keeps it,
+so the queries of one request see a single snapshot.
+
+Replicas lag behind the primary, so:
+
+- a client that has just written is pinned to the primary for
+  REPLICA_PIN_SECONDS (a cookie set on successful writes), so it reads its
+  own writes. The frontend is usually on another site than the API, and
+  browsers only send a cross-site cookie that is `SameSite=None; Secure`,
+  so that is the default outside DEBUG (REPLICA_PIN_SAMESITE). Local
+  development serves both from localhost, which is the same site, over
+  plain http, where `Lax` works;
+- `primary()` forces primary reads where a stale read would be cached and
+  outlive the lag, like post detail responses stored under a new version.
+
+A replica that fails to connect is skipped for REPLICA_RETRY_SECONDS, then
+tried again. With none left, reads fall back to the primary.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# None outside replica_reads(), else {'alias': ...} once the block has chosen
+_replica = ContextVar('replica', default=None)
+_unavailable = {}  # alias -> monotonic time to try it again
+_lock = threading.Lock()
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica.set({} if enabled else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def primary():
+    return replica_reads(False)
+
+
+def wants_replica(request, allowed=True):
+    """Whether `request` may read from a replica."""
+    return (
+        allowed
+        and bool(settings.DATABASE_REPLICAS)
+        and request.method in SAFE_METHODS
+        and PIN_COOKIE not in request.COOKIES
+    )
+
+
+def pin_to_primary(request, response):
+    """After a successful write, keep the client on the primary while replicas catch up."""
+    if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+        samesite = settings.REPLICA_PIN_SAMESITE
+        # Browsers drop SameSite=None cookies that are not Secure
+        secure = samesite == 'None' or request.is_secure()
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite=samesite, secure=secure,
+        )
+    return response
+
+
+def mark_available(alias, available=True):
+    with _lock:
+        if available:
+            _unavailable.pop(alias, None)
+        else:
+            _unavailable[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def _is_available(alias):
+    with _lock:
+        retry_at = _unavailable.get(alias)
+    if retry_at is not None and retry_at > time.monotonic():
+        return False
+    try:
+        # A no-op on an open connection, a connect (or pool checkout) otherwise
+        connections[alias].ensure_connection()
+    except Exception as exc:
+        logger.warning("Replica %s unavailable, reading from the primary: %s", alias, exc)
+        mark_available(alias, False)
+        return False
+    mark_available(alias)
+    return True
+
+
+def choose_replica():
+    """A random available replica, or the primary when there is none."""
+    candidates = list(settings.DATABASE_REPLICAS)
+    random.shuffle(candidates)
+    for alias in candidates:
+        if _is_available(alias):
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        chosen = _replica.get()
+        if chosen is None or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if 'alias' not in chosen:
+            chosen['alias'] = choose_replica()
+        return chosen['alias']
+
+    def db_for_write(self, model, **hints):
+        # Explicitly, so instances read from a replica are saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMixin:
+    """
+    Routes the reads of the actions in `replica_actions` to a replica.
+
+    ViewSets are matched by action name, other views by (lowercase) method.
+    """
+    replica_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        action_map = getattr(self, 'action_map', None)
+        action = action_map.get(method) if action_map else method
+        with replica_reads(wants_replica(request, action in self.replica_actions)):
+            response = super().dispatch(request, *args, **kwargs)
+        return pin_to_primary(request, response)
@@ -0,0 +1,119 @@
+"""
+Full-text search over posts and comments (`/api/search/`).
+
+Each database searches with its native index, created by migration
+0011_search_index rather than declared on the models:
+
+- SQLite: one FTS5 table per model (community_post_search,
+  community_comment_search) over `content`, with the porter stemmer. They are
+  external-content tables, so the text is not stored twice, and triggers
+  update them on every insert, update and delete of a row, including bulk
+  inserts and imports that skip model signals.
+- PostgreSQL: a GIN index on to_tsvector('english', content) of each table,
+  which the database maintains itself.
+
+A query matches the posts and comments containing all of its words (after
+stemming). Hits of both models are ranked together by relevance (bm25 on
+SQLite, ts_rank on PostgreSQL, negated so that lower is better on both) and
+paged by keyset on (rank, kind, id): each page is one index lookup, whose cost
+grows with the number of matching rows rather than with the size of the
+tables. `rebuild` rebuilds the indexes from the tables; run it with
+`manage.py rebuild_search_index`.
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import NotSupportedError, connections, router
+
+from .models import Post, Comment
+
+# Searchable models; a hit's `kind` is the index of its model here
+MODELS = [Post, Comment]
+# Text search configuration of the PostgreSQL indexes
+POSTGRES_CONFIG = 'english'
+WORD = re.compile(r'\w+')
+
+Hit = namedtuple('Hit', ['rank', 'kind', 'id'])
+
+
+def terms(query):
+    """The words of a search query. Anything else, search operators included, is ignored."""
+    return WORD.findall(query.lower())[:settings.SEARCH_MAX_TERMS]
+
+
+def index_name(model):
+    return f'{model._meta.db_table}_search'
+
+
+def _sqlite_hits(model, kind, words):
+    index = index_name(model)
+    # Quoted, every word is a plain term; terms separated by spaces must all match
+    match = ' '.join(f'"{word}"' for word in words)
+    return f"SELECT %s AS kind, rowid AS id, rank FROM {index} WHERE {index} MATCH %s", [kind, match]
+
+
+def _postgres_hits(model, kind, words):
+    # The same expression as the index, or the index is not used. ts_rank is a
+    # real; as a double it round-trips through cursors exactly.
+    document = f"to_tsvector('{POSTGRES_CONFIG}', content)"
+    return (
+        f"SELECT %s AS kind, id, -ts_rank({document}, query)::float8 AS rank "
+        f"FROM {model._meta.db_table}, plainto_tsquery('{POSTGRES_CONFIG}', %s) query "
+        f"WHERE {document} @@ query"
+    ), [kind, ' '.join(words)]
+
+
+HIT_QUERIES = {'sqlite': _sqlite_hits, 'postgresql': _postgres_hits}
+
+
+def search(words, kinds=None, after=None, limit=20):
+    """
+    Hits for `words` among the models of `kinds` (default: all), best first.
+
+    `after` is the (rank, kind, id) of the last hit of the previous page.
+    """
+    connection = connections[router.db_for_read(Post)]
+    hits_query = HIT_QUERIES.get(connection.vendor)
+    if hits_query is None:
+        raise NotSupportedError(f"Full-text search is not available on {connection.vendor}")
+
+    parts, params = [], []
+    for kind, model in enumerate(MODELS):
+        if kinds is None or kind in kinds:
+            sql, part_params = hits_query(model, kind, words)
+            parts.append(sql)
+            params += part_params
+    sql = f"SELECT rank, kind, id FROM ({' UNION ALL '.join(parts)}) hits"
+    if after is not None:
+        sql += " WHERE (rank, kind, id) > (%s, %s, %s)"
+        params += list(after)
+    sql += " ORDER BY rank, kind, id LIMIT %s"
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return [Hit(*row) for row in cursor.fetchall()]
+
+
+def load(hits):
+    """The posts and comments of `hits`, in order, with their authors. Hits deleted since are skipped."""
+    found = {}
+    for kind, model in enumerate(MODELS):
+        ids = [hit.id for hit in hits if hit.kind == kind]
+        if ids:
+            found[kind] = model.objects.select_related('author').in_bulk(ids)
+    return [found[hit.kind][hit.id] for hit in hits if hit.id in found.get(hit.kind, {})]
+
+
+def rebuild():
+    """Rebuild the full-text indexes of every model from its table."""
+    connection = connections[router.db_for_write(Post)]
+    with connection.cursor() as cursor:
+        for model in MODELS:
+            index = index_name(model)
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f"REINDEX INDEX CONCURRENTLY {index}")
+            else:
+                raise NotSupportedError(f"Full-text search is not available on {connection.vendor}")
@@ -1,50 +1,103 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import User, Post, Comment, Like
-from django.contrib.contenttypes.models import ContentType
+from . import instrumentation, threads
+from .models import User, Post, Comment, LIKE_MODELS
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with instrumentation.serializing():
+            return super().data
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer whose `.data` counts as serialization time in the
+    request's metrics (see community/instrumentation.py), with many=True too.
+    Subclasses set `list_serializer_class = TimedListSerializer` in their Meta.
+    """
+    @property
+    def data(self):
+        with instrumentation.serializing():
+            return super().data
+
+class UserSerializer(TimedModelSerializer):
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'username']
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedModelSerializer):
     author = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
+    replies_next = serializers.SerializerMethodField()
     likes_count = serializers.IntegerField(read_only=True, default=0)
+    reply_count = serializers.IntegerField(read_only=True, default=0)
+    # Set by the views, see community/liked.py
+    liked_by_me = serializers.BooleanField(read_only=True, default=False)
 
     class Meta:
         model = Comment
-        fields = ['id', 'author', 'post', 'parent', 'content', 'created_at', 'likes_count', 'replies']
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'author', 'post', 'parent', 'content', 'created_at', 'likes_count', 'liked_by_me', 'reply_count', 'replies', 'replies_next']
         extra_kwargs = {
             'post': {'write_only': True},
             'parent': {'write_only': True},
         }
 
+    def validate_parent(self, parent):
+        # Deeper paths would not fit Comment.path
+        if parent is not None:
+            height = threads.subtree_height(self.instance) if self.instance is not None else 0
+            if parent.depth + 1 + height > threads.MAX_DEPTH:
+                raise serializers.ValidationError(f"Replies can be nested at most {threads.MAX_DEPTH} levels deep.")
+        return parent
+
     def get_replies(self, obj):
         # We expect the view to have populated `_replies` list on the object to avoid N+1
         if hasattr(obj, '_replies'):
             return CommentSerializer(obj._replies, many=True).data
         return []
 
-class PostSerializer(serializers.ModelSerializer):
+    def get_replies_next(self, obj):
+        # Set by ThreadPagination when only some of the replies were loaded
+        return getattr(obj, '_replies_next', None)
+
+class PostSerializer(TimedModelSerializer):
     author = UserSerializer(read_only=True)
     likes_count = serializers.IntegerField(read_only=True)
+    # Set by the views, see community/liked.py
+    liked_by_me = serializers.BooleanField(read_only=True, default=False)
 
     class Meta:
         model = Post
-        fields = ['id', 'author', 'content', 'created_at', 'likes_count']
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'author', 'content', 'created_at', 'likes_count', 'liked_by_me']
 
 class PostDetailSerializer(PostSerializer):
     comments = serializers.SerializerMethodField()
+    comments_next = serializers.SerializerMethodField()
 
     class Meta(PostSerializer.Meta):
-        fields = PostSerializer.Meta.fields + ['comments']
+        fields = PostSerializer.Meta.fields + ['comments', 'comments_next']
 
     def get_comments(self, obj):
-        # The view should provide the root comments with their children pre-attached
-        if hasattr(obj, '_precomputed_comments'):
-            return CommentSerializer(obj._precomputed_comments, many=True).data
-        return []
+        # The view provides the thread already rendered by threads.render_tree,
+        # which builds the same JSON as CommentSerializer without a serializer per node
+        return getattr(obj, '_precomputed_comments', [])
+
+    def get_comments_next(self, obj):
+        # Link to the next page of top-level comments, if any
+        return getattr(obj, '_comments_next', None)
+
+class CommentListSerializer(TimedModelSerializer):
+    # A comment outside its thread (listings, search hits): no replies, but the post and parent to open it in
+    author = UserSerializer(read_only=True)
+    liked_by_me = serializers.BooleanField(read_only=True, default=False)
+
+    class Meta:
+        model = Comment
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'author', 'post', 'parent', 'content', 'created_at', 'likes_count', 'liked_by_me']
 
 class LikeSerializer(serializers.Serializer):
     type = serializers.ChoiceField(choices=['post', 'comment'])
@@ -66,19 +119,32 @@ class LikeSerializer(serializers.Serializer):
         except model.DoesNotExist:
             raise serializers.ValidationError("Object not found")
             
-        content_type = ContentType.objects.get_for_model(model)
-        
         # We will handle concurrency in the view, but creation logic is here or in view.
         # Let's just return the data needed for the view to create it.
         return {
             'user': user,
-            'content_type': content_type,
+            'like_model': LIKE_MODELS[model],
             'object_id': obj.id
         }
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LikeOperationSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['post', 'comment'])
+    id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['like', 'unlike'], default='like')
+
+class BulkLikeSerializer(serializers.Serializer):
+    items = LikeOperationSerializer(many=True, allow_empty=False, max_length=settings.LIKES_BULK_MAX_ITEMS)
+
+class LeaderboardSerializer(TimedModelSerializer):
     score = serializers.IntegerField()
     
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'username', 'score']
+
+class RankedUserSerializer(LeaderboardSerializer):
+    rank = serializers.IntegerField()
+
+    class Meta(LeaderboardSerializer.Meta):
+        fields = ['rank'] + LeaderboardSerializer.Meta.fields
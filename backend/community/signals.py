@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counters, events, hot, karma, post_cache, ranks, threads, users
+from .models import User, Post, Comment, PostLike, CommentLike
+
+
+# Set while community.likes applies a batch, which handles derived data itself
+_batching = ContextVar('batching_likes', default=False)
+
+
+@contextmanager
+def batched_likes():
+    """Skip per-row like signal handling; the caller must call apply_likes for the batch."""
+    token = _batching.set(True)
+    try:
+        yield
+    finally:
+        _batching.reset(token)
+
+
+def apply_likes(likes, sign=1):
+    # Everything derived from like rows (of any like model): like counters, the karma ledger
+    # and rank indexes, cached post detail responses and live events
+    counters.adjust_like_counts(likes, sign)
+    ranks.record(karma.record_likes(likes, sign))
+    post_ids = post_cache.post_ids_for_likes(likes)
+    post_cache.invalidate(set(post_ids.values()))
+    events.publish_likes(likes, sign, post_ids)
+
+
+@receiver(pre_save, sender=PostLike)
+@receiver(pre_save, sender=CommentLike)
+def remember_like_target(sender, instance, raw=False, **kwargs):
+    # Re-saving a like can move it to another hour (or target); remember the
+    # stored row so post_save can move its karma along with it.
+    if raw or instance._state.adding or _batching.get():
+        return
+    instance._stored = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=PostLike)
+@receiver(post_save, sender=CommentLike)
+def like_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or _batching.get():
+        return
+    if created:
+        apply_likes([instance])
+        return
+
+    stored = instance.__dict__.pop('_stored', None)
+    if stored is None:
+        return
+    moved = stored.created_at != instance.created_at or stored.target_id != instance.target_id
+    if moved:
+        apply_likes([stored], sign=-1)
+        apply_likes([instance])
+
+
+@receiver(pre_delete, sender=PostLike)
+@receiver(pre_delete, sender=CommentLike)
+def like_deleted(sender, instance, **kwargs):
+    # pre_delete so the liked post/comment still exists when the Like is
+    # removed as part of a cascade
+    if not _batching.get():
+        apply_likes([instance], sign=-1)
+
+
+def _adjust_reply_count(comment_id, delta):
+    if comment_id is not None:
+        Comment.objects.filter(pk=comment_id).update(reply_count=F('reply_count') + delta)
+
+
+def _adjust_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        hot_score=hot.adjusted(comments=delta),
+        comments_count=F('comments_count') + delta,
+    )
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_parent(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._stored = Comment.objects.filter(pk=instance.pk).values('parent_id', 'path').first()
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        threads.assign_path(instance)
+        _adjust_reply_count(instance.parent_id, 1)
+        _adjust_comments_count(instance.post_id, 1)
+        events.publish_comment(instance)
+        return
+
+    stored = instance.__dict__.pop('_stored', None)
+    if stored is not None and stored['parent_id'] != instance.parent_id:
+        threads.move_subtree(instance, old_path=stored['path'])
+        _adjust_reply_count(stored['parent_id'], -1)
+        _adjust_reply_count(instance.parent_id, 1)
+
+
+@receiver(pre_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    _adjust_reply_count(instance.parent_id, -1)
+    _adjust_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        post_cache.invalidate([instance.post_id])
+
+
+@receiver(pre_save, sender=Post)
+def score_new_post(sender, instance, raw=False, **kwargs):
+    # created_at is only set while saving; now is within microseconds of it
+    if not raw and instance._state.adding:
+        instance.hot_score = hot.score(timezone.now(), instance.likes_count, instance.comments_count)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        post_cache.invalidate([instance.id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    users.evict(instance)
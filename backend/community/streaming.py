@@ -0,0 +1,96 @@
+"""
+Streamed list responses (`?stream=true`).
+
+A paginated list holds one page in memory, but a client that wants a whole
+feed has to walk it page by page. With ?stream=true, list endpoints send
+every row from the cursor on, in the requested ordering, as one
+`{"results": [...]}` response. The rows are read with `.iterator()` and
+marked, serialized and encoded STREAM_CHUNK_SIZE at a time, and each chunk is
+sent before the next one is read, so peak memory stays flat however many rows
+there are.
+
+The rows are read while the body is sent, after the view has returned: from
+the database the view would have read from (a replica, for safe reads), and
+outside the view's query budget. Under ASGI the body is an async iterator
+(the async ORM reads the rows): Django would buffer a sync one whole before
+sending it.
+"""
+import itertools
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import StreamingHttpResponse
+
+from . import liked, users
+from .renderers import json_renderer
+
+
+def stream_results(queryset, serialize, chunk_size):
+    """The bytes of `{"results": [...]}` over `queryset`; `serialize` turns a chunk of rows into dicts."""
+    renderer = json_renderer()
+    rows = queryset.iterator(chunk_size=chunk_size)
+    yield b'{"results":['
+    separator = b''
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        # The chunk rendered as a list, without its brackets
+        yield separator + renderer.render(serialize(chunk))[1:-1]
+        separator = b','
+    yield b']}'
+
+
+async def astream_results(queryset, serialize, chunk_size):
+    """stream_results for ASGI: `serialize` is a coroutine function."""
+    renderer = json_renderer()
+    yield b'{"results":['
+    separator = b''
+    chunk = []
+    async for row in queryset.aiterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield separator + renderer.render(await serialize(chunk))[1:-1]
+            separator, chunk = b',', []
+    if chunk:
+        yield separator + renderer.render(await serialize(chunk))[1:-1]
+    yield b']}'
+
+
+class StreamingListMixin:
+    """
+    ?stream=true on a ViewSet's list action (JSON only). Keyset paginated
+    lists stream in their page ordering, from `cursor` if one is given;
+    others in primary key order.
+    """
+    stream_query_param = 'stream'
+
+    def list(self, request, *args, **kwargs):
+        streamed = request.query_params.get(self.stream_query_param) in ('1', 'true')
+        if streamed and request.accepted_renderer.format == 'json':
+            return self.stream_list(request)
+        return super().list(request, *args, **kwargs)
+
+    def stream_list(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        if hasattr(self.paginator, 'ordered_queryset'):
+            queryset = self.paginator.ordered_queryset(queryset, request)
+        elif not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        # Resolved now, while the view's replica routing applies
+        queryset = queryset.using(router.db_for_read(queryset.model))
+
+        viewer = users.viewer(request)
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+
+        def serialize(rows):
+            # One liked_by_me lookup per chunk
+            return serializer_class(liked.mark(viewer, rows), many=True, context=context).data
+
+        async def aserialize(rows):
+            return serializer_class(await liked.amark(viewer, rows), many=True, context=context).data
+
+        if isinstance(request._request, ASGIRequest):
+            content = astream_results(queryset, aserialize, settings.STREAM_CHUNK_SIZE)
+        else:
+            content = stream_results(queryset, serialize, settings.STREAM_CHUNK_SIZE)
+        return StreamingHttpResponse(content, content_type='application/json')
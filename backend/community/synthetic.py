@@ -0,0 +1,174 @@
+"""
+Deterministic synthetic community data for load tests and benchmarks.
+
+The same arguments and seed always produce the same users, posts, comment
+trees and likes; only the timestamps move, since they are spread over the
+`days` before now so the leaderboard windows have data. Popularity is skewed:
+post and user weights follow a Zipf-like power law, so a few posts collect
+most comments and likes, as on a real feed.
+
+Everything is written with bulk inserts, which skip model signals, so the
+derived data (paths, counters, hot scores, karma ledger) is computed here
+or rebuilt at the end.
+"""
+import bisect
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import hot, karma, threads
+from .models import User, Post, Comment, PostLike, CommentLike
+
+BATCH_SIZE = 5000
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk inserts keep the created_at values they were given."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Sampler:
+    """Weighted random choice of indexes, with power-law (Zipf-like) weights."""
+
+    def __init__(self, rng, size, skew):
+        ranks = list(range(1, size + 1))
+        # Shuffle ranks so popularity doesn't follow creation order
+        rng.shuffle(ranks)
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / rank ** skew for rank in ranks))
+
+    def __call__(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return min(bisect.bisect_left(self.cumulative, point), len(self.cumulative) - 1)
+
+
+def _after(rng, start, end, bias=1):
+    # A moment between start and end, closer to start for bias > 1
+    return start + (end - start) * rng.random() ** bias
+
+
+def generate(users=1000, posts=10_000, comments=50_000, likes=200_000, max_depth=8,
+             reply_ratio=0.6, comment_like_ratio=0.4, skew=1.1, days=30, seed=0,
+             prefix='user', log=None):
+    """
+    Insert a synthetic community and rebuild everything derived from it.
+
+    Returns the number of rows created per model.
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    max_depth = min(max_depth, threads.MAX_DEPTH)
+
+    # Plan everything in memory first, so counters are known up front and rows
+    # can be inserted in dependency order (parents before replies)
+    active_user = Sampler(rng, users, skew)
+    popular_post = Sampler(rng, posts, skew)
+
+    post_rows = [(active_user(), _after(rng, start, now)) for _ in range(posts)]
+    post_comments = [[] for _ in range(posts)]
+    comment_rows = []  # (author, post, parent index, depth, created_at)
+    for _ in range(comments):
+        post = popular_post()
+        parent = None
+        siblings = post_comments[post]
+        if siblings and rng.random() < reply_ratio:
+            parent = rng.choice(siblings)
+            if comment_rows[parent][3] >= max_depth:
+                parent = None
+        after = comment_rows[parent][4] if parent is not None else post_rows[post][1]
+        depth = comment_rows[parent][3] + 1 if parent is not None else 0
+        siblings.append(len(comment_rows))
+        comment_rows.append((active_user(), post, parent, depth, _after(rng, after, now, bias=3)))
+
+    reply_counts = [0] * len(comment_rows)
+    for _, _, parent, _, _ in comment_rows:
+        if parent is not None:
+            reply_counts[parent] += 1
+
+    liked = set()
+    like_rows = []  # (user, is_comment, target index, created_at)
+    attempts = 0
+    while len(like_rows) < likes and attempts < likes * 10:
+        attempts += 1
+        user, post = active_user(), popular_post()
+        target = (False, post)
+        if post_comments[post] and rng.random() < comment_like_ratio:
+            target = (True, rng.choice(post_comments[post]))
+        if (user, target) in liked:
+            continue
+        liked.add((user, target))
+        created = comment_rows[target[1]][4] if target[0] else post_rows[post][1]
+        like_rows.append((user, *target, _after(rng, created, now, bias=2)))
+
+    post_likes = [0] * posts
+    comment_likes = [0] * len(comment_rows)
+    for _, is_comment, target, _ in like_rows:
+        (comment_likes if is_comment else post_likes)[target] += 1
+
+    with transaction.atomic(), explicit_timestamps(Post, Comment, PostLike, CommentLike):
+        password = make_password(None)
+        user_objs = User.objects.bulk_create(
+            [User(username=f'{prefix}{i}', password=password) for i in range(users)],
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = [user.id for user in user_objs]
+        log(f"{len(user_ids)} users")
+
+        post_ids = [post.id for post in Post.objects.bulk_create([
+            Post(author_id=user_ids[author], content=f"Post {i} by {prefix}{author}",
+                 created_at=created_at, likes_count=post_likes[i], comments_count=len(post_comments[i]),
+                 hot_score=hot.score(created_at, post_likes[i], len(post_comments[i])))
+            for i, (author, created_at) in enumerate(post_rows)
+        ], batch_size=BATCH_SIZE)]
+        log(f"{len(post_ids)} posts")
+
+        # One bulk insert per tree level, so every parent already has an id
+        comment_ids = [None] * len(comment_rows)
+        for depth in range(max_depth + 1):
+            level = [i for i, row in enumerate(comment_rows) if row[3] == depth]
+            if not level:
+                break
+            created = Comment.objects.bulk_create([
+                Comment(
+                    author_id=user_ids[comment_rows[i][0]],
+                    post_id=post_ids[comment_rows[i][1]],
+                    parent_id=comment_ids[comment_rows[i][2]] if depth else None,
+                    content=f"Comment {i} by {prefix}{comment_rows[i][0]}",
+                    created_at=comment_rows[i][4],
+                    likes_count=comment_likes[i],
+                    reply_count=reply_counts[i],
+                )
+                for i in level
+            ], batch_size=BATCH_SIZE)
+            for i, comment in zip(level, created):
+                comment_ids[i] = comment.id
+        threads.rebuild_paths()
+        log(f"{len(comment_rows)} comments")
+
+        for is_comment, like_model, target_ids in ((False, PostLike, post_ids), (True, CommentLike, comment_ids)):
+            rows = [row for row in like_rows if row[1] is is_comment]
+            like_model.objects.bulk_create([
+                like_model(user_id=user_ids[user], target_id=target_ids[target], created_at=created_at)
+                for user, _, target, created_at in rows
+            ], batch_size=BATCH_SIZE)
+        log(f"{len(like_rows)} likes")
+
+        buckets = karma.rebuild()
+        log(f"{buckets} karma buckets")
+
+    return {'users': users, 'posts': posts, 'comments': len(comment_rows), 'likes': len(like_rows)}
@@ -1,11 +1,35 @@
 from django.test import TestCase
 from django.utils import timezone
 from datetime import timedelta
-from .models import User, Post, Comment, Like
-from django.contrib.contenttypes.models import ContentType
+from io import StringIO
+import asyncio
+import base64
+import json
+import tempfile
+import time
+from collections import Counter
+from unittest import mock, skipUnless
+import gzip
+from django.db import connection, models, transaction
+from django.test.utils import CaptureQueriesContext
+from .models import User, Post, Comment, PostLike, CommentLike, KarmaBucket, PendingLike, LIKE_MODELS
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from . import checks, columnar, counters, renderers, events, hot, instrumentation, karma, karma_engine, leaderboard, like_queue, likes, ranks, replicas, search, synthetic, threads, users
+from .serializers import CommentSerializer, PostSerializer
+
+
+def encode_cursor(values):
+    """A pagination cursor holding arbitrary JSON `values`."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
 
 class LeaderboardTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.user1 = User.objects.create_user(username='alice')
         self.user2 = User.objects.create_user(username='bob')
         self.user3 = User.objects.create_user(username='charlie')
@@ -18,21 +42,18 @@ class LeaderboardTestCase(TestCase):
         Test that leaderboard only counts likes within the last 24 hours
         and assigns correct points (5 for post, 1 for comment).
         """
-        post_ct = ContentType.objects.get_for_model(Post)
-        comment_ct = ContentType.objects.get_for_model(Comment)
-        
         # User 1 receives a like on their post (5 points) - RECENT
-        Like.objects.create(user=self.user2, content_type=post_ct, object_id=self.post.id)
+        PostLike.objects.create(user=self.user2, target=self.post)
         
         # User 2 receives a like on their comment (1 point) - RECENT
-        Like.objects.create(user=self.user1, content_type=comment_ct, object_id=self.comment.id)
+        CommentLike.objects.create(user=self.user1, target=self.comment)
         
         # User 3 receives a like on a post, but it was > 24h ago (0 points for leaderboard)
         # Note: We need to mock created_at. Since auto_now_add=True, we must update it after creation or use raw SQL/mocking.
         # Django allows updating created_at if not editable=False? auto_now_add makes it editable=False in Admin but we can update it in code usually?
         # Actually auto_now_add fields are ignored in save(). We need to use update().
         post3 = Post.objects.create(author=self.user3, content="Old post")
-        l = Like.objects.create(user=self.user1, content_type=post_ct, object_id=post3.id)
+        l = PostLike.objects.create(user=self.user1, target=post3)
         l.created_at = timezone.now() - timedelta(hours=25)
         l.save()
         
@@ -41,7 +62,7 @@ class LeaderboardTestCase(TestCase):
         
         response = self.client.get('/api/leaderboard/')
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = response.json()['results']
         
         # Expected: 
         # Alice (User 1): 5 points (from post like)
@@ -97,3 +118,1447 @@ class LeaderboardTestCase(TestCase):
         self.assertEqual(root_comment['content'], "Root") 
         self.assertEqual(len(root_comment['replies']), 1)
         self.assertEqual(root_comment['replies'][0]['content'], "Child") 
+
+
+class KarmaLedgerTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+        self.comment = Comment.objects.create(author=self.bob, post=self.post, content="Nice post")
+
+    def ledger(self):
+        return dict(
+            KarmaBucket.objects.filter(points__gt=0).values_list('user__username').annotate(s=models.Sum('points'))
+        )
+
+    def test_likes_and_unlikes_update_ledger(self):
+        post_like = PostLike.objects.create(user=self.bob, target=self.post)
+        CommentLike.objects.create(user=self.alice, target=self.comment)
+        self.assertEqual(self.ledger(), {'alice': 5, 'bob': 1})
+
+        post_like.delete()
+        self.assertEqual(self.ledger(), {'bob': 1})
+
+        # Deleting the comment cascades to its likes and their karma
+        self.comment.delete()
+        self.assertEqual(self.ledger(), {})
+
+    def test_rebuild_matches_incremental_ledger(self):
+        PostLike.objects.create(user=self.bob, target=self.post)
+        old = CommentLike.objects.create(user=self.alice, target=self.comment)
+        old.created_at = timezone.now() - timedelta(days=3)
+        old.save()
+        expected = set(KarmaBucket.objects.filter(points__gt=0).values_list('user', 'bucket', 'points'))
+
+        KarmaBucket.objects.all().delete()
+        call_command('rebuild_karma', stdout=StringIO())
+
+        self.assertEqual(set(KarmaBucket.objects.values_list('user', 'bucket', 'points')), expected)
+
+    def test_window_counts_partial_first_hour_exactly(self):
+        since = karma.bucket_start(timezone.now()) - timedelta(hours=3) + timedelta(minutes=30)
+        inside = PostLike.objects.create(user=self.bob, target=self.post)
+        inside.created_at = since + timedelta(minutes=10)
+        inside.save()
+        outside = CommentLike.objects.create(user=self.alice, target=self.comment)
+        outside.created_at = since - timedelta(minutes=10)
+        outside.save()
+
+        # Both likes share the same hourly bucket, only one is in the window
+        self.assertEqual(dict(karma.window_scores(since)), {self.alice.id: 5})
+
+
+class LeaderboardSnapshotTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+        PostLike.objects.create(user=self.bob, target=self.post)
+
+    def test_snapshot_is_cached_and_supports_etags(self):
+        response = self.client.get('/api/leaderboard/?window=7d&limit=50')
+        data = response.json()
+        self.assertEqual((data['window'], data['limit']), ('7d', 50))
+        self.assertIn('generated_at', data)
+        self.assertEqual(data['results'][0]['score'], 5)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/leaderboard/?window=7d&limit=50')
+        self.assertEqual(cached.json(), data)
+
+        not_modified = self.client.get(
+            '/api/leaderboard/?window=7d&limit=50', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_rejects_unknown_window_and_limit(self):
+        self.assertEqual(self.client.get('/api/leaderboard/?window=2d').status_code, 400)
+        self.assertEqual(self.client.get('/api/leaderboard/?limit=7').status_code, 400)
+        self.assertEqual(self.client.get('/api/leaderboard/?limit=%C2%B2').status_code, 400)
+
+    @override_settings(LEADERBOARD_SNAPSHOT_SECONDS=0)
+    def test_stale_snapshot_served_while_another_worker_rebuilds(self):
+        stale = self.client.get('/api/leaderboard/').json()
+
+        PostLike.objects.create(user=self.alice, target=self.post)
+        cache.add('leaderboard:24h:5:lock', True)
+        self.assertEqual(self.client.get('/api/leaderboard/').json(), stale)
+
+        cache.delete('leaderboard:24h:5:lock')
+        self.assertEqual(self.client.get('/api/leaderboard/').json()['results'][0]['score'], 10)
+
+
+class LeaderboardRankTestCase(TestCase):
+    def setUp(self):
+        ranks.reset()
+        users.clear()
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(6)]
+        self.posts = [Post.objects.create(author=user, content="Hello") for user in self.users]
+        # user{i} has i post likes (5 points each)
+        for i, post in enumerate(self.posts):
+            for fan in self.users[:i]:
+                PostLike.objects.create(user=fan, target=post)
+
+    def test_index_ranks_like_the_leaderboard(self):
+        import random
+        rng = random.Random(3)
+        scores = {user_id: rng.randint(1, 40) for user_id in range(500)}
+        with mock.patch.object(ranks, 'LOAD', 8):
+            index = ranks.RankIndex(scores)
+            for _ in range(2000):
+                user_id = rng.randrange(600)
+                # Karma never goes below zero: only likes that were given can be taken back
+                points = rng.randint(-scores.get(user_id, 0), 30)
+                index.add(user_id, points)
+                scores[user_id] = scores.get(user_id, 0) + points
+        ranked = karma._rank(+Counter(scores), len(scores))
+        self.assertEqual(list(index.order.islice(0, len(index))), [(-score, user_id) for score, user_id in ranked])
+        for position, (score, user_id) in enumerate(ranked):
+            self.assertEqual(index.rank(user_id), position + 1)
+        self.assertIsNone(index.rank(10_000))
+
+        user_id = ranked[10][1]
+        self.assertEqual([(rank, user) for rank, _, user in index.around(user_id, 2)],
+                         [(rank + 1, ranked[rank][1]) for rank in range(8, 13)])
+        self.assertEqual([rank for rank, _, _ in index.around(ranked[0][1], 2)], [1, 2, 3])
+        self.assertEqual([rank for rank, _, _ in index.around(10_000, 2)], [len(ranked) - 1, len(ranked)])
+
+    def test_my_rank_and_neighbours(self):
+        data = self.client.get('/api/leaderboard/me/', {'username': 'user2', 'k': 1}).json()
+        self.assertEqual((data['window'], data['rank'], data['score']), ('24h', 4, 10))
+        self.assertEqual([(u['rank'], u['username'], u['score']) for u in data['results']],
+                         [(3, 'user3', 15), (4, 'user2', 10), (5, 'user1', 5)])
+
+        # No karma: unranked, below the last ranked users
+        data = self.client.get('/api/leaderboard/me/', {'username': 'user0', 'k': 2}).json()
+        self.assertEqual((data['rank'], data['score']), (None, 0))
+        self.assertEqual([u['username'] for u in data['results']], ['user2', 'user1'])
+
+        self.assertEqual(self.client.get('/api/leaderboard/me/').status_code, 400)
+        self.assertEqual(self.client.get('/api/leaderboard/me/', {'username': 'user1', 'k': 999}).status_code, 400)
+        self.assertEqual(self.client.get('/api/leaderboard/me/', {'username': 'user1', 'k': '²'}).status_code, 400)
+        # Once the index is built and the viewer known, only the neighbours are loaded
+        with instrumentation.query_budget(1):
+            self.client.get('/api/leaderboard/me/', {'username': 'user2', 'window': '24h'})
+
+    def test_likes_move_ranks_once_committed(self):
+        url = '/api/leaderboard/me/'
+        self.assertEqual(self.client.get(url, {'username': 'user1'}).json()['rank'], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.users[1:5]:
+                PostLike.objects.create(user=fan, target=self.posts[1])
+        # 25 points, tied with user5 and ranked before it by id
+        data = self.client.get(url, {'username': 'user5', 'k': 1}).json()
+        self.assertEqual((data['rank'], data['score']), (2, 25))
+        self.assertEqual([u['username'] for u in data['results']], ['user1', 'user5', 'user4'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PostLike.objects.filter(target=self.posts[1]).delete()
+        self.assertEqual(self.client.get(url, {'username': 'user1'}).json()['rank'], None)
+        self.assertEqual(self.client.get(url, {'username': 'user5'}).json()['rank'], 1)
+
+
+class LikeCounterTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+        self.comment = Comment.objects.create(author=self.bob, post=self.post, content="Nice post")
+
+    def test_like_endpoint_maintains_counters(self):
+        for username in ('alice', 'bob', 'bob'):
+            self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': username})
+        self.client.post('/api/likes/', {'type': 'comment', 'id': self.comment.id, 'username': 'alice'})
+
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.comment.likes_count), (2, 1))
+
+        PostLike.objects.filter(user=self.bob).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_feed_reads_counter_without_aggregate(self):
+        self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'bob'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/')
+        self.assertEqual(response.json()['results'][0]['likes_count'], 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+
+    def test_reconcile_repairs_drift(self):
+        self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'bob'})
+        Post.objects.update(likes_count=7)
+        Comment.objects.update(likes_count=3)
+
+        call_command('reconcile_like_counts', stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.comment.likes_count), (1, 0))
+
+    def test_reconcile_keeps_likes_committed_meanwhile(self):
+        Post.objects.update(likes_count=7)
+        read = list(counters.drift(Post))
+        self.assertEqual(read, [(self.post.id, -7)])
+        # A like lands between reading the drift and fixing it
+        self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'bob'})
+        with mock.patch.object(counters, 'drift', return_value=iter(read)):
+            self.assertEqual(counters.reconcile(Post), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+
+@override_settings(FEED_PAGE_SIZE=3)
+class FeedPaginationTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        posts = [Post.objects.create(author=self.alice, content=f"Post {i}") for i in range(7)]
+        # Force ties on created_at so the id tie-breaker matters
+        same_time = timezone.now()
+        Post.objects.filter(id__in=[p.id for p in posts[2:5]]).update(created_at=same_time)
+        self.expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_walks_every_post_exactly_once(self):
+        seen = []
+        url = '/api/posts/'
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_page_size_defaults_and_is_capped(self):
+        self.assertEqual(len(self.client.get('/api/posts/').json()['results']), 3)
+        with self.settings(FEED_MAX_PAGE_SIZE=5):
+            data = self.client.get('/api/posts/?page_size=1000').json()
+        self.assertEqual(len(data['results']), 5)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/posts/?cursor=not-a-cursor').status_code, 404)
+
+    def test_null_and_nested_cursors_are_rejected(self):
+        for values in ([None, None], [[1], 2], [{'a': 1}, 2]):
+            for url, params in (
+                ('/api/posts/', {}),
+                ('/api/posts/', {'ordering': 'hot'}),
+                ('/api/posts/', {'stream': 'true'}),
+                ('/api/comments/', {}),
+                ('/api/comments/', {'ordering': 'oldest', 'stream': 'true'}),
+            ):
+                with self.subTest(values=values, url=url, **params):
+                    response = self.client.get(url, {'cursor': encode_cursor(values), **params})
+                    self.assertEqual(response.status_code, 404)
+
+
+class ResponseEncodingTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.posts = [Post.objects.create(author=self.alice, content=f"Post {i} \u2028 caf\u00e9") for i in range(12)]
+        self.expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        likes.apply_batch({(self.bob.id, 'post', self.posts[3].id): likes.LIKE})
+
+    def test_fast_renderer_matches_json_renderer(self):
+        from decimal import Decimal
+        from django.utils.translation import gettext_lazy
+        data = {
+            'results': [CommentSerializer(Comment(id=1, author=self.alice, content="\u2029 \U0001f600")).data],
+            'plain': timezone.now().replace(microsecond=0),
+            'precise': timezone.now(),
+            'date': timezone.now().date(),
+            'decimal': Decimal('1.50'),
+            'lazy': gettext_lazy("This field is required."),
+            'numbers': [1, -2.5, 10 ** 12, True, None],
+            7: 'non-string key',
+        }
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = 'application/json; indent=2'
+        self.assertEqual(renderers.FastJSONRenderer().render(data, indented), JSONRenderer().render(data, indented))
+
+    @override_settings(STREAM_CHUNK_SIZE=5)
+    def test_streamed_list_sends_every_row_a_chunk_at_a_time(self):
+        response = self.client.get('/api/posts/', {'stream': 'true', 'username': 'bob'})
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(response.streaming_content)
+        # Opening, three chunks of rows, closing; one rows and one likes query per chunk
+        self.assertEqual(len(chunks), 5)
+        self.assertLessEqual(len(queries), 6)
+        data = json.loads(b''.join(chunks))
+        self.assertEqual([post['id'] for post in data['results']], self.expected)
+        self.assertEqual([post['id'] for post in data['results'] if post['liked_by_me']], [self.posts[3].id])
+        self.assertEqual(data['results'][0], self.client.get('/api/posts/').json()['results'][0])
+
+        # From a cursor, in the requested ordering
+        cursor = self.client.get('/api/posts/', {'page_size': 4}).json()['next'].split('cursor=')[1]
+        rest = json.loads(b''.join(self.client.get(f'/api/posts/?stream=1&cursor={cursor}').streaming_content))
+        self.assertEqual([post['id'] for post in rest['results']], self.expected[4:])
+
+        Comment.objects.create(author=self.bob, post=self.posts[0], content="Hi")
+        comments = json.loads(b''.join(self.client.get('/api/comments/?stream=true').streaming_content))
+        self.assertEqual([c['content'] for c in comments['results']], ["Hi"])
+
+    @override_settings(STREAM_CHUNK_SIZE=5)
+    async def test_streamed_list_is_async_under_asgi(self):
+        response = await self.async_client.get('/api/posts/', {'stream': 'true', 'username': 'bob'})
+        # A sync iterator would be read whole before the first byte is sent
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 5)
+        data = json.loads(b''.join(chunks))
+        self.assertEqual([post['id'] for post in data['results']], self.expected)
+        self.assertEqual([post['id'] for post in data['results'] if post['liked_by_me']], [self.posts[3].id])
+
+        compressed = await self.async_client.get('/api/posts/?stream=true&username=bob', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        body = b''.join([chunk async for chunk in compressed.streaming_content])
+        self.assertEqual(json.loads(gzip.decompress(body))['results'], data['results'])
+
+    def test_json_responses_are_gzipped_when_accepted(self):
+        plain = self.client.get('/api/posts/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        response = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+
+        streamed = self.client.get('/api/posts/?stream=true', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(streamed['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(b''.join(streamed.streaming_content)))['results']), 12)
+
+        # Too short to be worth it
+        small = self.client.get('/api/leaderboard/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    @skipUnless(__import__('importlib').util.find_spec('brotli'), "brotli is not installed")
+    def test_brotli_is_preferred_when_accepted(self):
+        import brotli
+        plain = self.client.get('/api/posts/')
+        response = self.client.get('/api/posts/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(response.content)), plain.json())
+        streamed = self.client.get('/api/posts/?stream=true', HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(len(json.loads(brotli.decompress(b''.join(streamed.streaming_content)))['results']), 12)
+
+
+@override_settings(FEED_PAGE_SIZE=2)
+class HotFeedTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.posts = [Post.objects.create(author=self.alice, content=f"Post {i}") for i in range(5)]
+
+    def like(self, user, post):
+        return PostLike.objects.create(user=user, target=post)
+
+    def assert_scores_match_counters(self):
+        for post in Post.objects.all():
+            self.assertAlmostEqual(post.hot_score, hot.score(post.created_at, post.likes_count, post.comments_count), places=6)
+
+    def test_likes_and_comments_update_scores_incrementally(self):
+        old, new = self.posts[0], self.posts[1]
+        Post.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=1))
+        hot.recompute()
+
+        self.like(self.alice, old)
+        like = self.like(self.bob, old)
+        comment = Comment.objects.create(author=self.bob, post=old, content="Hi")
+        Comment.objects.create(author=self.alice, post=old, parent=comment, content="Hello")
+        likes.apply_batch({(self.alice.id, 'post', new.id): likes.LIKE})
+        self.assert_scores_match_counters()
+
+        like.delete()
+        comment.delete()  # and its reply
+        old.refresh_from_db()
+        self.assertEqual((old.likes_count, old.comments_count), (1, 0))
+        self.assert_scores_match_counters()
+
+        # A day-old post needs far more engagement than a fresh one to rank above it
+        ranked = list(Post.objects.order_by('-hot_score').values_list('id', flat=True))
+        self.assertEqual(ranked[0], new.id)
+        self.assertEqual(ranked[-1], old.id)
+
+    def test_hot_ordering_walks_every_post_exactly_once(self):
+        for user in (self.alice, self.bob):
+            self.like(user, self.posts[0])
+        self.like(self.alice, self.posts[3])
+        # Tie two scores so the id tie-breaker matters
+        Post.objects.filter(id=self.posts[2].id).update(hot_score=Post.objects.get(id=self.posts[1].id).hot_score)
+        expected = list(Post.objects.order_by('-hot_score', '-id').values_list('id', flat=True))
+        self.assertEqual(expected[:2], [self.posts[0].id, self.posts[3].id])
+
+        seen = []
+        url = '/api/posts/?ordering=hot'
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next']
+        self.assertEqual(seen, expected)
+        # Unknown orderings fall back to the newest first
+        self.assertEqual(self.client.get('/api/posts/?ordering=nope').json()['results'][0]['id'], self.posts[-1].id)
+
+    def test_recompute_command(self):
+        Post.objects.update(hot_score=0)
+        out = StringIO()
+        call_command('recompute_hot_scores', stdout=out)
+        self.assertIn("5 changed", out.getvalue())
+        self.assert_scores_match_counters()
+
+
+@override_settings(THREAD_PAGE_SIZE=2, THREAD_DEPTH=2, THREAD_REPLIES_PER_COMMENT=2)
+class CommentThreadTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+
+    def comment(self, content, parent=None):
+        return Comment.objects.create(author=self.alice, post=self.post, content=content, parent=parent)
+
+    def test_top_level_comments_are_paginated(self):
+        for i in range(5):
+            self.comment(f"Root {i}")
+
+        data = self.client.get(f'/api/posts/{self.post.id}/').json()
+        seen = [c['content'] for c in data['comments']]
+        url = data['comments_next']
+        while url:
+            with self.assertNumQueries(2):
+                page = self.client.get(url).json()
+            seen.extend(c['content'] for c in page['results'])
+            url = page['next']
+
+        self.assertEqual(seen, [f"Root {i}" for i in range(5)])
+
+    def test_deep_subtrees_are_collapsed(self):
+        node = root = self.comment("Level 0")
+        for level in range(1, 5):
+            node = self.comment(f"Level {level}", parent=node)
+
+        data = self.client.get(f'/api/posts/{self.post.id}/').json()
+        level2 = data['comments'][0]['replies'][0]['replies'][0]
+        self.assertEqual(level2['content'], "Level 2")
+        self.assertEqual((level2['replies'], level2['reply_count']), ([], 1))
+        self.assertIsNone(data['comments'][0]['replies_next'])
+
+        more = self.client.get(level2['replies_next']).json()
+        self.assertEqual([c['content'] for c in more['results']], ["Level 3"])
+        self.assertEqual(more['results'][0]['replies'][0]['content'], "Level 4")
+
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 1)
+
+    def test_wide_reply_lists_continue_with_a_cursor(self):
+        root = self.comment("Root")
+        for i in range(5):
+            self.comment(f"Reply {i}", parent=root)
+
+        data = self.client.get(f'/api/posts/{self.post.id}/').json()
+        shown = data['comments'][0]
+        self.assertEqual(shown['reply_count'], 5)
+        seen = [c['content'] for c in shown['replies']]
+        url = shown['replies_next']
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(c['content'] for c in page['results'])
+            url = page['next']
+
+        self.assertEqual(seen, [f"Reply {i}" for i in range(5)])
+
+    def test_invalid_thread_cursor(self):
+        root = self.comment("Root")
+        self.comment("Reply", parent=root)
+        too_long = '1' * (Comment._meta.get_field('path').max_length + threads.PATH_STEP)
+        # Past the int() digit limit, and not a whole number of segments
+        for path in ['²', None, 1, ['1'], too_long, '1' * 5000, '1' * (threads.PATH_STEP + 1)]:
+            for url in (
+                f'/api/posts/{self.post.id}/',
+                f'/api/posts/{self.post.id}/comments/',
+                f'/api/comments/{root.id}/replies/',
+            ):
+                with self.subTest(path=str(path)[:20], url=url):
+                    self.assertEqual(self.client.get(url, {'cursor': encode_cursor([path])}).status_code, 404)
+
+
+class CommentListingTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+        self.other = Post.objects.create(author=self.bob, content="Other")
+        self.root = Comment.objects.create(author=self.alice, post=self.post, content="Root")
+        self.replies = [
+            Comment.objects.create(author=author, post=self.post, parent=self.root, content=f"Reply {i}")
+            for i, author in enumerate([self.bob, self.alice, self.bob])
+        ]
+        self.elsewhere = Comment.objects.create(author=self.bob, post=self.other, content="Elsewhere")
+        CommentLike.objects.create(user=self.bob, target=self.replies[1])
+        users.clear()
+
+    def ids(self, **params):
+        seen, url = [], '/api/comments/'
+        while url:
+            page = self.client.get(url, params).json()
+            seen.extend(c['id'] for c in page['results'])
+            url, params = page['next'], {}
+        return seen
+
+    def test_filters_page_newest_first(self):
+        newest_first = [*reversed(self.replies), self.root]
+        self.assertEqual(self.ids(post=self.post.id, page_size=2), [c.id for c in newest_first])
+        self.assertEqual(self.ids(author=self.bob.id, page_size=1),
+                         [self.elsewhere.id, self.replies[2].id, self.replies[0].id])
+        self.assertEqual(self.ids(parent=self.root.id, ordering='oldest'), [c.id for c in self.replies])
+        self.assertEqual(self.ids(post=self.post.id, author=self.alice.id), [self.replies[1].id, self.root.id])
+        self.assertEqual(len(self.ids()), 5)
+
+        first = self.client.get('/api/comments/', {'post': self.other.id}).json()['results'][0]
+        self.assertEqual(first['author'], {'id': self.bob.id, 'username': 'bob'})
+        self.assertEqual((first['post'], first['parent'], first['likes_count']), (self.other.id, None, 0))
+        self.assertNotIn('replies', first)
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/comments/', {'post': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/comments/', {'author': '-1'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/comments/', {'post': '²'}).status_code, 400)
+
+    def test_page_cost_is_fixed(self):
+        self.client.get('/api/comments/', {'username': 'bob'})
+        for i in range(20):
+            Comment.objects.create(author=User.objects.create_user(username=f'user{i}'), post=self.post,
+                                   content=f"More {i}")
+        with self.assertNumQueries(2):
+            page = self.client.get('/api/comments/', {'post': self.post.id, 'page_size': 50, 'username': 'bob'}).json()
+        self.assertEqual(len(page['results']), 24)
+        self.assertEqual([c['id'] for c in page['results'] if c['liked_by_me']], [self.replies[1].id])
+        with instrumentation.query_budget('comment-list'):
+            self.client.get('/api/comments/', {'author': self.bob.id})
+
+    def test_retrieve_keeps_the_thread_serializer(self):
+        data = self.client.get(f'/api/comments/{self.root.id}/', {'post': self.other.id}).json()
+        self.assertEqual((data['content'], data['reply_count']), ("Root", 3))
+
+
+class CommentPathTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+        self.root = self.comment("Root")
+        self.child = self.comment("Child", parent=self.root)
+        self.grandchild = self.comment("Grandchild", parent=self.child)
+        self.sibling = self.comment("Sibling", parent=self.root)
+        self.other = self.comment("Other root")
+
+    def comment(self, content, parent=None):
+        return Comment.objects.create(author=self.alice, post=self.post, content=content, parent=parent)
+
+    def subtree(self, comment):
+        comment.refresh_from_db()
+        return list(
+            Comment.objects.filter(
+                post=self.post, path__gte=comment.path, path__lt=threads.subtree_end(comment.path)
+            ).order_by('path').values_list('content', 'depth')
+        )
+
+    def test_subtree_is_one_preordered_range(self):
+        self.assertEqual(
+            self.subtree(self.root),
+            [("Root", 0), ("Child", 1), ("Grandchild", 2), ("Sibling", 1)],
+        )
+
+    def test_moving_a_comment_moves_its_subtree(self):
+        self.child.parent = self.other
+        self.child.save()
+
+        self.assertEqual(self.subtree(self.root), [("Root", 0), ("Sibling", 1)])
+        self.assertEqual(
+            self.subtree(self.other),
+            [("Other root", 0), ("Child", 1), ("Grandchild", 2)],
+        )
+
+    def test_rebuild_paths_matches_incremental_paths(self):
+        expected = list(Comment.objects.order_by('id').values_list('path', 'depth'))
+        Comment.objects.update(path='', depth=0)
+
+        threads.rebuild_paths()
+
+        self.assertEqual(list(Comment.objects.order_by('id').values_list('path', 'depth')), expected)
+
+    def test_replies_past_the_path_capacity_are_rejected(self):
+        deepest = Comment.objects.create(author=self.alice, post=self.post, content="Root")
+        Comment.objects.filter(pk=deepest.pk).update(depth=threads.MAX_DEPTH)
+        response = self.client.post('/api/comments/', {
+            'post': self.post.id, 'parent': deepest.id, 'content': "Too deep", 'username': 'alice',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.json())
+
+        # Moving a subtree under it would push its replies past the limit too
+        shallow = Comment.objects.create(author=self.alice, post=self.post, content="Shallow")
+        Comment.objects.filter(pk=shallow.pk).update(depth=threads.MAX_DEPTH - 1)
+        root = Comment.objects.create(author=self.alice, post=self.post, content="Subtree")
+        Comment.objects.create(author=self.alice, post=self.post, parent=root, content="Reply")
+        response = self.client.patch(f'/api/comments/{root.id}/', {'parent': shallow.id}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TreeRendererTestCase(TestCase):
+    def test_matches_comment_serializer_output(self):
+        alice = User.objects.create_user(username='alice')
+        post = Post.objects.create(author=alice, content="Hello World")
+        root = Comment.objects.create(author=alice, post=post, content="Root")
+        child = Comment.objects.create(author=alice, post=post, content="Child", parent=root)
+        Comment.objects.create(author=alice, post=post, content="Grandchild", parent=child)
+        Comment.objects.create(author=alice, post=post, content="Sibling", parent=root)
+        Comment.objects.create(author=alice, post=post, content="Other root")
+        self.client.post('/api/likes/', {'type': 'comment', 'id': child.id, 'username': 'alice'})
+
+        # Reference: the recursive serializer over a tree of model instances
+        comments = {c.id: c for c in Comment.objects.select_related('author').order_by('path')}
+        roots = []
+        for comment in comments.values():
+            comment._replies = []
+            if comment.parent_id:
+                comments[comment.parent_id]._replies.append(comment)
+            else:
+                roots.append(comment)
+        expected = CommentSerializer(roots, many=True).data
+
+        response = self.client.get(f'/api/posts/{post.id}/')
+        self.assertEqual(response.json()['comments'], json.loads(JSONRenderer().render(expected)))
+
+
+@override_settings(POST_DETAIL_CACHE=True)
+class PostDetailCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+        self.comment = Comment.objects.create(author=self.alice, post=self.post, content="First")
+        self.url = f'/api/posts/{self.post.id}/'
+
+    def test_cached_response_and_revalidation(self):
+        first = self.client.get(self.url)
+        self.assertIn('ETag', first)
+        self.assertIn('must-revalidate', first['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_entries_vary_by_media_type(self):
+        plain = self.client.get(self.url)
+        indented = self.client.get(self.url, HTTP_ACCEPT='application/json; indent=4')
+        self.assertIn(b'\n    ', indented.content)
+        self.assertNotEqual(indented['ETag'], plain['ETag'])
+        self.assertEqual(self.client.get(self.url).content, plain.content)
+        self.assertEqual(self.client.get(self.url, HTTP_ACCEPT='application/json; indent=4').content, indented.content)
+        browsable = self.client.get(self.url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(browsable.status_code, 200)
+
+    def test_comment_and_like_writes_invalidate(self):
+        first = self.client.get(self.url)
+
+        self.client.post('/api/likes/', {'type': 'comment', 'id': self.comment.id, 'username': 'alice'})
+        liked = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(liked.status_code, 200)
+        self.assertEqual(liked.json()['comments'][0]['likes_count'], 1)
+
+        self.client.post('/api/comments/', {'post': self.post.id, 'content': "Second", 'username': 'alice'})
+        commented = self.client.get(self.url)
+        self.assertNotEqual(commented['ETag'], liked['ETag'])
+        self.assertEqual([c['content'] for c in commented.json()['comments']], ["First", "Second"])
+
+    @override_settings(POST_DETAIL_CACHE=False)
+    def test_disabled_without_a_shared_cache(self):
+        first = self.client.get(self.url)
+        self.assertFalse(first.has_header('ETag'))
+        self.client.post('/api/comments/', {'post': self.post.id, 'content': "Second", 'username': 'alice'})
+        self.assertEqual(len(self.client.get(self.url).json()['comments']), 2)
+        self.assertEqual(len(self.client.get(f'/api/async/posts/{self.post.id}/').json()['comments']), 2)
+
+        with override_settings(POST_DETAIL_CACHE=True):
+            self.assertEqual([error.id for error in checks.check_post_detail_cache(None)], ['community.E001'])
+            redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+            with override_settings(CACHES=redis):
+                self.assertEqual(checks.check_post_detail_cache(None), [])
+
+
+class LikedByMeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.posts = [Post.objects.create(author=self.alice, content=f"Post {i}") for i in range(6)]
+        self.comments = [Comment.objects.create(author=self.alice, post=self.posts[0], content=f"C{i}") for i in range(4)]
+        likes.apply_batch({
+            (self.bob.id, 'post', self.posts[1].id): likes.LIKE,
+            (self.bob.id, 'post', self.posts[4].id): likes.LIKE,
+            (self.bob.id, 'comment', self.comments[2].id): likes.LIKE,
+            (self.alice.id, 'comment', self.comments[0].id): likes.LIKE,
+        })
+
+    def feed_queries(self, page_size, username=None):
+        params = {'page_size': page_size, **({'username': username} if username else {})}
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/posts/', params)
+        return len(queries)
+
+    def test_feed_marks_liked_posts_in_one_query(self):
+        feed = self.client.get('/api/posts/?username=bob').json()['results']
+        self.assertEqual({p['id'] for p in feed if p['liked_by_me']}, {self.posts[1].id, self.posts[4].id})
+        self.assertFalse(any(p['liked_by_me'] for p in self.client.get('/api/posts/').json()['results']))
+
+        # The lookup costs one query however long the page is, none when anonymous
+        self.assertEqual(self.feed_queries(2, 'bob'), self.feed_queries(6, 'bob'))
+        self.assertEqual(self.feed_queries(6, 'bob'), self.feed_queries(6) + 1)
+
+    @override_settings(POST_DETAIL_CACHE=True)
+    def test_thread_marks_liked_comments_per_viewer(self):
+        url = f'/api/posts/{self.posts[0].id}/'
+        for username, liked_comment in (('bob', 2), ('alice', 0), ('bob', 2)):
+            data = self.client.get(url, {'username': username}).json()
+            self.assertEqual([c['liked_by_me'] for c in data['comments']], [i == liked_comment for i in range(4)])
+            self.assertFalse(data['liked_by_me'])
+        anonymous = self.client.get(url)
+        self.assertFalse(any(c['liked_by_me'] for c in anonymous.json()['comments']))
+
+        # Cached per viewer, and the viewer's own likes invalidate it
+        self.client.force_login(self.bob)
+        as_bob = self.client.get(url)
+        self.assertNotEqual(as_bob['ETag'], anonymous['ETag'])
+        self.client.post('/api/likes/', {'type': 'post', 'id': self.posts[0].id, 'username': 'bob'})
+        self.assertTrue(self.client.get(url).json()['liked_by_me'])
+
+        replies = self.client.get(f'/api/posts/{self.posts[0].id}/comments/?username=alice').json()['results']
+        self.assertEqual([c['liked_by_me'] for c in replies], [True, False, False, False])
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.running = Post.objects.create(author=self.alice, content="Running shoes for trail running")
+        self.cooking = Post.objects.create(author=self.bob, content="Cooking pasta at home")
+        self.reply = Comment.objects.create(author=self.bob, post=self.cooking, content="I run to the shops for pasta")
+
+    def search(self, q, **params):
+        response = self.client.get('/api/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def hits(self, q, **params):
+        return [(hit['type'], hit['id']) for hit in self.search(q, **params)['results']]
+
+    def test_ranks_posts_and_comments_together(self):
+        # Stemmed: "runs" matches "running" and "run"; the post says it twice
+        self.assertEqual(self.hits("runs"), [('post', self.running.id), ('comment', self.reply.id)])
+        self.assertEqual(self.hits("pasta run"), [('comment', self.reply.id)])
+        self.assertEqual(self.hits("pasta", type='post'), [('post', self.cooking.id)])
+        self.assertEqual(self.hits("swimming"), [])
+
+        comment = self.search("shops")['results'][0]
+        self.assertEqual((comment['post'], comment['author']['username']), (self.cooking.id, 'bob'))
+
+    def test_query_syntax_is_not_interpreted(self):
+        for q in ('"pasta', 'pasta*', '(pasta) ^home', "-home +pasta", "pasta:home"):
+            self.assertIn(('post', self.cooking.id), self.hits(q))
+        self.assertEqual(self.client.get('/api/search/', {'q': ' ?! '}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'pasta', 'type': 'user'}).status_code, 400)
+
+    def test_index_follows_writes(self):
+        self.cooking.refresh_from_db()
+        self.cooking.content = "Baking bread at home"
+        self.cooking.save()
+        self.assertEqual(self.hits("bread"), [('post', self.cooking.id)])
+        self.assertEqual(self.hits("pasta"), [('comment', self.reply.id)])
+
+        # Also bulk inserts, which skip signals, and cascades
+        Comment.objects.bulk_create([Comment(author=self.alice, post=self.running, content="More bread please")])
+        self.assertEqual(len(self.hits("bread")), 2)
+        self.cooking.delete()
+        self.assertEqual(self.hits("shops"), [])
+        self.assertEqual(self.hits("bread"), [('comment', Comment.objects.get().id)])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.hits("bread"), [('comment', Comment.objects.get().id)])
+
+    def test_pages_through_every_hit_once(self):
+        for i in range(7):
+            post = Post.objects.create(author=self.alice, content=f"Garden {'garden ' * i}tips")
+            Comment.objects.create(author=self.bob, post=post, content=f"Nice garden number {i}")
+        expected = self.hits("garden", page_size=100)
+        self.assertEqual(len(expected), 14)
+
+        seen, params = [], {'page_size': 4}
+        while True:
+            page = self.search("garden", **params)
+            seen += [(hit['type'], hit['id']) for hit in page['results']]
+            if page['next'] is None:
+                break
+            params['cursor'] = page['next'].split('cursor=')[1].split('&')[0]
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'garden', 'cursor': 'bm90IGpzb24'}).status_code, 404)
+
+    def test_marks_liked_results(self):
+        likes.apply_batch({(self.alice.id, 'comment', self.reply.id): likes.LIKE})
+        results = self.search("pasta", username='alice')['results']
+        self.assertEqual([(hit['type'], hit['liked_by_me']) for hit in results], [('post', False), ('comment', True)])
+        with instrumentation.query_budget('search'):
+            self.search("pasta", username='alice')
+
+
+class BulkLikeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.posts = [Post.objects.create(author=self.alice, content=f"Post {i}") for i in range(3)]
+        self.comment = Comment.objects.create(author=self.alice, post=self.posts[0], content="Reply")
+
+    def bulk(self, items, username='bob'):
+        return self.client.post('/api/likes/bulk/', {'username': username, 'items': items}, content_type='application/json')
+
+    def test_likes_won_by_a_concurrent_request_are_not_counted(self):
+        insert_likes = likes.insert_likes
+
+        def racing(like_model, to_create):
+            # A single like of posts[0] commits between the read and the insert
+            PostLike.objects.bulk_create([PostLike(user=self.bob, target=self.posts[0])])
+            return insert_likes(like_model, to_create)
+
+        with mock.patch.object(likes, 'insert_likes', racing):
+            response = self.bulk([{'type': 'post', 'id': self.posts[0].id}, {'type': 'post', 'id': self.posts[1].id}])
+        self.assertEqual([item['status'] for item in response.json()['results']], ['already liked', 'liked'])
+        counts = dict(Post.objects.values_list('id', 'likes_count'))
+        # posts[0]'s racing like bypassed the signals, so only posts[1] was counted here
+        self.assertEqual([counts[p.id] for p in self.posts], [0, 1, 0])
+        self.assertEqual(PostLike.objects.filter(user=self.bob).count(), 2)
+
+    def test_mixed_operations(self):
+        PostLike.objects.create(user=self.bob, target=self.posts[1])
+
+        response = self.bulk([
+            {'type': 'post', 'id': self.posts[0].id},
+            {'type': 'post', 'id': self.posts[1].id, 'action': 'unlike'},
+            {'type': 'post', 'id': self.posts[2].id, 'action': 'unlike'},
+            {'type': 'comment', 'id': self.comment.id, 'action': 'like'},
+            {'type': 'post', 'id': 999999},
+            {'type': 'post', 'id': self.posts[0].id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            ['superseded', 'unliked', 'not liked', 'liked', 'not found', 'liked'],
+        )
+
+        counts = dict(Post.objects.values_list('id', 'likes_count'))
+        self.assertEqual([counts[p.id] for p in self.posts], [1, 0, 0])
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.likes_count, 1)
+
+        # 5 for the post like + 1 for the comment like, the unlike took back its 5
+        self.assertEqual(KarmaBucket.objects.filter(user=self.alice).aggregate(models.Sum('points'))['points__sum'], 6)
+        self.assertEqual(self.bulk([{'type': 'post', 'id': self.posts[0].id}]).json()['results'][0]['status'], 'already liked')
+
+    def test_query_count_does_not_grow_with_items(self):
+        extra = [Post.objects.create(author=self.alice, content=f"Extra {i}") for i in range(20)]
+        # Warm the content type cache and alice's karma bucket
+        self.bulk([{'type': 'post', 'id': self.posts[2].id}])
+
+        with CaptureQueriesContext(connection) as small:
+            self.bulk([{'type': 'post', 'id': p.id} for p in self.posts[:2]])
+        with CaptureQueriesContext(connection) as large:
+            self.bulk([{'type': 'post', 'id': p.id} for p in extra])
+        self.assertEqual(len(large), len(small))
+
+    def test_rejects_invalid_items(self):
+        self.assertEqual(self.bulk([]).status_code, 400)
+        self.assertEqual(self.bulk([{'type': 'user', 'id': 1}]).status_code, 400)
+
+
+@override_settings(LIKE_INGESTION_MODE='queued', LIKE_QUEUE_MAX_PENDING=10_000)
+class LikeQueueTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Viral")
+
+    def test_likes_are_acknowledged_then_flushed(self):
+        response = self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'alice'})
+        self.assertEqual(response.status_code, 202)
+        self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'alice'})
+        self.assertEqual(self.client.post('/api/likes/', {'type': 'post', 'id': 999999}).status_code, 400)
+
+        self.assertFalse(PostLike.objects.exists())
+        self.assertEqual(like_queue.drain(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(PostLike.objects.count(), 1)
+
+    def test_burst_of_likes(self):
+        users = User.objects.bulk_create([User(username=f'fan{i}') for i in range(500)])
+        comment = Comment.objects.create(author=self.alice, post=self.post, content="Me too")
+        # 3000 queued likes, each (user, target) pair sent three times
+        PendingLike.objects.bulk_create([
+            PendingLike(user=user, target_type=target_type, object_id=object_id)
+            for _ in range(3)
+            for user in users
+            for target_type, object_id in [('post', self.post.id), ('comment', comment.id)]
+        ])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(like_queue.drain(batch_size=1000), 3000)
+        # A handful of queries per batch, not per like
+        self.assertLess(len(queries), 100)
+
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((self.post.likes_count, comment.likes_count), (500, 500))
+        self.assertEqual((PostLike.objects.count(), CommentLike.objects.count()), (500, 500))
+        self.assertEqual(karma.window_scores(timezone.now() - timedelta(hours=1))[self.alice.id], 500 * 5 + 500 * 1)
+
+    @override_settings(LIKE_QUEUE_MAX_PENDING=2)
+    def test_backpressure(self):
+        for _ in range(2):
+            self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'alice'})
+        response = self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'alice'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class UserResolutionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        users.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+
+    def user_queries(self, queries):
+        return [q['sql'] for q in queries if 'FROM "community_user"' in q['sql']]
+
+    def test_warm_username_costs_no_query(self):
+        with CaptureQueriesContext(connection) as cold:
+            self.client.post('/api/comments/', {'post': self.post.id, 'content': "One", 'username': 'alice'})
+        with CaptureQueriesContext(connection) as warm:
+            self.client.post('/api/comments/', {'post': self.post.id, 'content': "Two", 'username': 'alice'})
+            self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'alice'})
+            self.client.post('/api/posts/', {'content': "Three", 'username': 'alice'})
+        self.assertEqual(len(self.user_queries(cold)), 1)
+        self.assertEqual(self.user_queries(warm), [])
+        self.assertEqual(Comment.objects.filter(author=self.alice).count(), 2)
+
+    def test_unknown_username_falls_back_to_first_user(self):
+        self.client.post('/api/posts/', {'content': "Anon", 'username': 'nobody'})
+        self.assertEqual(Post.objects.get(content="Anon").author, self.alice)
+
+        # Misses are not cached, so a user created elsewhere (no eviction in
+        # this process) is found right away
+        with mock.patch.object(users, 'evict'):
+            nobody = User.objects.create_user(username='nobody')
+        self.client.post('/api/posts/', {'content': "Named", 'username': 'nobody'})
+        self.assertEqual(Post.objects.get(content="Named").author, nobody)
+
+    def test_rename_and_delete_evict(self):
+        self.assertEqual(users.get_by_username('alice').id, self.alice.id)
+        self.alice.username = 'alicia'
+        self.alice.save()
+        self.assertIsNone(users.get_by_username('alice'))
+        self.assertEqual(users.get_by_username('alicia').id, self.alice.id)
+
+        self.assertEqual(users.get_first_user().id, self.alice.id)
+        self.alice.delete()
+        self.assertIsNone(users.get_by_username('alicia'))
+        self.assertIsNone(users.get_first_user())
+
+    @override_settings(USER_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        for name in ['bob', 'carol', 'dave']:
+            User.objects.create_user(username=name)
+            users.get_by_username(name)
+        with self.assertNumQueries(1):
+            users.get_by_username('dave')
+            users.get_by_username('bob')
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.reset()
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Hello World")
+        Comment.objects.create(author=self.alice, post=self.post, content="First")
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/api/posts/')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="1 queries", serialize;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        admin = User.objects.create_superuser(username='admin', password='pw')
+        self.client.force_login(admin)
+        stats = self.client.get('/api/metrics/').json()['post-list']
+        self.assertEqual((stats['requests'], stats['max_queries']), (1, 1))
+        self.assertEqual(sum(stats['latency_histogram'].values()), 1)
+        self.assertEqual(stats['avg_bytes'], len(response.content))
+
+    def test_serialization_is_timed_apart_from_the_view(self):
+        to_representation = PostSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(PostSerializer, 'to_representation', slow):
+            response = self.client.get('/api/posts/')
+        timings = {part.split(';')[0]: float(part.split('dur=')[1].split(';')[0])
+                   for part in response['Server-Timing'].split(', ')}
+        self.assertGreaterEqual(timings['serialize'], 50)
+        self.assertLess(timings['render'], 50)
+
+    def test_endpoint_budgets(self):
+        with instrumentation.query_budget('post-detail'):
+            self.client.get(f'/api/posts/{self.post.id}/')
+        with instrumentation.query_budget('post-list'):
+            self.client.get('/api/posts/')
+        with self.assertRaises(AssertionError):
+            with instrumentation.query_budget(0):
+                self.client.get('/api/posts/?page_size=1')
+
+    @override_settings(QUERY_BUDGETS={'post-list': 0}, QUERY_BUDGET_MODE='raise')
+    def test_budget_can_raise(self):
+        with self.assertRaises(instrumentation.QueryBudgetExceeded):
+            self.client.get('/api/posts/')
+
+    @override_settings(QUERY_BUDGET_MODE='raise', LEADERBOARD_RANK_SECONDS=0)
+    def test_budgets_cover_the_viewer(self):
+        bob = User.objects.create_user(username='bob')
+        comment = Comment.objects.get()
+        Comment.objects.create(author=self.alice, post=self.post, parent=comment, content="Reply")
+        CommentLike.objects.create(user=bob, target=comment)
+        PostLike.objects.create(user=bob, target=self.post)
+        endpoints = {
+            'post-list': '/api/posts/',
+            'post-detail': f'/api/posts/{self.post.id}/',
+            'post-comments': f'/api/posts/{self.post.id}/comments/',
+            'comment-list': '/api/comments/',
+            'comment-replies': f'/api/comments/{comment.id}/replies/',
+            'leaderboard-rank': '/api/leaderboard/me/',
+            'search': '/api/search/',
+            'async-post-list': '/api/async/posts/',
+            'async-post-detail': f'/api/async/posts/{self.post.id}/',
+        }
+        # A cold ?username= lookup, then a session login (session + user queries)
+        for params, login in (({'username': 'bob'}, False), ({}, True)):
+            if login:
+                self.client.force_login(bob)
+            for url_name, url in endpoints.items():
+                users.clear()
+                with self.subTest(url_name, login=login), instrumentation.query_budget(url_name):
+                    self.assertEqual(self.client.get(url, {'q': 'first', **params}).status_code, 200)
+
+    @override_settings(QUERY_BUDGETS={'post-list': 0})
+    def test_budget_logs_by_default(self):
+        with self.assertLogs('community.instrumentation', 'WARNING'):
+            self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+
+class SyntheticCommunityTestCase(TestCase):
+    def test_generate_is_consistent_and_deterministic(self):
+        out = StringIO()
+        call_command('generate_community', users=20, posts=30, comments=200, likes=500, max_depth=4, seed=7, stdout=out)
+        self.assertIn("Generated 20 users, 30 posts, 200 comments, 500 likes.", out.getvalue())
+
+        # Derived data matches what signals would have produced
+        self.assertFalse(Comment.objects.filter(path='').exists())
+        self.assertLessEqual(Comment.objects.aggregate(models.Max('depth'))['depth__max'], 4)
+        for comment in Comment.objects.annotate(n=models.Count('replies')):
+            self.assertEqual(comment.reply_count, comment.n)
+            self.assertTrue(comment.path.endswith(threads.path_segment(comment.id)))
+        for model in (Post, Comment):
+            self.assertEqual(counters.reconcile(model, dry_run=True), 0)
+        self.assertEqual(
+            sum(KarmaBucket.objects.values_list('points', flat=True)),
+            5 * PostLike.objects.count() + CommentLike.objects.count(),
+        )
+
+        # Same seed, same community (under another username prefix)
+        first = list(Post.objects.order_by('id').values_list('content', 'likes_count'))
+        Post.objects.all().delete()
+        synthetic.generate(users=20, posts=30, comments=200, likes=500, max_depth=4, seed=7, prefix='again')
+        second = list(Post.objects.order_by('id').values_list('content', 'likes_count'))
+        self.assertEqual([(c.replace('again', 'user'), n) for c, n in second], first)
+
+        with self.assertRaises(CommandError):
+            call_command('generate_community', users=1, posts=1, comments=0, likes=0, prefix='user', stdout=out)
+
+
+class ColumnarDumpTestCase(TestCase):
+    def snapshot(self):
+        return {
+            'users': list(User.objects.order_by('id').values_list('id', 'username', 'date_joined')),
+            'posts': list(Post.objects.order_by('id').values_list()),
+            'comments': list(Comment.objects.order_by('id').values_list()),
+            'post_likes': list(PostLike.objects.order_by('id').values_list()),
+            'comment_likes': list(CommentLike.objects.order_by('id').values_list()),
+            'karma': sorted(KarmaBucket.objects.values_list('user_id', 'bucket', 'points')),
+        }
+
+    def test_round_trip(self):
+        synthetic.generate(users=15, posts=20, comments=120, likes=400, max_depth=4, seed=3)
+        before = self.snapshot()
+        post_likes, comment_likes = len(before['post_likes']), len(before['comment_likes'])
+        self.assertEqual(post_likes + comment_likes, 400)
+
+        with tempfile.TemporaryDirectory() as directory:
+            out = StringIO()
+            call_command('export_community', directory, chunk_size=50, stdout=out)
+            self.assertIn(f"{comment_likes} comment_likes", out.getvalue())
+            manifest = columnar.read_manifest(directory)
+            self.assertEqual(len(manifest['tables']['post_likes']['shards']), -(-post_likes // 50))
+            self.assertEqual(manifest['tables']['post_likes']['columns']['target_id'], 'int')
+            self.assertEqual(manifest['tables']['comments']['columns']['parent_id'], 'int')
+
+            with self.assertRaises(CommandError):
+                call_command('import_community', directory, stdout=out)
+            for model in (PostLike, CommentLike, Comment, Post, User):
+                model.objects.all().delete()
+            KarmaBucket.objects.all().delete()
+            loaded = columnar.load(directory)
+
+        self.assertEqual(loaded, {
+            'users': 15, 'posts': 20, 'comments': 120, 'post_likes': post_likes, 'comment_likes': comment_likes,
+        })
+        self.assertEqual(self.snapshot(), before)
+        # Sequences continue after the imported ids
+        self.assertGreater(Post.objects.create(author=User.objects.first(), content="New").id, before['posts'][-1][0])
+
+
+class KarmaEngineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        karma_engine.reset()
+        self.addCleanup(karma_engine.reset)
+
+    def like(self, user, target, created_at):
+        like_model = LIKE_MODELS[type(target)]
+        like = like_model.objects.create(user=user, target=target)
+        like_model.objects.filter(pk=like.pk).update(created_at=created_at)
+        karma.rebuild()
+
+    def test_engine_matches_ledger(self):
+        synthetic.generate(users=15, posts=20, comments=120, likes=400, max_depth=4, seed=5)
+        engine = karma_engine.get_engine()
+        for since in (timezone.now() - timedelta(hours=5, minutes=17), timezone.now() - timedelta(days=30)):
+            expected = +karma.window_scores(since)
+            self.assertTrue(expected)
+            self.assertEqual(engine.scores(since), expected)
+            self.assertEqual(engine.top(since, limit=10), karma._rank(expected, 10))
+
+        # Windows of a series add up to the whole span, rows match single-user histories
+        now = timezone.now()
+        edges = [now - timedelta(days=days) for days in (30, 7, 1, 0)]
+        user_ids, matrix = engine.series(edges)
+        totals = Counter(dict(zip(user_ids.tolist(), matrix.sum(axis=1).tolist())))
+        self.assertEqual(+totals, engine.scores(edges[0], edges[-1]))
+        for user_id, row in zip(user_ids.tolist(), matrix.tolist()):
+            self.assertEqual(engine.history(user_id, edges), row)
+
+    def test_weights_apply_at_query_time(self):
+        alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        post = Post.objects.create(author=alice, content="Hello World")
+        comment = Comment.objects.create(author=alice, post=post, content="Me too")
+        self.like(bob, post, timezone.now())
+        self.like(bob, comment, timezone.now())
+        engine = karma_engine.get_engine()
+        self.assertEqual(engine.scores(), {alice.id: 6})
+        with override_settings(KARMA_POST_LIKE_POINTS=10, KARMA_COMMENT_LIKE_POINTS=3):
+            self.assertEqual(engine.scores(), {alice.id: 13})
+            self.assertEqual(karma.like_points()[0][1], 10)
+
+    def test_leaderboard_as_of(self):
+        alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        post = Post.objects.create(author=alice, content="Hello World")
+        now = timezone.now()
+        self.like(bob, post, now - timedelta(hours=30))
+        self.like(alice, Post.objects.create(author=bob, content="Hi"), now - timedelta(hours=2))
+
+        live = self.client.get('/api/leaderboard/?window=7d').json()
+        at_now = self.client.get('/api/leaderboard/', {'window': '7d', 'as_of': timezone.now().isoformat()}).json()
+        self.assertEqual(at_now['results'], live['results'])
+        self.assertIn('as_of', at_now)
+
+        # A day ago bob's post had not been liked yet, and alice's like fell in the 24h window
+        day_ago = (now - timedelta(days=1)).replace(tzinfo=None).isoformat()
+        data = self.client.get('/api/leaderboard/', {'as_of': day_ago}).json()
+        self.assertEqual([(row['username'], row['score']) for row in data['results']], [('alice', 5)])
+        async_data = self.client.get('/api/async/leaderboard/', {'as_of': day_ago}).json()
+        self.assertEqual(async_data['results'], data['results'])
+
+        self.assertEqual(self.client.get('/api/leaderboard/?as_of=yesterday').status_code, 400)
+        future = (timezone.now() + timedelta(hours=1)).isoformat()
+        self.assertEqual(self.client.get('/api/leaderboard/', {'as_of': future}).status_code, 400)
+
+    def test_weekly_history(self):
+        alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        post = Post.objects.create(author=alice, content="Hello World")
+        week_starts = karma_engine.week_starts(3)
+        self.like(bob, post, week_starts[0] + timedelta(minutes=1))
+        self.like(alice, Comment.objects.create(author=alice, post=post, content="Bump"), week_starts[2])
+
+        data = self.client.get('/api/users/alice/karma/?weeks=3').json()
+        self.assertEqual(data['user'], {'id': alice.id, 'username': 'alice'})
+        self.assertEqual([week['karma'] for week in data['weeks']], [5, 0, 1])
+        self.assertEqual(week_starts[0].weekday(), 0)
+        self.assertEqual(len(self.client.get('/api/users/bob/karma/').json()['weeks']), 12)
+
+        self.assertEqual(self.client.get('/api/users/nobody/karma/').status_code, 404)
+        self.assertEqual(self.client.get('/api/users/alice/karma/?weeks=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/users/alice/karma/?weeks=1000').status_code, 400)
+        self.assertEqual(self.client.get('/api/users/alice/karma/?weeks=%C2%B2').status_code, 400)
+
+
+class AsyncReadTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.bob = User.objects.create_user(username='bob')
+        self.posts = [Post.objects.create(author=self.alice, content=f"Post {i}") for i in range(3)]
+        root = Comment.objects.create(author=self.bob, post=self.posts[0], content="Root")
+        Comment.objects.create(author=self.alice, post=self.posts[0], parent=root, content="Reply")
+        self.client.post('/api/likes/', {'type': 'post', 'id': self.posts[0].id, 'username': 'bob'})
+        self.client.post('/api/likes/', {'type': 'comment', 'id': root.id, 'username': 'alice'})
+
+    async def test_feed_matches_sync(self):
+        sync = await self.async_client.get('/api/posts/?page_size=2')
+        response = await self.async_client.get('/api/async/posts/?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], sync.json()['results'])
+        self.assertEqual(response.json()['next'], sync.json()['next'].replace('/api/posts/', '/api/async/posts/'))
+
+        rest = (await self.async_client.get(response.json()['next'])).json()
+        self.assertEqual([p['content'] for p in rest['results']], ["Post 0"])
+        self.assertIsNone(rest['next'])
+
+    async def test_liked_by_me_matches_sync(self):
+        for url in ('/api/posts/?username=bob', f'/api/posts/{self.posts[0].id}/?username=alice'):
+            sync = await self.async_client.get(url)
+            response = await self.async_client.get(url.replace('/api/', '/api/async/'))
+            await cache.aclear()
+            self.assertEqual(response.json().get('results'), sync.json().get('results'))
+            self.assertEqual(response.json().get('comments'), sync.json().get('comments'))
+        self.assertTrue(response.json()['comments'][0]['liked_by_me'])
+
+    async def test_session_viewer(self):
+        # Resolved with request.auser(), without a thread hop per request
+        await self.async_client.aforce_login(self.bob)
+        feed = (await self.async_client.get('/api/async/posts/')).json()
+        self.assertEqual([p['liked_by_me'] for p in feed['results']], [False, False, True])
+        await self.async_client.alogout()
+        feed = (await self.async_client.get('/api/async/posts/')).json()
+        self.assertFalse(any(p['liked_by_me'] for p in feed['results']))
+
+    @override_settings(POST_DETAIL_CACHE=True)
+    async def test_post_detail_matches_sync(self):
+        url = f'/api/async/posts/{self.posts[0].id}/'
+        response = await self.async_client.get(url)
+        # Counted by the instrumentation middleware, including queries run by
+        # the async ORM in its executor thread
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        await cache.aclear()
+        sync = await self.async_client.get(f'/api/posts/{self.posts[0].id}/')
+        self.assertEqual(response.content, sync.content)
+
+        # Sync and async responses share cache entries and ETags
+        cached = await self.async_client.get(url, headers={'If-None-Match': sync['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertIn('desc="0 queries"', cached['Server-Timing'])
+        self.assertEqual((await self.async_client.get('/api/async/posts/999999/')).status_code, 404)
+
+    async def test_leaderboard_matches_sync(self):
+        response = await self.async_client.get('/api/async/leaderboard/?window=1h')
+        sync = await self.async_client.get('/api/leaderboard/?window=1h')
+        self.assertEqual(response.json()['results'], sync.json()['results'])
+        self.assertEqual([row['username'] for row in response.json()['results']], ['alice', 'bob'])
+
+        invalid = await self.async_client.get('/api/async/leaderboard/?window=2h')
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn('window', invalid.json())
+        self.assertEqual((await self.async_client.post('/api/async/leaderboard/')).status_code, 405)
+
+
+class RecordingBroker:
+    """EVENTS_BROKER stand-in that keeps what was published."""
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+@override_settings(EVENTS_BROKER='community.tests.RecordingBroker')
+class PostEventsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Live")
+        self.comment = Comment.objects.create(author=self.alice, post=self.post, content="Root")
+
+    def test_writes_publish_deltas_on_commit(self):
+        channel = events.post_channel(self.post.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'alice'})
+            self.client.post('/api/likes/', {'type': 'comment', 'id': self.comment.id, 'username': 'alice'})
+            self.client.post('/api/comments/', {'post': self.post.id, 'parent': self.comment.id, 'content': "Reply", 'username': 'alice'})
+            self.client.post('/api/likes/bulk/', {'username': 'alice', 'items': [
+                {'type': 'post', 'id': self.post.id, 'action': 'unlike'},
+            ]}, content_type='application/json')
+
+        published = events.get_broker().published
+        self.assertEqual({ch for ch, _ in published}, {channel})
+        messages = [message for _, message in published]
+        self.assertEqual(messages[0], {'type': 'likes', 'target': 'post', 'id': self.post.id, 'delta': 1})
+        self.assertEqual(messages[1], {'type': 'likes', 'target': 'comment', 'id': self.comment.id, 'delta': 1})
+        self.assertEqual(messages[2]['type'], 'comment')
+        self.assertEqual(messages[2]['parent'], self.comment.id)
+        self.assertEqual(messages[2]['comment']['content'], "Reply")
+        self.assertEqual(messages[3], {'type': 'likes', 'target': 'post', 'id': self.post.id, 'delta': -1})
+
+    def test_nothing_is_published_on_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                PostLike.objects.create(user=self.alice, target=self.post)
+                transaction.set_rollback(True)
+        self.assertEqual(events.get_broker().published, [])
+
+
+class EventStreamTestCase(TestCase):
+    def setUp(self):
+        self.post = Post.objects.create(author=User.objects.create_user(username='alice'), content="Live")
+
+    async def test_stream_delivers_published_events(self):
+        response = await self.async_client.get(f'/api/posts/{self.post.id}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+
+        # Published from another thread, as a sync view would
+        message = {'type': 'likes', 'target': 'post', 'id': self.post.id, 'delta': 1}
+        await asyncio.to_thread(events.get_broker().publish, events.post_channel(self.post.id), message)
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        self.assertEqual(chunk, b'event: likes\ndata: ' + json.dumps(message, separators=(',', ':')).encode() + b'\n\n')
+        await stream.aclose()
+
+    @override_settings(EVENTS_HEARTBEAT_SECONDS=0)
+    async def test_keepalive_and_missing_post(self):
+        response = await self.async_client.get(f'/api/posts/{self.post.id}/events/')
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        self.assertEqual(await anext(stream), b': keepalive\n\n')
+        await stream.aclose()
+        self.assertEqual((await self.async_client.get('/api/posts/999999/events/')).status_code, 404)
+
+    def test_refused_under_wsgi(self):
+        # A sync server would buffer the endless stream and hang its worker
+        response = self.client.get(f'/api/posts/{self.post.id}/events/')
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = replicas.ReplicaRouter()
+        self.alice = User.objects.create_user(username='alice')
+        self.post = Post.objects.create(author=self.alice, content="Replicated")
+
+    def tearDown(self):
+        replicas.mark_available('replica')
+
+    def test_only_replica_reads_go_to_replicas(self):
+        # 'replica' is not a real database here, so skip its health check
+        with mock.patch.object(replicas, '_is_available', return_value=True):
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+            with replicas.replica_reads():
+                self.assertEqual(self.router.db_for_read(Post), 'replica')
+                self.assertEqual(self.router.db_for_write(Post), 'default')
+                with replicas.primary():
+                    self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'community'))
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica2'])
+    def test_one_replica_per_request(self):
+        with mock.patch.object(replicas, '_is_available', return_value=True):
+            for _ in range(10):
+                with replicas.replica_reads():
+                    chosen = self.router.db_for_read(Post)
+                    self.assertEqual({self.router.db_for_read(Post) for _ in range(20)}, {chosen})
+                    with replicas.primary():
+                        self.assertEqual(self.router.db_for_read(Post), 'default')
+                    self.assertEqual(self.router.db_for_read(Post), chosen)
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        # 'replica' is not a configured database, so connecting to it fails
+        with replicas.replica_reads(), self.assertLogs('community.replicas', 'WARNING'):
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertIn('replica', replicas._unavailable)
+        response = self.client.get('/api/posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['id'], self.post.id)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        replicas.mark_available('replica', False)
+        response = self.client.post('/api/likes/', {'type': 'post', 'id': self.post.id, 'username': 'alice'})
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]['samesite'], settings.REPLICA_PIN_SAMESITE)
+        pinned = self.client.get('/api/posts/')
+        self.assertEqual(self.client.cookies[replicas.PIN_COOKIE].value, '1')
+        self.assertFalse(replicas.wants_replica(pinned.wsgi_request))
+        self.client.cookies.clear()
+        self.assertTrue(replicas.wants_replica(self.client.get('/api/posts/').wsgi_request))
+        self.assertFalse(replicas.wants_replica(self.client.get('/api/posts/').wsgi_request, allowed=False))
+
+    def test_pin_cookie_is_sent_cross_site(self):
+        replicas.mark_available('replica', False)
+        data = {'type': 'post', 'id': self.post.id, 'username': 'alice'}
+        with self.settings(REPLICA_PIN_SAMESITE='None'):
+            cookie = self.client.post('/api/likes/', data).cookies[replicas.PIN_COOKIE]
+        self.assertEqual((cookie['samesite'], cookie['secure']), ('None', True))
+        with self.settings(REPLICA_PIN_SAMESITE='Lax'):
+            cookie = self.client.post('/api/likes/', data).cookies[replicas.PIN_COOKIE]
+        self.assertEqual((cookie['samesite'], cookie['secure']), ('Lax', ''))
@@ -0,0 +1,129 @@
+"""
+Materialized paths for comment trees.
+
+Every comment stores `path`, the zero-padded ids of its ancestors followed by
+its own, and its `depth`. Paths sort in pre-order and a comment's subtree is
+the contiguous range [path, subtree_end(path)), so subtrees and depth-bounded
+slices come from one indexed range scan on (post, path).
+
+Paths only use digits, so they compare the same way under any collation.
+"""
+from django.db.models import CharField, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat, LPad, Substr
+from rest_framework import serializers
+
+from .models import Comment
+
+PATH_STEP = 10  # digits per path segment
+# Sorts after every possible path
+PATH_END = '9' * (Comment._meta.get_field('path').max_length + 1)
+# Depth of the deepest comment whose path still fits the column
+MAX_DEPTH = Comment._meta.get_field('path').max_length // PATH_STEP - 1
+
+
+def path_segment(comment_id):
+    return f'{comment_id:0{PATH_STEP}d}'
+
+
+def subtree_end(path):
+    """The smallest path that sorts after every path starting with `path`."""
+    return str(int(path) + 1).zfill(len(path))
+
+
+def assign_path(comment):
+    """Set path/depth on a freshly inserted comment (its id is part of the path)."""
+    if comment.parent_id is None:
+        comment.path, comment.depth = path_segment(comment.pk), 0
+    else:
+        parent_path, parent_depth = Comment.objects.values_list('path', 'depth').get(pk=comment.parent_id)
+        comment.path = parent_path + path_segment(comment.pk)
+        comment.depth = parent_depth + 1
+    Comment.objects.filter(pk=comment.pk).update(path=comment.path, depth=comment.depth)
+
+
+def subtree_height(comment):
+    """Levels below `comment` in its subtree (0 without replies)."""
+    deepest = Comment.objects.filter(
+        post_id=comment.post_id, path__gte=comment.path, path__lt=subtree_end(comment.path)
+    ).aggregate(deepest=Max('depth'))['deepest']
+    return deepest - comment.depth if deepest is not None else 0
+
+
+def move_subtree(comment, old_path):
+    """Re-root the paths of `comment` and its descendants after its parent changed."""
+    old_depth = comment.depth
+    assign_path(comment)
+    Comment.objects.filter(
+        post_id=comment.post_id, path__gt=old_path, path__lt=subtree_end(old_path)
+    ).update(
+        path=Concat(Value(comment.path), Substr('path', len(old_path) + 1), output_field=CharField()),
+        depth=F('depth') + (comment.depth - old_depth),
+    )
+
+
+def rebuild_paths(model=Comment):
+    """
+    Recompute every path, one tree level per UPDATE. Used by the backfill
+    migration and after bulk inserts that bypass signals.
+    """
+    own_segment = LPad(Cast('id', CharField()), PATH_STEP, Value('0'))
+    model.objects.update(path='', depth=0)
+    updated = model.objects.filter(parent__isnull=True).update(path=own_segment)
+    while updated:
+        parent = model.objects.filter(pk=OuterRef('parent_id'))
+        updated = model.objects.filter(path='').exclude(parent__path='').update(
+            path=Concat(Subquery(parent.values('path')), own_segment, output_field=CharField()),
+            depth=Subquery(parent.values('depth')) + 1,
+        )
+
+
+# Columns read for every comment of a rendered thread, see render_tree
+TREE_FIELDS = (
+    'id', 'parent_id', 'path', 'depth', 'content', 'created_at',
+    'likes_count', 'reply_count', 'author_id', 'author__username',
+)
+
+
+def render_tree(rows, root_depth, replies_link, liked_ids=frozenset()):
+    """
+    Build the nested comment JSON straight from `.values(*TREE_FIELDS)` rows.
+
+    Produces exactly what CommentSerializer renders, without instantiating
+    models or serializers per node. Rows are in path order, so every parent
+    precedes its children and a single loop can attach each row to its
+    already-built parent: no recursion, however deep the thread.
+
+    `replies_link(comment_id, last_reply_path)` returns the `replies_next`
+    link for a comment whose replies were only partly loaded. `liked_ids` are
+    the comments the viewer liked (see community/liked.py).
+    """
+    format_datetime = serializers.DateTimeField().to_representation
+    roots = []
+    nodes = {}
+    last_reply_path = {}
+    for row in rows:
+        node = {
+            'id': row['id'],
+            'author': {'id': row['author_id'], 'username': row['author__username']},
+            'content': row['content'],
+            'created_at': format_datetime(row['created_at']),
+            'likes_count': row['likes_count'],
+            'liked_by_me': row['id'] in liked_ids,
+            'reply_count': row['reply_count'],
+            'replies': [],
+            'replies_next': None,
+        }
+        if row['depth'] == root_depth:
+            roots.append(node)
+        elif row['parent_id'] in nodes:
+            nodes[row['parent_id']]['replies'].append(node)
+            last_reply_path[row['parent_id']] = row['path']
+        else:
+            # Its parent was cut off, so the row is dropped
+            continue
+        nodes[row['id']] = node
+
+    for comment_id, node in nodes.items():
+        if node['reply_count'] > len(node['replies']):
+            node['replies_next'] = replies_link(comment_id, last_reply_path.get(comment_id))
+    return roots
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PostViewSet, LikeViewSet, LeaderboardView, CommentViewSet
+from . import async_views
+from .views import PostViewSet, LikeViewSet, LeaderboardView, LeaderboardRankView, CommentViewSet, MetricsView, UserKarmaView, SearchView
 
 router = DefaultRouter()
 router.register(r'posts', PostViewSet, basename='post')
@@ -9,5 +10,15 @@ router.register(r'comments', CommentViewSet, basename='comment')
 urlpatterns = [
     path('', include(router.urls)),
     path('likes/', LikeViewSet.as_view({'post': 'create'}), name='like-create'),
+    path('likes/bulk/', LikeViewSet.as_view({'post': 'bulk'}), name='like-bulk'),
     path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
+    path('leaderboard/me/', LeaderboardRankView.as_view(), name='leaderboard-rank'),
+    path('users/<str:username>/karma/', UserKarmaView.as_view(), name='user-karma'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Async-native read endpoints for ASGI deployments (see community/async_views.py)
+    path('async/posts/', async_views.post_list, name='async-post-list'),
+    path('async/posts/<int:pk>/', async_views.post_detail, name='async-post-detail'),
+    path('async/leaderboard/', async_views.leaderboard_view, name='async-leaderboard'),
+    path('posts/<int:pk>/events/', async_views.post_events, name='post-events'),
 ]
@@ -0,0 +1,135 @@
+"""
+User resolution for the username-based mock auth used by the write endpoints.
+
+Writes name their user with a `username` field in the body. Looking that up
+(and, when it is missing, falling back to the first user) used to cost one or
+two queries per write. Lookups are now kept in a small per-process LRU cache
+with a TTL: a cold username costs at most one query, a warm one none.
+
+User post_save / post_delete signals evict the affected entries in this
+process. Other processes only see a rename or deletion once
+USER_CACHE_SECONDS have passed. Misses are not cached: a user created in
+another process must be found right away, not have its writes go to the
+first user.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import User
+
+# Cache key of the fallback user (User.objects.first()); usernames are never None
+FIRST_USER = None
+
+_cache = OrderedDict()  # key -> (expires, (id, username))
+_lock = threading.Lock()
+
+
+def _get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        _cache.move_to_end(key)
+        return True, entry[1]
+
+
+def _set(key, value):
+    with _lock:
+        _cache[key] = (time.monotonic() + settings.USER_CACHE_SECONDS, value)
+        _cache.move_to_end(key)
+        while len(_cache) > settings.USER_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _lookup(key, queryset):
+    hit, value = _get(key)
+    if not hit:
+        value = queryset.values_list('id', 'username').first()
+        if value is None:
+            return None
+        _set(key, value)
+    # Only id and username are needed to write rows and render authors
+    return User(id=value[0], username=value[1])
+
+
+async def _alookup(key, queryset):
+    hit, value = _get(key)
+    if not hit:
+        value = await queryset.values_list('id', 'username').afirst()
+        if value is None:
+            return None
+        _set(key, value)
+    return User(id=value[0], username=value[1])
+
+
+def get_by_username(username):
+    return _lookup(username, User.objects.filter(username=username))
+
+
+async def aget_by_username(username):
+    return await _alookup(username, User.objects.filter(username=username))
+
+
+def get_first_user():
+    return _lookup(FIRST_USER, User.objects.order_by('pk'))
+
+
+def resolve(request):
+    """
+    The user a write acts as: the `username` in the body if it exists, else
+    the authenticated user, else (for the demo) the first user. None if there
+    are no users at all.
+    """
+    username = request.data.get('username')
+    if username:
+        user = get_by_username(username)
+        if user is not None:
+            return user
+    if request.user.is_authenticated:
+        return request.user
+    return get_first_user()
+
+
+def viewer(request):
+    """
+    The user a read is personalized for (`liked_by_me`): the `username` in
+    the query string if it exists, else the authenticated user. Unlike writes,
+    reads never fall back to the first user; anonymous reads get None.
+    """
+    username = request.query_params.get('username')
+    if username:
+        user = get_by_username(username)
+        if user is not None:
+            return user
+    if request.user.is_authenticated:
+        return request.user
+    return None
+
+
+async def aviewer(request):
+    """viewer() for async views; the session user comes from auser()."""
+    username = request.query_params.get('username')
+    if username:
+        user = await aget_by_username(username)
+        if user is not None:
+            return user
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    return None
+
+
+def evict(user):
+    """Drop every entry that may refer to `user`."""
+    with _lock:
+        for key, (_, value) in list(_cache.items()):
+            if key == user.username or key is FIRST_USER or (value and value[0] == user.pk):
+                del _cache[key]
+
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -1,122 +1,159 @@
-from rest_framework import viewsets, status, generics
+import re
+
+from rest_framework import viewsets, status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.db.models import Count, Sum, Case, When, IntegerField, F, Prefetch, OuterRef, Subquery, Value
-from django.db.models.functions import Coalesce
+from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from django.db.models import F, Prefetch
 from django.db import IntegrityError, transaction
-from django.utils import timezone
-from datetime import timedelta
-from django.contrib.contenttypes.models import ContentType
-
-from .models import Post, Comment, Like, User
-from .serializers import PostSerializer, PostDetailSerializer, CommentSerializer, LikeSerializer, LeaderboardSerializer
-
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().select_related('author').annotate(
-        likes_count=Count('likes')
-    ).order_by('-created_at')
-    
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.shortcuts import get_object_or_404
+
+from . import instrumentation, karma_engine, leaderboard, like_queue, liked, likes, post_cache, ranks, replicas, search, streaming, users
+from .models import Post, Comment, User
+from .pagination import CommentPagination, KeysetPagination, SearchPagination, ThreadPagination
+from .serializers import PostSerializer, PostDetailSerializer, CommentSerializer, CommentListSerializer, LikeSerializer, BulkLikeSerializer, LeaderboardSerializer, RankedUserSerializer, UserSerializer
+
+class PostViewSet(replicas.ReplicaRoutingMixin, liked.LikedByMeMixin, streaming.StreamingListMixin, viewsets.ModelViewSet):
+    # likes_count is a denormalized column, so no aggregate over likes here
+    queryset = Post.objects.all().select_related('author').order_by('-created_at', '-id')
+    pagination_class = KeysetPagination
+    replica_actions = ('list', 'retrieve', 'comments')
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return PostDetailSerializer
         return PostSerializer
 
     def perform_create(self, serializer):
-        # Mock Auth: Check for username in body
-        username = self.request.data.get('username')
-        if username:
-            user = User.objects.filter(username=username).first()
-            if user:
-                serializer.save(author=user)
-                return
-
-        # Fallback to authenticates user
-        if self.request.user.is_authenticated:
-            serializer.save(author=self.request.user)
-        else:
-             # Fallback for demo: use first user if available
-            first_user = User.objects.first()
-            if first_user:
-                serializer.save(author=first_user)
-            else:
-                raise IntegrityError("No user available for post creation")
+        # Mock Auth: username in body, then the authenticated user, then the first user
+        user = users.resolve(self.request)
+        if user is None:
+            raise IntegrityError("No user available for post creation")
+        serializer.save(author=user)
 
     def retrieve(self, request, *args, **kwargs):
+        # Rendered responses are cached per post version, which every write to
+        # the post, its comments or their likes bumps (see community/post_cache.py)
+        if not post_cache.is_enabled():
+            return self.build_detail_response(request)
+        try:
+            post_id = int(kwargs['pk'])
+        except ValueError:
+            return self.build_detail_response(request)
+        version = post_cache.get_version(post_id)
+        viewer = users.viewer(request)
+        headers = post_cache.response_headers(request, post_id, version, viewer)
+
+        not_modified = get_conditional_response(request, etag=headers['ETag'])
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        # Only the JSON rendering is cached, the browsable API is built every time
+        if request.accepted_renderer.format != 'json':
+            return self.build_detail_response(request, headers=headers)
+
+        content = post_cache.get_response(request, post_id, version, viewer)
+        if content is None:
+            # Stored under the current version, so it must not come from a
+            # replica that hasn't seen the write which bumped it
+            with replicas.primary():
+                response = self.build_detail_response(request)
+            content = request.accepted_renderer.render(
+                response.data, request.accepted_media_type, self.get_renderer_context()
+            )
+            post_cache.set_response(request, post_id, version, content, viewer)
+        return HttpResponse(content, content_type=request.accepted_media_type, headers=headers)
+
+    def build_detail_response(self, request, headers=None):
         instance = self.get_object()
         
-        comments = Comment.objects.filter(post=instance).select_related('author').annotate(
-            likes_count=Count('likes')
-        ).order_by('created_at')
-        
-        comment_map = {c.id: c for c in comments}
-        roots = []
-        
-        for comment in comments:
-            comment._replies = []
-            
-        for comment in comments:
-            if comment.parent_id:
-                parent = comment_map.get(comment.parent_id)
-                if parent:
-                    parent._replies.append(comment)
-            else:
-                roots.append(comment)
-                
-        instance._precomputed_comments = roots
+        # Only the first page of top-level comments, with replies down to
+        # ?depth=, is embedded. The rest is loaded from `comments_next` and
+        # each comment's `replies_next`.
+        paginator = ThreadPagination()
+        instance._precomputed_comments = paginator.paginate_thread(request, post_id=instance.id)
+        instance._comments_next = paginator.get_next_link(
+            request.build_absolute_uri(reverse('post-comments', kwargs={'pk': instance.id}))
+        )
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return Response(serializer.data, headers=headers)
+
+    @action(detail=True, methods=['get'])
+    def comments(self, request, pk=None):
+        """Page through a post's top-level comments (with their replies)."""
+        post = self.get_object()
+        paginator = ThreadPagination()
+        paginator.paginate_thread(request, post_id=post.id)
+        return paginator.get_paginated_response()
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
-    serializer_class = CommentSerializer
+class CommentViewSet(replicas.ReplicaRoutingMixin, liked.LikedByMeMixin, streaming.StreamingListMixin, viewsets.ModelViewSet):
+    """
+    Comments, listed flat and newest first (?ordering=oldest for the reverse),
+    optionally filtered by ?post=, ?author= and ?parent= ids. Each filter is
+    backed by a (column, created_at, id) index, so a page costs one range
+    scan, with its authors joined in, and one liked_by_me lookup.
+    """
+    queryset = Comment.objects.all().select_related('author')
+    pagination_class = CommentPagination
+    replica_actions = ('list', 'retrieve', 'replies')
+    filter_fields = ('post', 'author', 'parent')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CommentListSerializer
+        return CommentSerializer
+
+    def filter_queryset(self, queryset):
+        if self.action != 'list':
+            return queryset
+        filters = {}
+        for field in self.filter_fields:
+            value = self.request.query_params.get(field)
+            if value is None:
+                continue
+            if not re.fullmatch(r'[0-9]+', value):
+                raise ValidationError({field: "Must be an id."})
+            filters[f'{field}_id'] = int(value)
+        return queryset.filter(**filters)
+
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """Page through the direct replies to a comment (with their own replies)."""
+        comment = self.get_object()
+        paginator = ThreadPagination()
+        paginator.paginate_thread(request, post_id=comment.post_id, parent=comment)
+        return paginator.get_paginated_response()
 
     def perform_create(self, serializer):
-        # Mock Auth: Check for username in body
-        username = self.request.data.get('username')
-        if username:
-            user = User.objects.filter(username=username).first()
-            if user:
-                serializer.save(author=user)
-                return
-
-        # Fallback to authenticated user
-        if self.request.user.is_authenticated:
-            serializer.save(author=self.request.user)
-        else:
-             # Fallback for demo: use first user if available
-            first_user = User.objects.first()
-            if first_user:
-                serializer.save(author=first_user)
-            else:
-                raise IntegrityError("No user available for comment creation")
-
-class LikeViewSet(viewsets.ViewSet):
+        # Mock Auth: username in body, then the authenticated user, then the first user
+        user = users.resolve(self.request)
+        if user is None:
+            raise IntegrityError("No user available for comment creation")
+        serializer.save(author=user)
+
+class LikeViewSet(replicas.ReplicaRoutingMixin, viewsets.ViewSet):
     def create(self, request):
         serializer = LikeSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             # Mock Auth Logic
-            user = request.user
-            username = request.data.get('username')
-            if username:
-                found_user = User.objects.filter(username=username).first()
-                if found_user:
-                    user = found_user
-            
-            # If still anonymous (and not valid), serializer.save() might fail if we don't pass user
-            # But we modified serializer to look in validated_data
-            
-            # If user is anonymous and no username provided, we might want to default or fail.
-            if not user.is_authenticated:
-                 # Try default user for demo robustness
-                 user = User.objects.first()
-                 
+            user = users.resolve(request)
+
+            if like_queue.is_enabled():
+                return self.enqueue(serializer, user)
+
             try:
                 data = serializer.save(user=user)
-                Like.objects.create(
-                    user=data['user'],
-                    content_type=data['content_type'],
-                    object_id=data['object_id']
-                )
+                # Like signals bump likes_count and the karma ledger inside
+                # this same transaction
+                with transaction.atomic():
+                    data['like_model'].objects.create(user=data['user'], target_id=data['object_id'])
                 return Response({'status': 'liked'}, status=status.HTTP_201_CREATED)
             except IntegrityError:
                 return Response({'status': 'already liked'}, status=status.HTTP_200_OK)
@@ -124,39 +161,183 @@ class LikeViewSet(viewsets.ViewSet):
                  return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class LeaderboardView(generics.ListAPIView):
-    serializer_class = LeaderboardSerializer
-    
-    def get_queryset(self):
-        cutoff = timezone.now() - timedelta(hours=24)
-        
-        # Karma from Posts (5 points per like)
-        # Karma from Posts (5 points per like) using Subquery to avoid cross-product joins
-        # Simplified Subquery:
-        # We want to select Sum(likes) from Like joined with Post where Post.author = OuterRef.
-        
-        posts_karma_sq = Subquery(
-            Post.objects.filter(author=OuterRef('pk'))
-            .values('author')
-            .annotate(
-                s=Sum(
-                    Case(When(likes__created_at__gte=cutoff, then=5), default=0, output_field=IntegerField())
-                )
+    def enqueue(self, serializer, user):
+        # Queued ingestion: acknowledge now, like_queue.flush applies it later
+        if user is None:
+            return Response({'error': 'No user available'}, status=status.HTTP_400_BAD_REQUEST)
+        if like_queue.is_full():
+            return Response(
+                {'error': 'Too many pending likes, retry later'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(max(1, round(settings.LIKE_QUEUE_FLUSH_SECONDS)))},
             )
-            .values('s')
-        )
+        try:
+            data = serializer.save(user=user)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        like_queue.enqueue(data['user'].id, serializer.validated_data['type'], data['object_id'])
+        return Response({'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
 
-        comments_karma_sq = Subquery(
-            Comment.objects.filter(author=OuterRef('pk'))
-            .values('author')
-            .annotate(
-                s=Sum(
-                    Case(When(likes__created_at__gte=cutoff, then=1), default=0, output_field=IntegerField())
-                )
-            )
-            .values('s')
-        )
+    def bulk(self, request):
+        """
+        Like / unlike many posts and comments in one request.
+
+        Body: {"username": ..., "items": [{"type": "post", "id": 1, "action": "like"}, ...]}.
+        Repeated items for the same target are coalesced (the last one wins);
+        every item gets a status in `results`, in request order.
+        """
+        serializer = BulkLikeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Mock Auth Logic
+        user = users.resolve(request)
+        if user is None:
+            return Response({'error': 'No user available'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = serializer.validated_data['items']
+        keys = [(user.id, item['type'], item['id']) for item in items]
+        last_index = {key: index for index, key in enumerate(keys)}
+        outcomes = likes.apply_batch({key: items[index]['action'] for key, index in last_index.items()})
+
+        results = []
+        for index, (item, key) in enumerate(zip(items, keys)):
+            outcome = outcomes[key] if last_index[key] == index else 'superseded'
+            results.append({**item, 'status': outcome})
+        return Response({'results': results})
+
+class LeaderboardView(replicas.ReplicaRoutingMixin, generics.ListAPIView):
+    """
+    Top users by karma earned in a sliding window.
+
+    Query params: `window` (one of LEADERBOARD_WINDOWS, default 24h) and
+    `limit` (one of LEADERBOARD_LIMITS, default 5), plus `as_of` (an ISO
+    8601 datetime) for the leaderboard as it stood then. Responses come from
+    a cached snapshot and carry an ETag, so polling clients get 304s.
+    """
+    serializer_class = LeaderboardSerializer
+    replica_actions = ('get',)
+
+    def get_window(self):
+        return leaderboard.parse_window(self.request.query_params)
+
+    def get_limit(self):
+        return leaderboard.parse_limit(self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        # Karma is read from the hourly ledger (KARMA_POST_LIKE_POINTS per post
+        # like, KARMA_COMMENT_LIKE_POINTS per comment like), see community/karma.py
+        serialize = lambda users: self.get_serializer(users, many=True).data
+        as_of = leaderboard.parse_as_of(request.query_params)
+        if as_of is None:
+            snapshot = leaderboard.get_snapshot(self.get_window(), self.get_limit(), serialize)
+        else:
+            snapshot = leaderboard.get_historical_snapshot(self.get_window(), self.get_limit(), as_of, serialize)
+
+        headers = leaderboard.response_headers(snapshot)
+        not_modified = get_conditional_response(request, etag=snapshot['etag'])
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        return Response(leaderboard.response_data(snapshot), headers=headers)
+
+
+class LeaderboardRankView(replicas.ReplicaRoutingMixin, APIView):
+    """
+    The viewer's rank on the leaderboard of `window` (default 24h) and the
+    users up to `k` places above and below (default 5, at most
+    LEADERBOARD_MAX_NEIGHBOURS). The viewer is `?username=` or the logged-in
+    user; `rank` is null without karma in the window. Read from the rank
+    index of community/ranks.py, so it lags likes handled by other processes
+    by up to LEADERBOARD_RANK_SECONDS.
+    """
+    replica_actions = ('get',)
+
+    def get_k(self):
+        k = self.request.query_params.get('k', '5')
+        if not re.fullmatch(r'[0-9]+', k) or int(k) > settings.LEADERBOARD_MAX_NEIGHBOURS:
+            raise ValidationError({'k': f"Must be between 0 and {settings.LEADERBOARD_MAX_NEIGHBOURS}."})
+        return int(k)
+
+    def get(self, request):
+        window = leaderboard.parse_window(request.query_params)
+        k = self.get_k()
+        user = users.viewer(request)
+        if user is None:
+            raise ValidationError({'username': "Name a user, or log in."})
+        rank, neighbours = ranks.neighbourhood(user, window, k)
+        return Response({
+            'window': window,
+            'user': UserSerializer(user).data,
+            'rank': rank,
+            'score': user.score if rank is not None else 0,
+            'results': RankedUserSerializer(neighbours, many=True).data,
+        })
+
+
+class UserKarmaView(replicas.ReplicaRoutingMixin, APIView):
+    """
+    Karma a user earned in each of the last `weeks` weeks (default 12, at most
+    KARMA_HISTORY_MAX_WEEKS). Weeks start on Monday 00:00 UTC, the current
+    week comes last. Read from community/karma_engine.py, so it can lag
+    writes by up to KARMA_ENGINE_SECONDS.
+    """
+    replica_actions = ('get',)
+
+    def get_weeks(self):
+        weeks = self.request.query_params.get('weeks', '12')
+        if not re.fullmatch(r'[0-9]+', weeks) or not 1 <= int(weeks) <= settings.KARMA_HISTORY_MAX_WEEKS:
+            raise ValidationError({'weeks': f"Must be between 1 and {settings.KARMA_HISTORY_MAX_WEEKS}."})
+        return int(weeks)
+
+    def get(self, request, username):
+        user = get_object_or_404(User, username=username)
+        history = karma_engine.weekly_history(user.id, self.get_weeks())
+        return Response({
+            'user': UserSerializer(user).data,
+            'weeks': [{'start': start, 'karma': points} for start, points in history],
+        })
+
+
+class SearchView(replicas.ReplicaRoutingMixin, APIView):
+    """
+    Posts and comments containing every word of `q`, best match first (see
+    community/search.py). `type` (post or comment) restricts the results to
+    one kind. Keyset paginated like the feed: follow `next`.
+    """
+    replica_actions = ('get',)
+    result_serializers = {Post: PostSerializer, Comment: CommentListSerializer}
+
+    def get_kinds(self):
+        kind = self.request.query_params.get('type')
+        if kind is None:
+            return None
+        names = [model._meta.model_name for model in search.MODELS]
+        if kind not in names:
+            raise ValidationError({'type': f"Must be one of {', '.join(names)}."})
+        return [names.index(kind)]
+
+    def get(self, request):
+        words = search.terms(request.query_params.get('q', ''))
+        if not words:
+            raise ValidationError({'q': "Enter at least one word to search for."})
+        paginator = SearchPagination()
+        objects = search.load(paginator.paginate_search(request, words, self.get_kinds()))
+
+        # One liked_by_me lookup per kind of result
+        viewer = users.viewer(request)
+        for model in search.MODELS:
+            liked.mark(viewer, [obj for obj in objects if type(obj) is model])
+        return paginator.get_paginated_response([
+            {'type': obj._meta.model_name, **self.result_serializers[type(obj)](obj).data}
+            for obj in objects
+        ])
+
+
+class MetricsView(APIView):
+    """Per-endpoint query counts, timings and latency histograms of this process."""
+    permission_classes = [permissions.IsAdminUser]
 
-        return User.objects.annotate(
-            score=Coalesce(posts_karma_sq, Value(0)) + Coalesce(comments_karma_sq, Value(0))
-        ).filter(score__gt=0).order_by('-score')[:5]
+    def get(self, request):
+        return Response(instrumentation.snapshot())
@@ -0,0 +1,96 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise that can also run natively under ASGI.
+
+    The upstream middleware is sync-only, which makes Django run the rest of
+    the chain (async views included) through a thread for every request.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses JSON responses: with brotli when the client accepts it and the
+    brotli package is installed, with gzip otherwise.
+
+    Only the API's JSON is compressed. WhiteNoise serves static files already
+    compressed, and event streams must reach the client as they are written.
+    Streamed responses are compressed chunk by chunk, each flushed as it goes.
+    """
+    min_length = 200
+
+    def process_response(self, request, response):
+        if not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        accepts_brotli = re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is None or not accepts_brotli:
+            return super().process_response(request, response)
+
+        if response.has_header('Content-Encoding') or (not response.streaming and len(response.content) < self.min_length):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming:
+            response.streaming_content = self.compress_stream(response)
+            del response.headers['Content-Length']
+        else:
+            compressed = brotli.compress(response.content, quality=settings.API_BROTLI_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    def compress_stream(self, response):
+        content = response.streaming_content
+        compressor = brotli.Compressor(quality=settings.API_BROTLI_QUALITY)
+        if response.is_async:
+            async def compressed():
+                async for chunk in content:
+                    yield compressor.process(chunk) + compressor.flush()
+                yield compressor.finish()
+        else:
+            def compressed():
+                for chunk in content:
+                    yield compressor.process(chunk) + compressor.flush()
+                yield compressor.finish()
+        return compressed()
@@ -52,8 +52,10 @@ AUTH_USER_MODEL = 'community.User'
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'community.instrumentation.RequestMetricsMiddleware',
+    'playto.middleware.CompressionMiddleware',  # brotli / gzip for API responses
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'playto.middleware.WhiteNoiseMiddleware',  # async-capable WhiteNoise
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,13 +87,59 @@ WSGI_APPLICATION = 'playto.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Postgres connections are pooled in-process when DATABASE_POOL_MAX_SIZE is set
+# (needs psycopg[pool]); otherwise each thread keeps a persistent connection.
+DATABASE_POOL_MIN_SIZE = int(os.getenv('DATABASE_POOL_MIN_SIZE', '2'))
+DATABASE_POOL_MAX_SIZE = int(os.getenv('DATABASE_POOL_MAX_SIZE', '0'))
+
+
+def database_config(url):
+    config = dj_database_url.parse(url, conn_max_age=600, conn_health_checks=True)
+    if DATABASE_POOL_MAX_SIZE and config['ENGINE'] == 'django.db.backends.postgresql':
+        # Pooled connections go back to the pool after each request instead
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {'min_size': DATABASE_POOL_MIN_SIZE, 'max_size': DATABASE_POOL_MAX_SIZE}
+    return config
+
+
 DATABASES = {
-    'default': dj_database_url.config(
-        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600
-    )
+    'default': database_config(os.getenv('DATABASE_URL', f"sqlite:///{BASE_DIR / 'db.sqlite3'}")),
 }
 
+# Read replicas, as comma-separated URLs; they become the aliases replica1,
+# replica2, ... Safe list/detail reads go to them (see community/replicas.py).
+DATABASE_REPLICAS = []
+for index, url in enumerate(u for u in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if u):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = database_config(url)
+    # Tests read the test database through the replica aliases
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['community.replicas.ReplicaRouter']
+# After a write, the client reads from the primary this long (replication lag)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+# SameSite of the pin cookie: None (sent with Secure) lets a frontend on another
+# site send it back; Lax is enough when both are on localhost
+REPLICA_PIN_SAMESITE = os.getenv('REPLICA_PIN_SAMESITE', 'Lax' if DEBUG else 'None')
+# An unreachable replica is skipped this long before being tried again
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
+
+# Cache shared by every process, e.g. redis://localhost:6379/0 (needs the redis
+# package) or memcached://localhost:11211 (needs pymemcache). Without one each
+# process has its own memory cache.
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+    }}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -134,4 +182,113 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [o for o in os.getenv('CORS_ALLOWED_ORIGINS', '').split(',') if o]
 CSRF_TRUSTED_ORIGINS = [o for o in os.getenv('CORS_ALLOWED_ORIGINS', '').split(',') if o]
+# The frontend sends cookies (the replica pin, see community/replicas.py)
+CORS_ALLOW_CREDENTIALS = True
 ALLOWED_HOSTS = [h for h in os.getenv('ALLOWED_HOSTS', '').split(',') if h] or ['*']
+
+# API rendering (see community/renderers.py). The default renderer uses orjson when
+# it is installed, and matches DRF's JSONRenderer byte for byte.
+API_JSON_RENDERER = os.getenv('API_JSON_RENDERER', 'community.renderers.FastJSONRenderer')
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [API_JSON_RENDERER, 'rest_framework.renderers.BrowsableAPIRenderer'],
+}
+# List endpoints stream ?stream=true responses this many rows at a time (see
+# community/streaming.py)
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '500'))
+# JSON responses are compressed with brotli (when the brotli package is installed
+# and the client accepts it) or gzip, see playto/middleware.py
+API_BROTLI_QUALITY = int(os.getenv('API_BROTLI_QUALITY', '4'))
+
+# Karma per like received (see community/karma.py). The karma ledger stores
+# points, so run `manage.py rebuild_karma` after changing them.
+KARMA_POST_LIKE_POINTS = int(os.getenv('KARMA_POST_LIKE_POINTS', '5'))
+KARMA_COMMENT_LIKE_POINTS = int(os.getenv('KARMA_COMMENT_LIKE_POINTS', '1'))
+# The karma engine (historical leaderboards and karma history, see
+# community/karma_engine.py) reloads the like history after this long
+KARMA_ENGINE_SECONDS = int(os.getenv('KARMA_ENGINE_SECONDS', '300'))
+KARMA_HISTORY_MAX_WEEKS = int(os.getenv('KARMA_HISTORY_MAX_WEEKS', '104'))
+
+# Leaderboard snapshots
+# Each (window, limit) pair is recomputed at most once per interval and served from the cache
+LEADERBOARD_WINDOWS = {'1h': 1, '24h': 24, '7d': 24 * 7}  # hours
+LEADERBOARD_LIMITS = [5, 50, 100]
+LEADERBOARD_SNAPSHOT_SECONDS = int(os.getenv('LEADERBOARD_SNAPSHOT_SECONDS', '60'))
+# "My rank" (/api/leaderboard/me/, see community/ranks.py): each process ranks the
+# users of a window in memory, rebuilt from the karma ledger this often
+LEADERBOARD_RANK_SECONDS = int(os.getenv('LEADERBOARD_RANK_SECONDS', '60'))
+LEADERBOARD_MAX_NEIGHBOURS = int(os.getenv('LEADERBOARD_MAX_NEIGHBOURS', '25'))
+
+# Feed pagination (keyset, see community/pagination.py)
+FEED_PAGE_SIZE = int(os.getenv('FEED_PAGE_SIZE', '20'))
+FEED_MAX_PAGE_SIZE = int(os.getenv('FEED_MAX_PAGE_SIZE', '100'))
+
+# Hot feed (?ordering=hot, see community/hot.py): engagement weights, and the age
+# over which a post needs e times the engagement to keep its rank
+HOT_LIKE_WEIGHT = float(os.getenv('HOT_LIKE_WEIGHT', '1'))
+HOT_COMMENT_WEIGHT = float(os.getenv('HOT_COMMENT_WEIGHT', '2'))
+HOT_TIMESCALE_SECONDS = int(os.getenv('HOT_TIMESCALE_SECONDS', str(12 * 3600)))
+
+# Comment threads: top-level comments are paginated, replies are loaded down to a depth limit
+THREAD_PAGE_SIZE = int(os.getenv('THREAD_PAGE_SIZE', '20'))
+THREAD_MAX_PAGE_SIZE = int(os.getenv('THREAD_MAX_PAGE_SIZE', '100'))
+THREAD_DEPTH = int(os.getenv('THREAD_DEPTH', '3'))
+THREAD_MAX_DEPTH = int(os.getenv('THREAD_MAX_DEPTH', '10'))
+THREAD_REPLIES_PER_COMMENT = int(os.getenv('THREAD_REPLIES_PER_COMMENT', '10'))
+
+# Full-text search (/api/search/, see community/search.py). Words beyond
+# SEARCH_MAX_TERMS are ignored.
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', '100'))
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', '8'))
+
+# Post detail responses are cached per post version (see community/post_cache.py).
+# Versions must be seen by every process, so this needs a shared CACHE_URL and is
+# off without one.
+POST_DETAIL_CACHE = os.getenv('POST_DETAIL_CACHE', 'True' if CACHE_URL else 'False') == 'True'
+POST_DETAIL_CACHE_SECONDS = int(os.getenv('POST_DETAIL_CACHE_SECONDS', '300'))
+# Browsers and proxies may reuse a response this long before revalidating with its ETag
+POST_DETAIL_MAX_AGE = int(os.getenv('POST_DETAIL_MAX_AGE', '0'))
+
+# Maximum number of operations accepted by /api/likes/bulk/
+LIKES_BULK_MAX_ITEMS = int(os.getenv('LIKES_BULK_MAX_ITEMS', '500'))
+
+# Like ingestion: 'sync' applies each like in its request, 'queued' appends it to
+# a pending table drained in batches by `manage.py flush_likes --loop`
+LIKE_INGESTION_MODE = os.getenv('LIKE_INGESTION_MODE', 'sync')
+LIKE_QUEUE_FLUSH_SECONDS = float(os.getenv('LIKE_QUEUE_FLUSH_SECONDS', '1'))
+LIKE_QUEUE_BATCH_SIZE = int(os.getenv('LIKE_QUEUE_BATCH_SIZE', '1000'))
+# Requests get 503 + Retry-After once this many likes are waiting
+LIKE_QUEUE_MAX_PENDING = int(os.getenv('LIKE_QUEUE_MAX_PENDING', '100000'))
+
+# Username -> user lookups of the mock auth, cached per process (see community/users.py)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_SECONDS = int(os.getenv('USER_CACHE_SECONDS', '300'))
+
+# Maximum SQL queries per request, by URL name (see community/instrumentation.py).
+# Exceeding a budget logs a warning, or raises with QUERY_BUDGET_MODE = 'raise'.
+# Personalized reads include up to 2 queries to find the viewer (a ?username= not
+# in the user cache: 1; a session login: the session and its user) and one
+# liked_by_me lookup per kind of object on the page.
+QUERY_BUDGETS = {
+    'post-list': 4,        # feed page + viewer + their likes on it; creating a post
+    'post-detail': 6,      # post + its comment thread + viewer + their post and comment likes, 0 when cached
+    'post-comments': 5,    # post + thread page + viewer + their comment likes
+    'comment-replies': 5,  # comment + thread page + viewer + their comment likes
+    'comment-list': 7,     # comment page + viewer + their likes on it; creating a comment or reply
+    'like-create': 12,     # target lookup, insert, counter, karma and cache updates
+    'leaderboard': 5,      # when the snapshot is rebuilt, 0 otherwise
+    'leaderboard-rank': 6, # viewer + 3 when the rank index is rebuilt + the neighbours
+    'search': 7,           # hits, their posts and comments, viewer + their likes on each kind
+    'async-post-list': 4,
+    'async-post-detail': 6,
+    'async-leaderboard': 5,
+}
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'log')
+
+# Live post events (see community/events.py). The in-process broker only reaches
+# clients connected to the same process.
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'community.events.InProcessBroker')
+EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+EVENTS_RETRY_MS = int(os.getenv('EVENTS_RETRY_MS', '3000'))
+# Events buffered per subscriber before the oldest are dropped
+EVENTS_MAX_PENDING = int(os.getenv('EVENTS_MAX_PENDING', '100'))
@@ -2,6 +2,8 @@ import axios from "axios";
 
 const client = axios.create({
   baseURL: import.meta.env.VITE_API_URL,
+  // Carries the cookie that keeps a client on the primary database after its writes
+  withCredentials: true,
   headers: {
     "Content-Type": "application/json",
   },
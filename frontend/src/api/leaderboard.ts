@@ -5,7 +5,14 @@ export interface LeaderboardEntry extends User {
   score: number;
 }
 
+export interface LeaderboardSnapshot {
+  window: string;
+  limit: number;
+  generated_at: string;
+  results: LeaderboardEntry[];
+}
+
 export const getLeaderboard = async () => {
-  const { data } = await client.get<LeaderboardEntry[]>("/leaderboard/");
-  return data;
+  const { data } = await client.get<LeaderboardSnapshot>("/leaderboard/");
+  return data.results;
 };
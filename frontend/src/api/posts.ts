@@ -11,7 +11,10 @@ export interface Comment {
   content: string;
   created_at: string;
   likes_count: number;
+  liked_by_me: boolean;
+  reply_count: number;
   replies: Comment[];
+  replies_next: string | null;
 }
 
 export interface Post {
@@ -20,16 +23,30 @@ export interface Post {
   content: string;
   created_at: string;
   likes_count: number;
+  liked_by_me: boolean;
   comments?: Comment[];
+  comments_next?: string | null;
 }
 
-export const getPosts = async () => {
-  const { data } = await client.get<Post[]>("/posts/");
+export interface Page<T> {
+  next: string | null;
+  results: T[];
+}
+
+// `username` personalizes liked_by_me
+export const getPosts = async (username?: string) => {
+  const { data } = await client.get<Page<Post>>("/posts/", { params: { username } });
+  return data;
+};
+
+// Follows a `next` link (absolute, and already carrying the cursor and username)
+export const getPage = async <T>(url: string) => {
+  const { data } = await client.get<Page<T>>(url);
   return data;
 };
 
-export const getPost = async (id: string) => {
-  const { data } = await client.get<Post>(`/posts/${id}/`);
+export const getPost = async (id: string, username?: string) => {
+  const { data } = await client.get<Post>(`/posts/${id}/`, { params: { username } });
   return data;
 };
 
@@ -61,3 +78,21 @@ export const createComment = async (
   });
   return data;
 };
+
+export type PostEvent =
+  | { type: "likes"; target: "post" | "comment"; id: number; delta: number }
+  | { type: "comment"; parent: number | null; comment: Comment };
+
+// Base URL of an ASGI deployment of the API, which serves the live event
+// streams; without one, post pages don't subscribe
+const eventsURL = import.meta.env.VITE_EVENTS_URL;
+
+// Live like count changes and new comments of a post; returns the unsubscribe
+export const subscribeToPost = (id: number, onEvent: (event: PostEvent) => void) => {
+  if (!eventsURL) return () => {};
+  const source = new EventSource(`${eventsURL}/posts/${id}/events/`);
+  const handler = (message: MessageEvent) => onEvent(JSON.parse(message.data));
+  source.addEventListener("likes", handler);
+  source.addEventListener("comment", handler);
+  return () => source.close();
+};
@@ -13,9 +13,12 @@ import { CreateCommentForm } from "./CreateCommentForm";
 interface CommentNodeProps {
   comment: Comment;
   postId: number;
+  // Follows a `replies_next` link and merges the page under `parent`
+  onLoadMore?: (url: string, parent: number) => void;
+  loadingMore?: boolean;
 }
 
-export function CommentNode({ comment, postId }: CommentNodeProps) {
+export function CommentNode({ comment, postId, onLoadMore, loadingMore }: CommentNodeProps) {
   const queryClient = useQueryClient();
   const { user } = useAuth();
   const [isExpanded, setIsExpanded] = useState(true);
@@ -61,7 +64,7 @@ export function CommentNode({ comment, postId }: CommentNodeProps) {
                 className="h-6 w-6 text-muted-foreground hover:text-red-500 hover:bg-red-50 dark:hover:bg-red-950/30"
             >
                <motion.div whileTap={{ scale: 0.8 }}>
-                    <Heart className={cn("h-3.5 w-3.5", comment.likes_count > 0 ? "fill-current text-red-500" : "")} />
+                    <Heart className={cn("h-3.5 w-3.5", comment.liked_by_me ? "fill-current text-red-500" : "")} />
                </motion.div>
             </Button>
             {comment.likes_count > 0 && (
@@ -87,6 +90,18 @@ export function CommentNode({ comment, postId }: CommentNodeProps) {
                     {isExpanded ? "Collapse" : `Show ${comment.replies.length} replies`}
                  </Button>
             )}
+
+            {comment.replies_next && onLoadMore && (isExpanded || comment.replies.length === 0) && (
+                 <Button
+                    variant="ghost"
+                    size="sm"
+                    className="h-6 text-xs text-muted-foreground hover:text-primary"
+                    disabled={loadingMore}
+                    onClick={() => onLoadMore(comment.replies_next!, comment.id)}
+                >
+                    {`More replies (${comment.reply_count - comment.replies.length})`}
+                 </Button>
+            )}
         </div>
 
         <AnimatePresence>
@@ -119,7 +134,13 @@ export function CommentNode({ comment, postId }: CommentNodeProps) {
                     {/* Actually better structure for reddit style lines: Use nested div with padding */}
                     <div className="space-y-4">
                         {comment.replies.map((reply) => (
-                            <CommentNode key={reply.id} comment={reply} postId={postId} />
+                            <CommentNode
+                                key={reply.id}
+                                comment={reply}
+                                postId={postId}
+                                onLoadMore={onLoadMore}
+                                loadingMore={loadingMore}
+                            />
                         ))}
                     </div>
                 </motion.div>
@@ -133,13 +154,17 @@ export function CommentNode({ comment, postId }: CommentNodeProps) {
 interface CommentListProps {
     comments?: Comment[];
     postId: number;
+    onLoadMore?: (url: string, parent: number) => void;
+    loadingMore?: boolean;
 }
 
-export function CommentList({ comments, postId }: CommentListProps) {
+export function CommentList({ comments, postId, onLoadMore, loadingMore }: CommentListProps) {
     if (!comments || comments.length === 0) return null;
     return (
         <div className="space-y-6">
-            {comments.map(c => <CommentNode key={c.id} comment={c} postId={postId} />)}
+            {comments.map(c => (
+                <CommentNode key={c.id} comment={c} postId={postId} onLoadMore={onLoadMore} loadingMore={loadingMore} />
+            ))}
         </div>
     )
 }
@@ -1,11 +1,11 @@
 import { Link } from "react-router-dom";
 import { formatDistanceToNow } from "date-fns";
 import { MessageSquare, Heart } from "lucide-react";
-import { type Post, likePost } from "@/api/posts";
+import { type Page, type Post, likePost } from "@/api/posts";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardFooter, CardHeader } from "@/components/ui/card";
 import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar";
-import { useMutation, useQueryClient } from "@tanstack/react-query";
+import { type InfiniteData, useMutation, useQueryClient } from "@tanstack/react-query";
 import { cn } from "@/lib/utils";
 import { motion, AnimatePresence } from "framer-motion";
 import { useAuth } from "@/hooks/useAuth";
@@ -24,19 +24,26 @@ export function PostCard({ post, showCommentsLink = true }: PostCardProps) {
     onMutate: async () => {
       // Optimistic update
       await queryClient.cancelQueries({ queryKey: ["posts"] });
-      const previousPosts = queryClient.getQueryData<Post[]>(["posts"]);
+      const previousPosts = queryClient.getQueryData<InfiniteData<Page<Post>>>(["posts"]);
 
-      queryClient.setQueryData<Post[]>(["posts"], (old) => {
-        if (!old) return [];
-        return old.map((p) =>
-          p.id === post.id ? { ...p, likes_count: p.likes_count + 1 } : p
-        );
+      // The feed is cached as the pages loaded so far
+      queryClient.setQueryData<InfiniteData<Page<Post>>>(["posts"], (old) => {
+        if (!old) return old;
+        return {
+          ...old,
+          pages: old.pages.map((page) => ({
+            ...page,
+            results: page.results.map((p) =>
+              p.id === post.id ? { ...p, likes_count: p.likes_count + 1, liked_by_me: true } : p
+            ),
+          })),
+        };
       });
       
       // Also update single post cache if it exists
       queryClient.setQueryData<Post>(["post", String(post.id)], (old) => {
           if (!old) return undefined;
-          return { ...old, likes_count: old.likes_count + 1 };
+          return { ...old, likes_count: old.likes_count + 1, liked_by_me: true };
       })
 
       return { previousPosts };
@@ -81,7 +88,7 @@ export function PostCard({ post, showCommentsLink = true }: PostCardProps) {
             className={cn("text-muted-foreground gap-1.5 hover:text-red-500 hover:bg-red-50 dark:hover:bg-red-950/30 group transition-all", likeMutation.isPending && "opacity-70")}
         >
             <motion.div whileTap={{ scale: 0.8 }} transition={{ type: "spring", stiffness: 400, damping: 10 }}>
-                <Heart className={cn("h-4 w-4 group-hover:fill-current", post.likes_count > 0 ? "fill-current text-red-500" : "")} />
+                <Heart className={cn("h-4 w-4 group-hover:fill-current", post.liked_by_me ? "fill-current text-red-500" : "")} />
             </motion.div>
             <AnimatePresence mode="popLayout">
                 <motion.span
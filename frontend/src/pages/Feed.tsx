@@ -1,14 +1,21 @@
-import { useQuery } from "@tanstack/react-query";
-import { getPosts } from "@/api/posts";
+import { useInfiniteQuery } from "@tanstack/react-query";
+import { type Post, getPage, getPosts } from "@/api/posts";
+import { Button } from "@/components/ui/button";
 import { PostCard } from "@/components/PostCard";
 import { LeaderboardWidget } from "@/components/LeaderboardWidget";
 import { CreatePostForm } from "@/components/CreatePostForm";
+import { useAuth } from "@/hooks/useAuth";
 
 export function Feed() {
-  const { data: posts, isLoading, error } = useQuery({
+  const { user } = useAuth();
+  // Pages of the feed, each fetched from the previous page's `next` link
+  const { data, isLoading, error, hasNextPage, fetchNextPage, isFetchingNextPage } = useInfiniteQuery({
     queryKey: ["posts"],
-    queryFn: getPosts,
+    queryFn: ({ pageParam }) => (pageParam ? getPage<Post>(pageParam) : getPosts(user?.username)),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.next,
   });
+  const posts = data?.pages.flatMap((page) => page.results);
 
   return (
     <div className="container max-w-screen-md mx-auto py-8 px-4 grid grid-cols-1 md:grid-cols-3 gap-8">
@@ -35,6 +42,14 @@ export function Feed() {
           <PostCard key={post.id} post={post} />
         ))}
         
+        {hasNextPage && (
+            <div className="flex justify-center">
+                <Button variant="outline" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                    {isFetchingNextPage ? "Loading..." : "Load more posts"}
+                </Button>
+            </div>
+        )}
+
         {posts?.length === 0 && (
             <div className="text-center py-12 text-muted-foreground">
                 No posts yet. Be the first to say something!
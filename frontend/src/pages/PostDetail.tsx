@@ -1,22 +1,98 @@
 import { useParams, Link } from "react-router-dom";
-import { useQuery } from "@tanstack/react-query";
-import { getPost } from "@/api/posts";
+import { useEffect } from "react";
+import { useMutation, useQuery, useQueryClient } from "@tanstack/react-query";
+import { getPage, getPost, subscribeToPost, type Comment, type Page, type Post, type PostEvent } from "@/api/posts";
 import { PostCard } from "@/components/PostCard";
 import { CommentList } from "@/components/CommentList";
 import { LeaderboardWidget } from "@/components/LeaderboardWidget";
 import { CreateCommentForm } from "@/components/CreateCommentForm";
 import { ArrowLeft } from "lucide-react";
 import { Button } from "@/components/ui/button";
+import { useAuth } from "@/hooks/useAuth";
+
+// Applies a live event to the loaded comment tree
+function applyToComments(comments: Comment[], event: PostEvent): Comment[] {
+  return comments.map((comment) => {
+    let updated = comment;
+    if (event.type === "likes" && event.target === "comment" && comment.id === event.id) {
+      updated = { ...updated, likes_count: updated.likes_count + event.delta };
+    }
+    if (event.type === "comment" && comment.id === event.parent) {
+      const loaded = updated.replies.some((reply) => reply.id === event.comment.id);
+      // Replies are in creation order; a cut-off list gets the new one with its next page
+      const append = !loaded && !updated.replies_next;
+      updated = {
+        ...updated,
+        reply_count: updated.reply_count + (loaded ? 0 : 1),
+        replies: append ? [...updated.replies, event.comment] : updated.replies,
+      };
+    }
+    if (updated.replies.length) {
+      updated = { ...updated, replies: applyToComments(updated.replies, event) };
+    }
+    return updated;
+  });
+}
+
+function applyEvent(post: Post, event: PostEvent): Post {
+  if (event.type === "likes" && event.target === "post") {
+    return { ...post, likes_count: post.likes_count + event.delta };
+  }
+  const comments = post.comments ?? [];
+  if (event.type === "comment" && event.parent === null) {
+    if (post.comments_next || comments.some((comment) => comment.id === event.comment.id)) return post;
+    return { ...post, comments: [...comments, event.comment] };
+  }
+  return { ...post, comments: applyToComments(comments, event) };
+}
+
+// Appends a fetched page, skipping comments a live event already added
+function appendPage(comments: Comment[], page: Page<Comment>): Comment[] {
+  const loaded = new Set(comments.map((comment) => comment.id));
+  return [...comments, ...page.results.filter((comment) => !loaded.has(comment.id))];
+}
+
+// Merges a `comments_next` (parent null) or `replies_next` page into the tree
+function mergePage(post: Post, parent: number | null, page: Page<Comment>): Post {
+  if (parent === null) {
+    return { ...post, comments: appendPage(post.comments ?? [], page), comments_next: page.next };
+  }
+  const merge = (comments: Comment[]): Comment[] =>
+    comments.map((comment) =>
+      comment.id === parent
+        ? { ...comment, replies: appendPage(comment.replies, page), replies_next: page.next }
+        : comment.replies.length
+          ? { ...comment, replies: merge(comment.replies) }
+          : comment
+    );
+  return { ...post, comments: merge(post.comments ?? []) };
+}
 
 export function PostDetail() {
   const { id } = useParams<{ id: string }>();
-  
+  const { user } = useAuth();
+
   const { data: post, isLoading, error } = useQuery({
     queryKey: ["post", id],
-    queryFn: () => getPost(id!),
+    queryFn: () => getPost(id!, user?.username),
     enabled: !!id,
   });
 
+  const queryClient = useQueryClient();
+  useEffect(() => {
+    if (!id) return;
+    return subscribeToPost(Number(id), (event) => {
+      queryClient.setQueryData<Post>(["post", id], (old) => old && applyEvent(old, event));
+    });
+  }, [id, queryClient]);
+
+  const loadMore = useMutation({
+    mutationFn: ({ url }: { url: string; parent: number | null }) => getPage<Comment>(url),
+    onSuccess: (page, { parent }) => {
+      queryClient.setQueryData<Post>(["post", id], (old) => old && mergePage(old, parent, page));
+    },
+  });
+
   if (isLoading) return <div className="container max-w-screen-md mx-auto py-12 px-4 animate-pulse">Loading...</div>;
   if (error || !post) return <div className="container py-12 px-4 text-destructive">Post not found.</div>;
 
@@ -42,7 +118,23 @@ export function PostDetail() {
 
             <CreateCommentForm postId={post.id} className="mb-8" />
             
-            <CommentList comments={post.comments} postId={post.id} />
+            <CommentList
+                comments={post.comments}
+                postId={post.id}
+                onLoadMore={(url, parent) => loadMore.mutate({ url, parent })}
+                loadingMore={loadMore.isPending}
+            />
+
+            {post.comments_next && (
+                <Button
+                    variant="outline"
+                    className="w-full mt-6"
+                    disabled={loadMore.isPending}
+                    onClick={() => loadMore.mutate({ url: post.comments_next!, parent: null })}
+                >
+                    Load more comments
+                </Button>
+            )}
         </div>
       </div>
 